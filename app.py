@@ -1,24 +1,55 @@
 # app.py
 # Dashboard Interactivo de Finanzas Personales (estructura base con tabs)
 
-from dash import Dash, dcc, html, Input, Output, State
+from dash import Dash, dcc, html, dash_table, Input, Output, State
 import dash  # para usar dash.no_update
 import pandas as pd
 import io
 import base64
 import plotly.graph_objects as go
 import plotly.express as px
-from sklearn.ensemble import IsolationForest
 import plotly.io as pio
 import os
 
+from utils.jobs import background_manager
+from utils.figuras import registrar_ruta_plantillas
+from utils.geometria import registrar_ruta_geometria
+from utils.metricas import instrumentar_callbacks, registrar_ruta_metricas
+from utils.sesiones import registrar_sesiones
+from utils.subida import registrar_ruta_subida
+
+# Pestaña con las métricas de los callbacks (las de /metrics, en el dashboard)
+PANEL_RENDIMIENTO = os.environ.get("PANEL_RENDIMIENTO", "0") == "1"
+
 
 # 1. Crear la aplicación Dash
-app = Dash(__name__, suppress_callback_exceptions=True)
+# Los callbacks lentos (modelos de ML) se ejecutan en segundo plano
+app = Dash(
+    __name__,
+    suppress_callback_exceptions=True,
+    background_callback_manager=background_manager,
+    # Plantillas de las figuras: las respuestas solo llevan su nombre (utils/figuras.py)
+    external_scripts=["plantillas.js"],
+)
 
 # Necesario para despliegue (Render, etc.)
 server = app.server
 
+# Ruta para subir ficheros grandes en streaming (ver assets/subida.js)
+registrar_ruta_subida(server)
+
+# Métricas de los callbacks en formato Prometheus
+registrar_ruta_metricas(server)
+
+# Sesión por navegador y presupuesto de memoria compartido (ver utils/sesiones.py)
+registrar_sesiones(server)
+
+# Plantillas de las figuras para el navegador (ver assets/figuras.js)
+registrar_ruta_plantillas(server)
+
+# Geometría de los mapas desde assets/topojson/, sin depender de la CDN (ver utils/geometria.py)
+registrar_ruta_geometria(server)
+
 forest_dark_theme = {
     "layout": {
         "paper_bgcolor": "#0f2a24",     # fondo fuera del gráfico
@@ -57,6 +88,9 @@ forest_dark_theme = {
 pio.templates["forest_dark"] = forest_dark_theme
 pio.templates.default = "forest_dark"
 
+# orjson: serializa las respuestas de los callbacks bastante más rápido que json
+pio.json.config.default_engine = "orjson"
+
 
 # 2. Definir el layout (estructura visual)
 app.layout = html.Div(
@@ -65,11 +99,23 @@ app.layout = html.Div(
         html.H1("Dashboard de Finanzas Personales", style={"textAlign": "center"}),
 
         # === ZONA DE SUBIDA DE ARCHIVO ===
+        # Reemplazar el dataset actual o añadir el archivo al histórico ya cargado
+        dcc.RadioItems(
+            id="modo-carga",
+            options=[
+                {"label": "Reemplazar datos", "value": "reemplazar"},
+                {"label": "Añadir al histórico", "value": "anadir"},
+            ],
+            value="reemplazar",
+            inline=True,
+            style={"textAlign": "center", "marginTop": "10px"},
+        ),
+
         dcc.Upload(
             id="upload-data",
             children=html.Div([
                 "Arrastra y suelta tu archivo aquí o ",
-                html.A("haz clic para seleccionarlo (CSV o Excel)")
+                html.A("haz clic para seleccionarlo (CSV, Excel o ZIP; puedes elegir varios)")
             ]),
             style={
                 "width": "80%",
@@ -80,18 +126,32 @@ app.layout = html.Div(
                 "borderRadius": "10px",
                 "textAlign": "center",
             },
-            multiple=False  # solo un archivo
+            multiple=True  # varios archivos se cargan como un solo lote
         ),
 
+        # === SUBIDA DE FICHEROS GRANDES (streaming, sin base64) ===
+        html.Div([
+            html.Button("Subir archivo grande", id="subida-boton"),
+            html.Progress(id="subida-progreso", value="0", max="1",
+                          style={"visibility": "hidden", "width": "300px", "marginLeft": "10px"}),
+            html.Span(id="subida-estado", style={"marginLeft": "10px"}),
+            dcc.Store(id="subida-resultado"),
+            # Solo activo mientras hay una subida en curso (callbacks/upload.py)
+            dcc.Interval(id="subida-intervalo", interval=500, disabled=True),
+        ], style={"textAlign": "center", "marginBottom": "10px"}),
+
         # Aquí mostraremos un mensaje sobre el archivo cargado
         html.Div(
             id="upload-status",
             style={"textAlign": "center", "marginBottom": "20px"}
         ),
 
-        # Almacen interno para guardar el DataFrame como JSON
+        # Almacen interno: guarda el ID del dataset (el DataFrame vive en el servidor)
         dcc.Store(id="Data"),
 
+        # Pestañas ya renderizadas con el dataset actual (evaluación perezosa)
+        dcc.Store(id="tabs-renderizadas"),
+
         # === TABS PRINCIPALES ===
         dcc.Tabs(
             id="tabs-principales",
@@ -148,8 +208,31 @@ app.layout = html.Div(
                             ),
                         ], style={"marginBottom": "20px"}),
 
-                        html.Div(id="grafico-mensual-linea", style={"marginTop": "40px"}),
-                        html.Div(id="grafico-mensual-barras", style={"marginTop": "40px"}),
+                        html.Div(id="mensual-mensaje", style={"marginTop": "40px"}),
+
+                        # Gráficos persistentes: los filtros solo actualizan sus datos (dash.Patch)
+                        html.Div([
+                            dcc.Graph(id="grafico-mensual-linea", style={"marginTop": "40px"}),
+                            dcc.Graph(id="grafico-mensual-barras", style={"marginTop": "40px"}),
+                        ], id="mensual-graficos", style={"display": "none"}),
+
+                        # ID del dataset con el que se dibujaron las figuras completas
+                        dcc.Store(id="mensual-dibujado"),
+
+                        # Saldo acumulado diario o por transacción: la serie se diezma en el
+                        # servidor y el zoom vuelve a pedir la ventana visible (utils/series.py)
+                        html.H4("Evolución del saldo", style={"marginTop": "40px"}),
+                        dcc.RadioItems(
+                            id="serie-granularidad",
+                            options=[
+                                {"label": "Diaria", "value": "dia"},
+                                {"label": "Por transacción", "value": "transaccion"},
+                            ],
+                            value="dia",
+                            inline=True,
+                        ),
+                        html.Div(id="serie-mensaje"),
+                        dcc.Graph(id="grafico-serie", style={"display": "none"}),
                     ], style={"padding": "20px"})
                 ]),
 
@@ -165,8 +248,10 @@ app.layout = html.Div(
                             style={"width": "50%", "marginBottom": "20px"}
                         ),
 
-                        # gráfico
-                        html.Div(id="grafico-institucion", style={"marginTop": "30px"}),
+                        # gráfico (persistente: cambiar de institución solo actualiza sus datos)
+                        html.Div(id="institucion-mensaje", style={"marginTop": "30px"}),
+                        dcc.Graph(id="grafico-institucion", style={"display": "none"}),
+                        dcc.Store(id="institucion-dibujado"),
 
                         # tabla
                         html.Div(id="tabla-instituciones", style={"marginTop": "40px"})
@@ -244,7 +329,28 @@ app.layout = html.Div(
                         ], style={"display": "flex", "justifyContent": "space-between", "marginTop": "20px"}),
 
                         # === RESULTADOS ===
-                        html.Div(id="resultados-buscador", style={"marginTop": "40px"})
+                        # Nº de resultados / mensajes
+                        html.Div(id="resultados-buscador", style={"marginTop": "40px"}),
+
+                        # Tabla paginada en el servidor: solo se envía la página visible
+                        dash_table.DataTable(
+                            id="tabla-buscador",
+                            columns=[{"name": col, "id": col} for col in [
+                                "Institution", "Category", "Subcategory", "Date", "Description",
+                                "Country", "Amount", "Recurrent", "Tax Deduction",
+                            ]],
+                            data=[],
+                            page_current=0,
+                            page_size=25,
+                            page_count=0,
+                            page_action="custom",
+                            sort_action="custom",
+                            sort_mode="single",
+                            sort_by=[],
+                            style_table={"width": "90%", "margin": "20px auto", "overflowX": "auto"},
+                            style_header={"fontWeight": "bold", "color": "#ffb48a"},
+                            style_cell={"textAlign": "left", "padding": "6px"},
+                        ),
                     ], style={"padding": "20px"})
                 ]),
 
@@ -300,7 +406,20 @@ app.layout = html.Div(
                             style={"width": "200px", "marginBottom": "20px"}
                         ),
 
-                        html.Div(id="prediccion-output", style={"marginTop": "30px"}),
+                        # Progreso del trabajo en segundo plano + cancelar
+                        html.Div([
+                            html.Progress(id="pred-progreso", value="0", max="4",
+                                          style={"visibility": "hidden", "width": "300px"}),
+                            html.Button("Cancelar", id="pred-cancelar", disabled=True,
+                                        style={"marginLeft": "10px"}),
+                        ]),
+
+                        dcc.Store(id="pred-peticion"),
+                        html.Div(
+                            html.P("Sube un archivo para ver la predicción."),
+                            id="prediccion-output",
+                            style={"marginTop": "30px"}
+                        ),
 
 
                         # ----------------------------
@@ -339,7 +458,20 @@ app.layout = html.Div(
                             style={"marginTop": "20px", "marginBottom": "20px"}
                         ),
 
-                        html.Div(id="anom-output", style={"marginTop": "20px"}),
+                        html.Div([
+                            html.Progress(id="anom-progreso", value="0", max="4",
+                                          style={"visibility": "hidden", "width": "300px"}),
+                            html.Button("Cancelar", id="anom-cancelar", disabled=True,
+                                        style={"marginLeft": "10px"}),
+                        ]),
+
+                        dcc.Store(id="anom-peticion"),
+                        dcc.Store(id="anom-modelo"),
+                        html.Div(
+                            html.P("Sube un archivo para ver la detección de anomalías."),
+                            id="anom-output",
+                            style={"marginTop": "20px"}
+                        ),
 
 
                         # ----------------------------
@@ -355,17 +487,33 @@ app.layout = html.Div(
                             style={"marginTop": "10px"}
                         ),
 
+                        html.Div([
+                            html.Progress(id="recom-progreso", value="0", max="1",
+                                          style={"visibility": "hidden", "width": "300px"}),
+                            html.Button("Cancelar", id="recom-cancelar", disabled=True,
+                                        style={"marginLeft": "10px"}),
+                        ], style={"marginTop": "10px"}),
+
                         html.Div(id="recom-output", style={"marginTop": "20px"}),
 
                     ], style={"padding": "20px"})
                 ]),
-            ],
+            ] + ([
+                dcc.Tab(label="Rendimiento", value="tab-rendimiento", children=[
+                    html.Div([
+                        html.H3("Rendimiento de los callbacks", style={"marginTop": "20px"}),
+                        dcc.Interval(id="rendimiento-intervalo", interval=5000),
+                        html.Div(id="rendimiento-output"),
+                    ], style={"padding": "20px"})
+                ]),
+            ] if PANEL_RENDIMIENTO else []),
         ),
     ]
 )
 
 # IMPORTAMOS LOS CALLBACKS (esto registra las funciones)
 from callbacks import upload
+from callbacks import pestanas
 from callbacks import resumen
 from callbacks import categorias
 from callbacks import mensual
@@ -373,6 +521,11 @@ from callbacks import instituciones
 from callbacks import buscador
 from callbacks import mapa
 from callbacks import prediccion
+if PANEL_RENDIMIENTO:
+    from callbacks import rendimiento
+
+# Mide tiempo, CPU, bytes y caché de cada callback (ver /metrics)
+instrumentar_callbacks()
 
 # 3. Ejecutar la app en modo desarrollo
 if __name__ == "__main__":
@@ -0,0 +1,124 @@
+// assets/figuras.js
+// Expande las figuras compactas que envía el servidor (utils/figuras.py):
+// - {dtype, bdata}: typed arrays en base64, con "escala" (importes en
+//   céntimos) o "unidad" (fechas en días o segundos desde 1970);
+// - layout.template con el nombre de una plantilla de /plantillas.js.
+// El plotly.js que trae Dash no entiende nada de esto, así que se envuelven
+// Plotly.react y Plotly.newPlot para expandir la figura antes de dibujarla.
+// No se modifica la figura original: Dash la sigue guardando compacta.
+(function () {
+    var TIPOS = {
+        f8: Float64Array, f4: Float32Array,
+        i4: Int32Array, u4: Uint32Array,
+        i2: Int16Array, u2: Uint16Array,
+        i1: Int8Array, u1: Uint8Array
+    };
+    var MS_POR_UNIDAD = {D: 86400000, s: 1000};
+
+    function esBinario(valor) {
+        return typeof valor.bdata === "string" && TIPOS.hasOwnProperty(valor.dtype);
+    }
+
+    function decodificar(valor) {
+        var texto = atob(valor.bdata);
+        var bytes = new Uint8Array(texto.length);
+        for (var i = 0; i < texto.length; i++) {
+            bytes[i] = texto.charCodeAt(i);
+        }
+        var numeros = new TIPOS[valor.dtype](bytes.buffer);
+
+        if (valor.unidad) {
+            // Fechas: texto ISO, que plotly reconoce como eje de fechas
+            var ms = MS_POR_UNIDAD[valor.unidad];
+            var fechas = new Array(numeros.length);
+            for (var j = 0; j < numeros.length; j++) {
+                var iso = new Date(numeros[j] * ms).toISOString();
+                fechas[j] = valor.unidad === "D" ? iso.slice(0, 10) : iso.slice(0, 19);
+            }
+            return fechas;
+        }
+        if (valor.escala) {
+            var escalados = new Float64Array(numeros.length);
+            for (var k = 0; k < numeros.length; k++) {
+                // Dividir por el inverso evita errores como 12.340000000000002
+                escalados[k] = numeros[k] / Math.round(1 / valor.escala);
+            }
+            return escalados;
+        }
+        return numeros;
+    }
+
+    // Copia solo lo que contiene datos compactos; el resto se reutiliza
+    function expandir(valor) {
+        if (Array.isArray(valor)) {
+            if (!valor.length || typeof valor[0] !== "object" || valor[0] === null) {
+                return valor;
+            }
+            return valor.map(expandir);
+        }
+        if (valor && typeof valor === "object" && !ArrayBuffer.isView(valor)) {
+            if (esBinario(valor)) {
+                return decodificar(valor);
+            }
+            var copia = {};
+            for (var clave in valor) {
+                copia[clave] = expandir(valor[clave]);
+            }
+            return copia;
+        }
+        return valor;
+    }
+
+    function conPlantilla(layout) {
+        if (!layout || typeof layout.template !== "string") {
+            return layout;
+        }
+        var copia = Object.assign({}, layout);
+        var plantillas = window.plantillasFiguras || {};
+        if (plantillas[layout.template]) {
+            copia.template = plantillas[layout.template];
+        } else {
+            delete copia.template;
+        }
+        return copia;
+    }
+
+    function envolverDibujo(original) {
+        // Plotly.react(gd, figura) o Plotly.react(gd, data, layout, config)
+        return function (gd, data, layout, config) {
+            if (data && !Array.isArray(data) && typeof data === "object") {
+                var figura = Object.assign({}, data);
+                figura.data = expandir(figura.data);
+                figura.layout = conPlantilla(figura.layout);
+                return original.call(this, gd, figura);
+            }
+            return original.call(this, gd, expandir(data), conPlantilla(layout), config);
+        };
+    }
+
+    function envolver(Plotly) {
+        if (!Plotly || Plotly.figurasCompactas) {
+            return;
+        }
+        Plotly.react = envolverDibujo(Plotly.react);
+        Plotly.newPlot = envolverDibujo(Plotly.newPlot);
+        Plotly.figurasCompactas = true;
+    }
+
+    // dcc.Graph carga plotly.js más tarde: se envuelve en cuanto aparece
+    if (window.Plotly) {
+        envolver(window.Plotly);
+    } else {
+        var actual;
+        Object.defineProperty(window, "Plotly", {
+            configurable: true,
+            get: function () {
+                return actual;
+            },
+            set: function (valor) {
+                actual = valor;
+                envolver(valor);
+            }
+        });
+    }
+})();
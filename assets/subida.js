@@ -0,0 +1,105 @@
+// assets/subida.js
+// Subida en streaming de ficheros grandes: el fichero se envía tal cual
+// (sin base64) a la ruta /subir y se muestra el progreso del envío y,
+// después, las filas que el servidor lleva parseadas (/subir/progreso).
+// Al terminar, la respuesta se deja en window.subidaResultado, de donde
+// la recoge un callback de cliente (callbacks/upload.py).
+document.addEventListener("click", function (evento) {
+    var boton = evento.target.closest ? evento.target.closest("#subida-boton") : null;
+    if (!boton) {
+        return;
+    }
+
+    // Mientras sea true, callbacks/upload.py mantiene activo el intervalo
+    // que recoge window.subidaResultado
+    window.subidaPendiente = true;
+
+    var selector = document.createElement("input");
+    selector.type = "file";
+    selector.accept = ".csv,.xls,.xlsx,.zip";
+
+    // Selector cerrado sin elegir fichero: no hay nada que esperar
+    selector.addEventListener("cancel", function () {
+        window.subidaPendiente = false;
+    });
+
+    selector.addEventListener("change", function () {
+        if (!selector.files.length) {
+            window.subidaPendiente = false;
+            return;
+        }
+        var fichero = selector.files[0];
+        var progreso = document.getElementById("subida-progreso");
+        var estado = document.getElementById("subida-estado");
+
+        progreso.style.visibility = "visible";
+        progreso.max = fichero.size || 1;
+        progreso.value = 0;
+        estado.textContent = "Subiendo '" + fichero.name + "'...";
+
+        // ID de esta subida para consultar el progreso del parseo
+        var idSubida = Date.now().toString(36) + Math.random().toString(36).slice(2, 10);
+        var consulta = null;
+
+        function consultarProgreso() {
+            var peticion = new XMLHttpRequest();
+            peticion.open("GET", "subir/progreso?id=" + idSubida);
+            peticion.onload = function () {
+                var filas = null;
+                try {
+                    filas = JSON.parse(peticion.responseText).filas;
+                } catch (err) {
+                    return;
+                }
+                if (consulta !== null && filas) {
+                    estado.textContent = "Procesando '" + fichero.name + "': " +
+                        filas.toLocaleString("es-ES") + " filas leídas...";
+                }
+            };
+            peticion.send();
+        }
+
+        function terminar() {
+            if (consulta !== null) {
+                clearInterval(consulta);
+                consulta = null;
+            }
+            progreso.style.visibility = "hidden";
+            estado.textContent = "";
+        }
+
+        var xhr = new XMLHttpRequest();
+        xhr.open("POST", "subir?nombre=" + encodeURIComponent(fichero.name) + "&id=" + idSubida);
+        xhr.setRequestHeader("Content-Type", "application/octet-stream");
+
+        xhr.upload.onprogress = function (e) {
+            if (e.lengthComputable) {
+                progreso.max = e.total;
+                progreso.value = e.loaded;
+                estado.textContent = "Subiendo '" + fichero.name + "': " +
+                    Math.round(100 * e.loaded / e.total) + "%";
+            }
+        };
+        xhr.upload.onload = function () {
+            // Sin total conocido: la barra pasa a indeterminada mientras se parsea
+            progreso.removeAttribute("value");
+            estado.textContent = "Procesando '" + fichero.name + "'...";
+            consulta = setInterval(consultarProgreso, 500);
+        };
+        xhr.onload = function () {
+            terminar();
+            try {
+                window.subidaResultado = JSON.parse(xhr.responseText);
+            } catch (err) {
+                window.subidaResultado = {mensaje: "Error al subir el archivo."};
+            }
+        };
+        xhr.onerror = function () {
+            terminar();
+            window.subidaResultado = {mensaje: "Error de red al subir el archivo."};
+        };
+        xhr.send(fichero);
+    });
+
+    selector.click();
+});
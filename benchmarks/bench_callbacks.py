@@ -0,0 +1,212 @@
+# benchmarks/bench_callbacks.py
+# Mide cómo escalan los callbacks del dashboard con el tamaño del ledger.
+#
+# Uso:
+#   python -m benchmarks.bench_callbacks --filas 1000 10000 100000 1000000
+#   python -m benchmarks.bench_callbacks --filas 100000 --comparar benchmarks/resultados/base.json
+#
+# Cada callback se llama directamente (sin servidor) sobre un ledger
+# sintético. Se mide la primera llamada (cachés vacías: cubo, índices y
+# modelos se construyen dentro), la latencia en caliente (p50/p95/p99),
+# el pico de memoria de la primera llamada y el tamaño del JSON que Dash
+# enviaría al navegador. El informe se guarda en JSON.
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+from datetime import datetime
+
+import numpy as np
+
+# Cachés en disco en un directorio temporal: el benchmark no toca cache/
+_TMP = tempfile.mkdtemp(prefix="bench-dashboard-")
+os.environ.setdefault("DATASETS_DIR", os.path.join(_TMP, "datasets"))
+os.environ.setdefault("JOBS_DIR", os.path.join(_TMP, "jobs"))
+os.environ.setdefault("CACHE_DIR", os.path.join(_TMP, "compartida"))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd  # noqa: E402
+from plotly.io.json import to_json_plotly  # noqa: E402
+
+import app  # noqa: E402,F401  (registra los callbacks con su layout)
+from benchmarks.generador import generar_ledger  # noqa: E402
+from callbacks import buscador, mapa, mensual, prediccion, resumen  # noqa: E402
+from utils import agregados, backends, figuras, indices, modelos, piramide, series  # noqa: E402
+from utils.data_utils import guardar_dataset  # noqa: E402
+
+DIRECTORIO_RESULTADOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resultados")
+
+
+def _sin_progreso(valor):
+    pass
+
+
+# nombre -> función que recibe el ID del dataset y llama al callback
+CALLBACKS = {
+    "actualizar_kpis": lambda d: resumen.actualizar_kpis(None, d),
+    "actualizar_mensual": lambda d: mensual.actualizar_mensual(None, None, None, None, None, d, None),
+    # Cambio de filtro con los gráficos ya dibujados: solo viaja un Patch
+    "actualizar_mensual_filtro": lambda d: mensual.actualizar_mensual(
+        None, None, ["Living Expenses"], None, None, d, d
+    ),
+    "actualizar_serie": lambda d: mensual.actualizar_serie(None, "transaccion", None, None, None, d),
+    "aplicar_buscador": lambda d: buscador.aplicar_buscador(
+        None, "market", None, None, None, None, -100, 0, 0, 25, [{"column_id": "Amount", "direction": "asc"}], d
+    ),
+    "actualizar_graficos_resumen": lambda d: resumen.actualizar_graficos_resumen(None, d),
+    # Zoom en un mes: se reagrega por días desde la pirámide temporal
+    "reagregar_resumen": lambda d: resumen.reagregar_resumen(
+        {"xaxis.range[0]": "2023-03-01", "xaxis.range[1]": "2023-03-31"}, d
+    ),
+    "actualizar_mapa": lambda d: mapa.actualizar_mapa(None, "gastos", d),
+    "segmentar_meses": lambda d: prediccion.segmentar_meses(None, d),
+    "actualizar_prediccion": lambda d: prediccion.actualizar_prediccion(
+        _sin_progreso, {"dataset": d, "meses": 6}
+    ),
+}
+
+
+def vaciar_caches():
+    """Olvida todo lo derivado del dataset (cubo, pirámide, índices, modelos, figuras, series) para medir en frío."""
+    agregados._cubos.clear()
+    piramide._piramides.clear()
+    figuras._figuras.clear()
+    indices._indices.clear()
+    modelos._modelos.clear()
+    series._series.clear()
+    # También el segundo nivel: el backend configurado (disco o Redis) y el
+    # de disco que usan los modelos con CACHE_BACKEND=memoria
+    for compartida in {backends.backend_compartido(), backends.backend_compartido(obligatorio=True)}:
+        if compartida is not None:
+            compartida.vaciar()
+
+
+def tamano_payload(resultado):
+    """Bytes del JSON con el que Dash serializa la respuesta del callback."""
+    if isinstance(resultado, tuple):
+        resultado = list(resultado)
+    return len(to_json_plotly(resultado).encode("utf-8"))
+
+
+def medir(nombre, llamada, dataset_id, repeticiones):
+    # Primera llamada, en frío
+    vaciar_caches()
+    t = time.perf_counter()
+    resultado = llamada(dataset_id)
+    primera = time.perf_counter() - t
+
+    # Pico de memoria de la primera llamada (aparte: tracemalloc ralentiza)
+    vaciar_caches()
+    tracemalloc.start()
+    llamada(dataset_id)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # Latencia en caliente
+    tiempos = []
+    for _ in range(repeticiones):
+        t = time.perf_counter()
+        llamada(dataset_id)
+        tiempos.append(time.perf_counter() - t)
+    p50, p95, p99 = np.percentile(np.array(tiempos) * 1000, [50, 95, 99])
+
+    return {
+        "callback": nombre,
+        "primera_ms": round(primera * 1000, 2),
+        "p50_ms": round(p50, 2),
+        "p95_ms": round(p95, 2),
+        "p99_ms": round(p99, 2),
+        "pico_mb": round(pico / 1024 ** 2, 2),
+        "payload_kb": round(tamano_payload(resultado) / 1024, 2),
+    }
+
+
+def comparar(resultados, ruta_base, tolerancia):
+    """Lista de regresiones (p50 o primera llamada) respecto a un informe anterior."""
+    with open(ruta_base) as f:
+        base = {(r["filas"], r["callback"]): r for r in json.load(f)["resultados"]}
+
+    regresiones = []
+    for r in resultados:
+        anterior = base.get((r["filas"], r["callback"]))
+        if anterior is None:
+            continue
+        for medida in ("p50_ms", "primera_ms"):
+            if anterior[medida] > 0 and r[medida] > anterior[medida] * (1 + tolerancia):
+                regresiones.append(
+                    f"{r['callback']} ({r['filas']} filas): {medida} {anterior[medida]} → {r[medida]}"
+                )
+    return regresiones
+
+
+def main():
+    # Avisos de deprecación de pandas/plotly: ensucian la tabla y no afectan a la medida
+    warnings.filterwarnings("ignore", category=FutureWarning)
+    warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+    parser = argparse.ArgumentParser(description="Benchmark de los callbacks del dashboard")
+    parser.add_argument("--filas", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeticiones", type=int, default=20)
+    parser.add_argument("--callbacks", nargs="+", choices=list(CALLBACKS), default=list(CALLBACKS))
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--salida", help="Ruta del informe JSON (por defecto benchmarks/resultados/)")
+    parser.add_argument("--comparar", help="Informe anterior con el que comparar")
+    parser.add_argument("--tolerancia", type=float, default=0.25,
+                        help="Empeoramiento relativo permitido antes de marcar una regresión")
+    args = parser.parse_args()
+
+    resultados = []
+    for filas in args.filas:
+        t = time.perf_counter()
+        df = generar_ledger(filas, semilla=args.semilla)
+        dataset_id = guardar_dataset(df)
+        print(f"\n== {filas:,} filas (generadas en {time.perf_counter() - t:.1f} s) ==")
+        print(f"{'callback':<30}{'primera':>11}{'p50':>10}{'p95':>10}{'p99':>10}{'pico MB':>10}{'payload KB':>12}")
+
+        for nombre in args.callbacks:
+            r = medir(nombre, CALLBACKS[nombre], dataset_id, args.repeticiones)
+            r["filas"] = filas
+            resultados.append(r)
+            print(f"{nombre:<30}{r['primera_ms']:>11}{r['p50_ms']:>10}{r['p95_ms']:>10}"
+                  f"{r['p99_ms']:>10}{r['pico_mb']:>10}{r['payload_kb']:>12}")
+
+    informe = {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "entorno": {
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "plataforma": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "repeticiones": args.repeticiones,
+        "resultados": resultados,
+    }
+
+    salida = args.salida
+    if salida is None:
+        os.makedirs(DIRECTORIO_RESULTADOS, exist_ok=True)
+        salida = os.path.join(DIRECTORIO_RESULTADOS, f"bench-{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(salida, "w") as f:
+        json.dump(informe, f, indent=2)
+    print(f"\nInforme guardado en {salida}")
+
+    shutil.rmtree(_TMP, ignore_errors=True)
+
+    if args.comparar:
+        regresiones = comparar(resultados, args.comparar, args.tolerancia)
+        for regresion in regresiones:
+            print("REGRESIÓN:", regresion)
+        if regresiones:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
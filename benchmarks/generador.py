@@ -0,0 +1,111 @@
+# benchmarks/generador.py
+# Generador de ledgers sintéticos con el esquema de Data Transactions.xlsx.
+# Las proporciones (categorías, países, instituciones) imitan el dataset real
+# y los comercios siguen una distribución de Zipf: unos pocos concentran la
+# mayoría de transacciones y hay una cola larga de comercios raros.
+import numpy as np
+import pandas as pd
+
+# Categoría -> (peso, subcategorías, probabilidad de que el importe sea gasto)
+CATEGORIAS = {
+    "Savings & Investments": (0.219, ["Tranfer from savings", "Roundup", "Invesment", "Savings"], 0.5),
+    "Personal Spending": (0.204, ["Education", "Software", "Bar & Restaurant", "Book", "Clothing",
+                                  "Dental Care", "Gift", "Groceries", "Purchase", "Tech", "Tools"], 0.9),
+    "Debt & Loans": (0.132, ["Debt Payment", "Debt Interest", "Debt Payment Return", "Debt Fee"], 0.85),
+    "Entertainment & Leisure": (0.125, ["Movies", "Bar & Restaurant", "Event", "Flight", "Games",
+                                        "Hotel", "Taxi", "Travel Purchase"], 0.9),
+    "Income": (0.105, ["Active", "Cash Back", "Rewards", "Interest earned", "Passive", "Transfer"], 0.05),
+    "Living Expenses": (0.102, ["Groceries", "Subcriptions", "Gym", "Music", "Rent", "Utilities",
+                                "Health Care"], 0.95),
+    "Transportation": (0.101, ["Insurance", "Registration", "Fuel", "Parts", "Mechanic", "Parking"], 0.95),
+    "Taxes": (0.013, ["Taxes Payment"], 0.95),
+}
+
+PAISES = {"United States": 0.909, "Colombia": 0.043, "Mexico": 0.016, "Spain": 0.016, "Italy": 0.013, "Rome": 0.003}
+
+INSTITUCIONES = {
+    "Sofi": 0.566, "8813": 0.125, "1593": 0.104, "7530": 0.05, "Mission Lane": 0.046, "6454": 0.036,
+    "7643": 0.028, "Merrick Bank": 0.022, "4934": 0.019, "Affirm": 0.002, "Paypal": 0.001,
+}
+
+_PALABRAS = [
+    "MARKET", "CAFE", "STORE", "ONLINE", "PAYMENT", "FOODS", "TRAVEL", "SHOP", "SERVICES", "BAR",
+    "PHARMACY", "FUEL", "MOBILE", "ZELLE", "AMAZON", "UBER", "TARGET", "COSTCO", "SPOTIFY", "NETFLIX",
+]
+
+
+def _pesos(d):
+    valores = np.array(list(d.values()), dtype="float64")
+    return valores / valores.sum()
+
+
+def _comercios(n, rng):
+    """Nombres de comercio únicos, del estilo 'COSTCO MARKET 0042'."""
+    a = rng.integers(0, len(_PALABRAS), n)
+    b = rng.integers(0, len(_PALABRAS), n)
+    return [f"{_PALABRAS[i]} {_PALABRAS[j]} {k:05d}" for k, (i, j) in enumerate(zip(a, b))]
+
+
+def generar_ledger(filas, semilla=0, anios=3, comercios=None):
+    """
+    Ledger sintético con `filas` transacciones repartidas en `anios` años.
+    Devuelve el DataFrame ya en el esquema canónico (categóricas, float64,
+    booleanos), listo para guardar_dataset().
+    `comercios` (cardinalidad de Description) crece por defecto con √filas.
+    """
+    rng = np.random.default_rng(semilla)
+
+    if comercios is None:
+        comercios = int(min(200_000, max(50, 20 * np.sqrt(filas))))
+
+    # Categoría y subcategoría (subcategorías uniformes dentro de su categoría)
+    nombres_cat = list(CATEGORIAS)
+    cat = rng.choice(len(nombres_cat), size=filas, p=_pesos({k: v[0] for k, v in CATEGORIAS.items()}))
+
+    subcategorias = sorted({s for _, subs, _ in CATEGORIAS.values() for s in subs})
+    posicion_sub = {s: i for i, s in enumerate(subcategorias)}
+    sub = np.empty(filas, dtype="int16")
+    prob_gasto = np.empty(filas)
+    for i, nombre in enumerate(nombres_cat):
+        _, subs, p_gasto = CATEGORIAS[nombre]
+        filas_cat = np.flatnonzero(cat == i)
+        codigos = np.array([posicion_sub[s] for s in subs], dtype="int16")
+        sub[filas_cat] = codigos[rng.integers(0, len(subs), len(filas_cat))]
+        prob_gasto[filas_cat] = p_gasto
+
+    # Comercios con sesgo de Zipf (s ≈ 1.1)
+    rangos = np.arange(1, comercios + 1)
+    pesos_comercio = 1.0 / rangos ** 1.1
+    descripcion = rng.choice(comercios, size=filas, p=pesos_comercio / pesos_comercio.sum())
+
+    # Fechas uniformes en el periodo, importes log-normales con signo
+    inicio = np.datetime64("2022-01-01", "s")
+    segundos = rng.integers(0, int(anios * 365.25 * 86400), filas)
+    fechas = (inicio + segundos.astype("timedelta64[s]")).astype("datetime64[ns]")
+
+    importe = rng.lognormal(mean=3.0, sigma=1.2, size=filas).round(2)
+    signo = np.where(rng.random(filas) < prob_gasto, -1.0, 1.0)
+
+    def categorica(codigos, categorias):
+        return pd.Categorical.from_codes(codigos, categories=categorias)
+
+    df = pd.DataFrame({
+        "Institution": categorica(
+            rng.choice(len(INSTITUCIONES), size=filas, p=_pesos(INSTITUCIONES)), list(INSTITUCIONES)
+        ),
+        "Category": categorica(cat, nombres_cat),
+        "Subcategory": categorica(sub, subcategorias),
+        "Date": fechas,
+        "Description": categorica(descripcion, _comercios(comercios, rng)),
+        "Country": categorica(rng.choice(len(PAISES), size=filas, p=_pesos(PAISES)), list(PAISES)),
+        "Amount": (importe * signo).astype("float64"),
+        "Recurrent": rng.random(filas) < 0.12,
+        "Tax Deduction": rng.random(filas) < 0.03,
+        "Source": categorica(np.zeros(filas, dtype="int8"), ["sintetico"]),
+    })
+
+    # Mismo orden de categorías que produce normalizar_ledger
+    for col in ("Institution", "Category", "Subcategory", "Description", "Country"):
+        df[col] = df[col].cat.reorder_categories(sorted(df[col].cat.categories))
+
+    return df.sort_values("Date", kind="stable").reset_index(drop=True)
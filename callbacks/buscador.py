@@ -1,33 +1,43 @@
-from dash import Input, Output, html, dcc  # y DatePickerRange, etc. si los usas
+from dash import Input, Output, State, html, dcc  # y DatePickerRange, etc. si los usas
 import pandas as pd
+import numpy as np
 import plotly.graph_objects as go
 import plotly.express as px  # solo si lo necesitas
 
 from dash import callback
+from callbacks.pestanas import comprobar_tab, id_disparador
 from utils.data_utils import df_from_store
+from utils.indices import indices_from_store
 
 
 @callback(
     Output("buscador-categoria", "options"),
     Output("buscador-institucion", "options"),
-    Input("Data", "data")
+    Input("tabs-renderizadas", "data"),
+    State("Data", "data"),
 )
-def cargar_filtros_buscador(data_json):
+def cargar_filtros_buscador(estado_tabs, data_json):
+    comprobar_tab("tab-buscador", estado_tabs)
+
     df = df_from_store(data_json)
 
     if df is None:
         return [], []
 
+    # Al abrir la pestaña dejamos construido el índice de descripciones,
+    # así la primera búsqueda ya no tiene que recorrer la columna
+    indices_from_store(data_json)
+
     # CATEGORÍAS
     if "Category" in df.columns:
-        categorias = sorted(df["Category"].dropna().astype(str).unique())
+        categorias = sorted(df["Category"].cat.categories)
         opciones_categorias = [{"label": c, "value": c} for c in categorias]
     else:
         opciones_categorias = []
 
     # INSTITUCIONES
     if "Institution" in df.columns:
-        instituciones = sorted(df["Institution"].dropna().astype(str).unique())
+        instituciones = sorted(df["Institution"].cat.categories)
         opciones_instituciones = [{"label": i, "value": i} for i in instituciones]
     else:
         opciones_instituciones = []
@@ -35,62 +45,132 @@ def cargar_filtros_buscador(data_json):
     return opciones_categorias, opciones_instituciones
 
 
+COLUMNAS_TABLA = [
+    "Institution", "Category", "Subcategory", "Date", "Description",
+    "Country", "Amount", "Recurrent", "Tax Deduction",
+]
+
+
+def formatear_pagina(pagina):
+    """Convierte solo las filas de la página visible en registros para la DataTable."""
+    registros = pd.DataFrame({
+        "Institution": pagina["Institution"].astype(str).replace("nan", ""),
+        "Category": pagina["Category"].astype(str).replace("nan", ""),
+        "Subcategory": pagina["Subcategory"].astype(str).replace("nan", ""),
+        "Date": pagina["Date"].dt.strftime("%Y-%m-%d"),
+        "Description": pagina["Description"].astype(str).replace("nan", ""),
+        "Country": pagina["Country"].astype(str).replace("nan", ""),
+        "Amount": pagina["Amount"].astype("float64").round(2),
+        "Recurrent": pagina["Recurrent"].astype(str),
+        "Tax Deduction": pagina["Tax Deduction"].astype(str),
+    })
+    return registros[COLUMNAS_TABLA].to_dict("records")
+
+
 @callback(
     Output("resultados-buscador", "children"),
-    Input("Data", "data"),
+    Output("tabla-buscador", "data"),
+    Output("tabla-buscador", "page_count"),
+    Output("tabla-buscador", "page_current"),
+    Input("tabs-renderizadas", "data"),
     Input("buscador-descripcion", "value"),
     Input("buscador-categoria", "value"),
     Input("buscador-institucion", "value"),
     Input("buscador-fechas", "start_date"),
     Input("buscador-fechas", "end_date"),
     Input("monto-min", "value"),
-    Input("monto-max", "value")
+    Input("monto-max", "value"),
+    Input("tabla-buscador", "page_current"),
+    Input("tabla-buscador", "page_size"),
+    Input("tabla-buscador", "sort_by"),
+    State("Data", "data"),
 )
-def aplicar_buscador(data_json, texto, categoria, institucion, fecha_ini, fecha_fin, monto_min, monto_max):
+def aplicar_buscador(estado_tabs, texto, categoria, institucion, fecha_ini, fecha_fin, monto_min, monto_max,
+                     page_current, page_size, sort_by, data_json):
+    comprobar_tab("tab-buscador", estado_tabs)
+
     df = df_from_store(data_json)
 
     if df is None:
-        return html.P("Sube un archivo para usar el buscador.")
-
-    # FECHA
-    df["Date"] = pd.to_datetime(df["Date"])
-
-    # FILTRO 1: TEXTO EN DESCRIPCIÓN
+        return html.P("Sube un archivo para usar el buscador."), [], 0, 0
+
+    # Si ha cambiado un filtro (y no la paginación/orden) volvemos a la primera página
+    if id_disparador() not in (None, "tabla-buscador"):
+        page_current = 0
+    page_current = page_current or 0
+    page_size = page_size or 25
+
+    # Los filtros se combinan como bitmaps sobre las posiciones de las filas:
+    # no se copia el DataFrame hasta materializar la página visible
+    indices = indices_from_store(data_json)
+    seleccion = np.ones(indices.n_filas, dtype=bool)
+
+    # FILTRO 1: TEXTO EN DESCRIPCIÓN (índice de trigramas, construido una vez)
+    # "texto*" busca palabras que empiezan por "texto". Sin texto (solo
+    # espacios o un "*" suelto) no se filtra: "" está en todas las filas
+    texto = (texto or "").strip()
+    prefijo = texto.endswith("*")
+    texto = texto.rstrip("*").strip()
     if texto:
-        df = df[df["Description"].str.contains(texto, case=False, na=False)]
+        if prefijo:
+            filas = indices.descripcion.buscar_prefijo(texto)
+        else:
+            filas = indices.descripcion.buscar(texto)
+        seleccion &= indices.mascara(filas)
 
     # FILTRO 2: CATEGORÍA
     if categoria:
-        df = df[df["Category"].astype(str) == str(categoria)]
+        seleccion &= (df["Category"] == str(categoria)).to_numpy()
 
     # FILTRO 3: INSTITUCIÓN
     if institucion:
-        df = df[df["Institution"].astype(str) == str(institucion)]
-
-    # FILTRO 4: RANGO DE FECHAS
-    if fecha_ini:
-        df = df[df["Date"] >= fecha_ini]
-    if fecha_fin:
-        df = df[df["Date"] <= fecha_fin]
-
-    # FILTRO 5: MONTO
-    if monto_min is not None:
-        df = df[df["Amount"] >= monto_min]
-
-    if monto_max is not None:
-        df = df[df["Amount"] <= monto_max]
-
-    if df.empty:
-        return html.P("No se encontraron resultados con esos filtros.")
-
-    # ---- TABLA RESULTADOS ----
-    tabla = html.Table(
-        [html.Tr([html.Th(col) for col in df.columns])] +
-        [
-            html.Tr([html.Td(str(df.iloc[i][col])) for col in df.columns])
-            for i in range(len(df))
-        ],
-        style={"width": "90%", "margin": "auto", "borderCollapse": "collapse"}
-    )
-
-    return tabla
\ No newline at end of file
+        seleccion &= (df["Institution"] == str(institucion)).to_numpy()
+
+    # FILTRO 4: RANGO DE FECHAS (búsqueda binaria sobre el índice ordenado)
+    if fecha_ini or fecha_fin:
+        filas = indices.fecha.rango(
+            np.datetime64(pd.Timestamp(fecha_ini)) if fecha_ini else None,
+            np.datetime64(pd.Timestamp(fecha_fin)) if fecha_fin else None,
+        )
+        seleccion &= indices.mascara(filas)
+
+    # FILTRO 5: MONTO (búsqueda binaria sobre el índice ordenado)
+    if monto_min is not None or monto_max is not None:
+        filas = indices.importe.rango(
+            float(monto_min) if monto_min is not None else None,
+            float(monto_max) if monto_max is not None else None,
+        )
+        seleccion &= indices.mascara(filas)
+
+    total = int(seleccion.sum())
+    if total == 0:
+        return html.P("No se encontraron resultados con esos filtros."), [], 0, 0
+
+    # ---- ORDEN (en el servidor) ----
+    # Date y Amount ya tienen su permutación ordenada: basta con filtrarla
+    if sort_by and sort_by[0]["column_id"] in ("Date", "Amount"):
+        indice = indices.fecha if sort_by[0]["column_id"] == "Date" else indices.importe
+        posiciones = indice.orden[seleccion[indice.orden]]
+        if sort_by[0]["direction"] != "asc":
+            posiciones = posiciones[::-1]
+    elif sort_by:
+        posiciones = np.flatnonzero(seleccion)
+        columna = df[sort_by[0]["column_id"]].iloc[posiciones].reset_index(drop=True)
+        if isinstance(columna.dtype, pd.CategoricalDtype):
+            # Tras un añadido las categorías nuevas van al final: se ordena por
+            # valor (alfabético), no por el código de la categoría
+            columna = columna.cat.reorder_categories(columna.cat.categories.sort_values())
+        ascendente = sort_by[0]["direction"] == "asc"
+        posiciones = posiciones[columna.sort_values(ascending=ascendente, kind="stable").index.to_numpy()]
+    else:
+        posiciones = np.flatnonzero(seleccion)
+
+    # ---- PÁGINA VISIBLE ----
+    num_paginas = -(-total // page_size)
+    page_current = min(page_current, num_paginas - 1)
+    inicio = page_current * page_size
+    pagina = df.iloc[posiciones[inicio:inicio + page_size]]
+
+    mensaje = html.P(f"{total} transacciones encontradas (página {page_current + 1} de {num_paginas}).")
+
+    return mensaje, formatear_pagina(pagina), num_paginas, page_current
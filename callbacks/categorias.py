@@ -1,34 +1,30 @@
-from dash import Input, Output, html, dcc  # y DatePickerRange, etc. si los usas
+from dash import Input, Output, State, html, dcc  # y DatePickerRange, etc. si los usas
 import pandas as pd
 import plotly.graph_objects as go
 import plotly.express as px  # solo si lo necesitas
 
 from dash import callback
+from callbacks.pestanas import comprobar_tab
 from utils.data_utils import df_from_store
+from utils.agregados import cubo_from_store, total_por
+from utils.figuras import figura_cacheada
 
 @callback(
     Output("grafico-categorias", "children"),
     Output("tabla-categorias", "children"),
-    Input("Data", "data")
+    Input("tabs-renderizadas", "data"),
+    State("Data", "data"),
 )
-def actualizar_categorias(data_json):
-    df = df_from_store(data_json)
-
-    if df is None:
-        return html.P("Sube un archivo para ver las categorías."), None
-
-    # Asegurar formato de fecha
-    if "Date" in df.columns:
-        df["Date"] = pd.to_datetime(df["Date"])
+def actualizar_categorias(estado_tabs, data_json):
+    comprobar_tab("tab-categorias", estado_tabs)
 
-    # Mantener solo gastos (Amount < 0)
-    df_gastos = df[df["Amount"] < 0]
+    cubo = cubo_from_store(data_json)
 
-    if "Category" not in df_gastos.columns:
-        return html.P("No existe una columna llamada 'Category'."), None
+    if cubo is None:
+        return html.P("Sube un archivo para ver las categorías."), None
 
-    # Agrupación por categoría
-    resumen = df_gastos.groupby("Category")["Amount"].sum().sort_values()
+    # Agrupación por categoría, solo gastos (Amount < 0)
+    resumen = total_por(cubo, "Category", signo="gasto").sort_values()
 
     # Convertimos los valores negativos a positivos para mostrar bien los gráficos
     resumen_abs = resumen.abs()
@@ -39,21 +35,8 @@ def actualizar_categorias(data_json):
     # -------------------------------
     #  GRÁFICO PIE
     # -------------------------------
-    fig = go.Figure(data=[
-        go.Pie(
-            labels=resumen_abs.index,
-            values=resumen_abs.values,
-            hole=0.4,
-            hoverinfo="label+percent+value",
-        )
-    ])
-
-    fig.update_layout(
-        title="Distribución del gasto por categoría",
-        showlegend=True
-    )
-
-    grafico = dcc.Graph(figure=fig)
+    figura = figura_cacheada(data_json, "categorias", lambda: _figura_categorias(resumen_abs))
+    grafico = dcc.Graph(figure=figura)
 
     # -------------------------------
     #  TABLA RESUMEN
@@ -74,12 +57,33 @@ def actualizar_categorias(data_json):
 
     return grafico, tabla
 
+
+def _figura_categorias(resumen_abs):
+    fig = go.Figure(data=[
+        go.Pie(
+            labels=resumen_abs.index,
+            values=resumen_abs.values,
+            hole=0.4,
+            hoverinfo="label+percent+value",
+        )
+    ])
+
+    fig.update_layout(
+        title="Distribución del gasto por categoría",
+        showlegend=True
+    )
+
+    return fig
+
 @callback(
     Output("filtro-institucion", "options"),
     Output("filtro-categoria", "options"),
-    Input("Data", "data")
+    Input("tabs-renderizadas", "data"),
+    State("Data", "data"),
 )
-def cargar_filtros(data_json):
+def cargar_filtros(estado_tabs, data_json):
+    comprobar_tab("tab-mensual", estado_tabs)
+
     df = df_from_store(data_json)
     if df is None:
         return [], []
@@ -87,19 +91,15 @@ def cargar_filtros(data_json):
     opciones_institucion = []
     opciones_categoria = []
 
+    # Las dimensiones ya son categóricas de strings: basta con leer sus categorías
     # --- Opciones de institución ---
     if "Institution" in df.columns:
-        instituciones = df["Institution"].dropna().unique()
-        # Pasamos todo a string para evitar mezclas str/int
-        instituciones = [str(x) for x in instituciones]
-        instituciones.sort()
+        instituciones = sorted(df["Institution"].cat.categories)
         opciones_institucion = [{"label": inst, "value": inst} for inst in instituciones]
 
     # --- Opciones de categoría ---
     if "Category" in df.columns:
-        categorias = df["Category"].dropna().unique()
-        categorias = [str(x) for x in categorias]
-        categorias.sort()
+        categorias = sorted(df["Category"].cat.categories)
         opciones_categoria = [{"label": cat, "value": cat} for cat in categorias]
 
     return opciones_institucion, opciones_categoria
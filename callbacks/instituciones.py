@@ -1,61 +1,137 @@
-from dash import Input, Output, html, dcc  # y DatePickerRange, etc. si los usas
+from dash import Input, Output, State, html, dcc  # y DatePickerRange, etc. si los usas
 import pandas as pd
 import plotly.graph_objects as go
 import plotly.express as px  # solo si lo necesitas
 
-from dash import callback
+from dash import Patch, callback, no_update
+from dash.exceptions import PreventUpdate
+from callbacks.pestanas import comprobar_tab, id_disparador
 from utils.data_utils import df_from_store
+from utils.agregados import cubo_from_store, total_por
+from utils.figuras import compactar_valores, figura_cacheada
+from utils.piramide import adjetivo, piramide_from_store, serie_nivel, vista
+from utils.series import fijar_rango_x, rango_visible
 
 
 @callback(
     Output("filtro-institucion-unico", "options"),
-    Input("Data", "data")
+    Input("tabs-renderizadas", "data"),
+    State("Data", "data"),
 )
-def cargar_lista_instituciones(data_json):
+def cargar_lista_instituciones(estado_tabs, data_json):
+    comprobar_tab("tab-instituciones", estado_tabs)
+
     df = df_from_store(data_json)
 
     if df is None or "Institution" not in df.columns:
         return []
 
-    instituciones = df["Institution"].dropna().unique()
-
-    # Convertimos todo a string para evitar errores de mezcla str/int
-    instituciones = [str(x) for x in instituciones]
-    instituciones.sort()
+    # Institution ya es categórica de strings (normalizada al subir el archivo)
+    instituciones = sorted(df["Institution"].cat.categories)
 
     return [{"label": inst, "value": inst} for inst in instituciones]
 
+# El gráfico está oculto mientras no hay nada que dibujar
+OCULTO = {"display": "none"}
+VISIBLE = {"display": "block", "marginTop": "30px"}
+
+
 @callback(
-    Output("grafico-institucion", "children"),
-    Input("Data", "data"),
-    Input("filtro-institucion-unico", "value")
+    Output("institucion-mensaje", "children"),
+    Output("grafico-institucion", "style"),
+    Output("grafico-institucion", "figure"),
+    Output("institucion-dibujado", "data"),
+    Input("tabs-renderizadas", "data"),
+    Input("filtro-institucion-unico", "value"),
+    Input("grafico-institucion", "relayoutData"),
+    State("Data", "data"),
+    State("institucion-dibujado", "data"),
 )
-def actualizar_grafico_institucion(data_json, institucion):
-    df = df_from_store(data_json)
+def actualizar_grafico_institucion(estado_tabs, institucion, zoom, data_json, dibujado):
+    """
+    La primera figura de cada dataset se envía completa; al cambiar de
+    institución solo se envían los x/y de las trazas y el título (dash.Patch).
+    Al hacer zoom se reagrega el tramo visible con la pirámide temporal
+    (días, semanas...) y también se envía solo como Patch.
+    """
+    comprobar_tab("tab-instituciones", estado_tabs)
 
-    if df is None:
-        return html.P("Sube un archivo para ver el gráfico.")
+    piramide = piramide_from_store(data_json)
 
-    if "Date" in df.columns:
-        df["Date"] = pd.to_datetime(df["Date"])
-
-    if "Institution" not in df.columns:
-        return html.P("No existe columna 'Institution' en el archivo.")
+    if piramide is None:
+        return html.P("Sube un archivo para ver el gráfico."), OCULTO, no_update, None
 
     # Si no hay institución seleccionada → mensaje
     if institucion is None:
-        return html.P("Selecciona una institución para ver el gráfico.")
+        return html.P("Selecciona una institución para ver el gráfico."), OCULTO, no_update, no_update
+
+    if id_disparador() == "grafico-institucion":
+        if dibujado != data_json:
+            # El gráfico aún no es el de este dataset: no hay nada que reagregar
+            raise PreventUpdate
+        rango = rango_visible(zoom)
+    else:
+        rango = (None, None)
+
+    nivel, inicio, fin = vista(piramide, rango)
+
+    if dibujado == data_json:
+        series = _series_institucion(piramide, institucion, nivel, inicio, fin)
+        if series is None and inicio is None:
+            return html.P("No hay datos para esa institución."), OCULTO, no_update, no_update
+
+        df_m, df_gastos, df_ingresos = series or _series_institucion_vacias()
+        fig = Patch()
+        fig["data"][0]["x"] = compactar_valores(df_gastos.index)
+        fig["data"][0]["y"] = compactar_valores(df_gastos)
+        fig["data"][1]["x"] = compactar_valores(df_ingresos.index)
+        fig["data"][1]["y"] = compactar_valores(df_ingresos)
+        fig["data"][2]["x"] = compactar_valores(df_m.index)
+        fig["data"][2]["y"] = compactar_valores(df_m["Balance"])
+        fig["data"][2]["name"] = f"Balance {adjetivo(nivel)}"
+        fig["layout"]["title"]["text"] = _titulo_institucion(institucion)
+        # Institución nueva o vuelta a la vista completa: autorange
+        fijar_rango_x(fig, inicio, fin)
+        return None, VISIBLE, fig, no_update
+
+    # Una figura por dataset e institución: volver a una ya vista no la reconstruye
+    figura = figura_cacheada(
+        data_json, "institucion", lambda: _figura_institucion(piramide, institucion, nivel), institucion
+    )
+    if figura is None:
+        return html.P("No hay datos para esa institución."), OCULTO, no_update, no_update
+
+    return None, VISIBLE, figura, data_json
+
+
+def _titulo_institucion(institucion):
+    return f"Evolución financiera de {institucion}"
 
-    # Filtrar solo esa institución
-    df_inst = df[df["Institution"].astype(str) == str(institucion)]
 
-    if df_inst.empty:
-        return html.P("No hay datos para esa institución.")
+def _series_institucion(piramide, institucion, nivel, inicio=None, fin=None):
+    """Series (balance, gastos, ingresos) de la institución por periodo de `nivel`, o None si no tiene datos."""
+    df_m = serie_nivel(piramide, nivel, inicio=inicio, fin=fin, Institution=institucion).to_frame("Balance")
 
-    # Agrupar por mes
-    df_m = df_inst.resample("ME", on="Date")["Amount"].sum().to_frame("Balance")
-    df_gastos = df_inst[df_inst["Amount"] < 0].resample("ME", on="Date")["Amount"].sum()
-    df_ingresos = df_inst[df_inst["Amount"] > 0].resample("ME", on="Date")["Amount"].sum()
+    if df_m.empty:
+        return None
+
+    df_gastos = serie_nivel(piramide, nivel, signo="gasto", inicio=inicio, fin=fin, Institution=institucion)
+    df_ingresos = serie_nivel(piramide, nivel, signo="ingreso", inicio=inicio, fin=fin, Institution=institucion)
+    return df_m, df_gastos, df_ingresos
+
+
+def _series_institucion_vacias():
+    # Tramo con zoom sin transacciones de la institución: trazas vacías
+    vacia = pd.Series(dtype="float64", name="Amount")
+    return vacia.to_frame("Balance"), vacia, vacia
+
+
+def _figura_institucion(piramide, institucion, nivel):
+    series = _series_institucion(piramide, institucion, nivel)
+    if series is None:
+        return None
+
+    df_m, df_gastos, df_ingresos = series
 
     # FIGURA
     fig = go.Figure()
@@ -73,31 +149,34 @@ def actualizar_grafico_institucion(data_json, institucion):
     fig.add_trace(go.Scatter(
         x=df_m.index, y=df_m["Balance"],
         mode="lines+markers",
-        name="Balance mensual", line=dict(color="blue")
+        name=f"Balance {adjetivo(nivel)}", line=dict(color="blue")
     ))
 
     fig.update_layout(
-        title=f"Evolución financiera de {institucion}",
+        title=_titulo_institucion(institucion),
         xaxis_title="Fecha",
         yaxis_title="Cantidad (€)",
         barmode="group",
         template="forest_dark"
     )
 
-    return dcc.Graph(figure=fig)
+    return fig
 
 @callback(
     Output("tabla-instituciones", "children"),
-    Input("Data", "data")
+    Input("tabs-renderizadas", "data"),
+    State("Data", "data"),
 )
-def tabla_resumen_instituciones(data_json):
-    df = df_from_store(data_json)
+def tabla_resumen_instituciones(estado_tabs, data_json):
+    comprobar_tab("tab-instituciones", estado_tabs)
 
-    if df is None or "Institution" not in df.columns:
+    cubo = cubo_from_store(data_json)
+
+    if cubo is None:
         return html.P("No se encuentra la columna 'Institution'.")
 
     # Agrupar todas las instituciones
-    resumen = df.groupby("Institution")["Amount"].sum().sort_values(ascending=False)
+    resumen = total_por(cubo, "Institution").sort_values(ascending=False)
 
     tabla = html.Table(
         [html.Tr([html.Th("Institución"), html.Th("Balance Total (€)")])] +
@@ -1,51 +1,63 @@
-from dash import Input, Output, html, dcc  # y DatePickerRange, etc. si los usas
+from dash import Input, Output, State, html, dcc  # y DatePickerRange, etc. si los usas
 import pandas as pd
 import plotly.graph_objects as go
 import plotly.express as px  # solo si lo necesitas
 
 from dash import callback
-from utils.data_utils import df_from_store
+from callbacks.pestanas import comprobar_tab
+from utils.agregados import cubo_from_store, total_por
+from utils.figuras import figura_cacheada
+from utils.geometria import config_mapa
+from utils.paises import paises_dataset
 
 
 @callback(
     Output("mapa-output", "children"),
-    Input("Data", "data"),
-    Input("mapa-metrica", "value")
+    Input("tabs-renderizadas", "data"),
+    Input("mapa-metrica", "value"),
+    State("Data", "data"),
 )
-def actualizar_mapa(data_json, metrica):
-    df = df_from_store(data_json)
-    if df is None:
+def actualizar_mapa(estado_tabs, metrica, data_json):
+    comprobar_tab("tab-mapa", estado_tabs)
+
+    cubo = cubo_from_store(data_json)
+    if cubo is None:
         return html.P("Sube un archivo para ver el mapa.")
 
-    # Asegurar columna de fecha
-    if "Date" in df.columns:
-        df["Date"] = pd.to_datetime(df["Date"])
+    # Países → ISO-3 ya resueltos al guardar el dataset
+    paises = paises_dataset(data_json, cubo["Country"])
+
+    # Una figura por dataset y métrica: cambiar de métrica y volver no la reconstruye
+    figura = figura_cacheada(data_json, "mapa", lambda: _figura_mapa(cubo, paises, metrica), metrica)
+    return dcc.Graph(figure=figura, config=config_mapa())
 
-    # Normalizamos nombre país por seguridad
-    df["Country"] = df["Country"].astype(str)
 
-    # === Cálculo según métrica ===
+def _figura_mapa(cubo, paises, metrica):
+    # === Cálculo según métrica (sobre el cubo mensual) ===
     if metrica == "gastos":
-        df_filtrado = df[df["Amount"] < 0]
-        resumen = df_filtrado.groupby("Country")["Amount"].sum().abs()
+        resumen = total_por(cubo, "Country", signo="gasto").abs()
         titulo = "Gastos totales por país (€)"
     elif metrica == "ingresos":
-        df_filtrado = df[df["Amount"] > 0]
-        resumen = df_filtrado.groupby("Country")["Amount"].sum()
+        resumen = total_por(cubo, "Country", signo="ingreso")
         titulo = "Ingresos totales por país (€)"
     else:
-        resumen = df.groupby("Country")["Amount"].sum()
+        resumen = total_por(cubo, "Country")
         titulo = "Balance total por país (€)"
 
     # Convertir a DataFrame para px.choropleth
     mapa_df = resumen.reset_index()
     mapa_df.columns = ["Country", "Value"]
 
+    # Código ISO-3 de cada país; los valores que no son un país no se dibujan
+    mapa_df = mapa_df.merge(paises, on="Country", how="left")
+    mapa_df = mapa_df[mapa_df["ISO3"].notna()]
+
     # === Crear el mapa ===
     fig = px.choropleth(
         mapa_df,
-        locations="Country",
-        locationmode="country names",
+        locations="ISO3",
+        locationmode="ISO-3",
+        hover_name="Country",
         color="Value",
         color_continuous_scale="RdYlGn",
         title=titulo,
@@ -56,4 +68,4 @@ def actualizar_mapa(data_json, metrica):
         height=600
     )
 
-    return dcc.Graph(figure=fig)
\ No newline at end of file
+    return fig
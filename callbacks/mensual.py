@@ -1,50 +1,122 @@
-from dash import Input, Output, html, dcc  # y DatePickerRange, etc. si los usas
+from dash import Input, Output, State, html, dcc  # y DatePickerRange, etc. si los usas
 import pandas as pd
 import plotly.graph_objects as go
 import plotly.express as px  # solo si lo necesitas
 
-from dash import callback
-from utils.data_utils import df_from_store
+from dash import Patch, callback, no_update
+from dash.exceptions import PreventUpdate
+from callbacks.pestanas import comprobar_tab, id_disparador
+from utils.figuras import compactar_figura, compactar_valores
+from utils.piramide import NOMBRES, adjetivo, piramide_from_store, serie_nivel, vista
+from utils.series import fijar_rango_x, puntos_a_dibujar, rango_visible, serie_saldo, ventana
+
+
+# Contenedor de los gráficos: oculto mientras no hay nada que dibujar
+OCULTO = {"display": "none"}
+VISIBLE = {"display": "block"}
 
 
 @callback(
-    Output("grafico-mensual-linea", "children"),
-    Output("grafico-mensual-barras", "children"),
-    Input("Data", "data"),
+    Output("mensual-mensaje", "children"),
+    Output("mensual-graficos", "style"),
+    Output("grafico-mensual-linea", "figure"),
+    Output("grafico-mensual-barras", "figure"),
+    Output("mensual-dibujado", "data"),
+    Input("tabs-renderizadas", "data"),
     Input("filtro-institucion", "value"),
-    Input("filtro-categoria", "value")
+    Input("filtro-categoria", "value"),
+    Input("grafico-mensual-linea", "relayoutData"),
+    Input("grafico-mensual-barras", "relayoutData"),
+    State("Data", "data"),
+    State("mensual-dibujado", "data"),
 )
-def actualizar_mensual(data_json, instituciones, categorias):
-    df = df_from_store(data_json)
+def actualizar_mensual(estado_tabs, instituciones, categorias, zoom_linea, zoom_barras, data_json, dibujado):
+    """
+    La primera vez (o con un dataset nuevo) se envían las figuras completas.
+    Después, al cambiar los filtros o hacer zoom, solo se envían los x/y de
+    las trazas (dash.Patch): layout y tema se quedan como están en el
+    navegador y los gráficos no se vuelven a montar.
+
+    La resolución sale de la pirámide temporal según el rango visible: al
+    hacer zoom en uno de los dos gráficos se reagrega el tramo (por días,
+    semanas...) y el otro gráfico se lleva al mismo rango.
+    """
+    comprobar_tab("tab-mensual", estado_tabs)
+
+    piramide = piramide_from_store(data_json)
+
+    if piramide is None:
+        return html.P("Sube un archivo para ver el análisis mensual."), OCULTO, no_update, no_update, None
+
+    disparador = id_disparador()
+    if disparador in ("grafico-mensual-linea", "grafico-mensual-barras"):
+        if dibujado != data_json:
+            # El gráfico aún no es el de este dataset: no hay nada que reagregar
+            raise PreventUpdate
+        rango = rango_visible(zoom_linea if disparador == "grafico-mensual-linea" else zoom_barras)
+    else:
+        # Cambio de filtros o dataset nuevo: vista completa
+        rango = (None, None)
+
+    nivel, inicio, fin = vista(piramide, rango)
+
+    # === APLICAR FILTROS DINÁMICOS (sobre la pirámide temporal) ===
+    df_mes, df_gastos, df_ingresos = _series_mensuales(
+        piramide, nivel, inicio, fin, Institution=instituciones, Category=categorias
+    )
+
+    if df_mes.empty and inicio is None:
+        return html.P("No hay datos para los filtros seleccionados."), OCULTO, no_update, no_update, no_update
+
+    if dibujado == data_json:
+        # Los gráficos ya existen: solo cambian los datos de las trazas
+        linea = Patch()
+        linea["data"][0]["x"] = compactar_valores(df_mes.index)
+        linea["data"][0]["y"] = compactar_valores(df_mes["Balance"])
+        linea["data"][0]["name"] = f"Balance {adjetivo(nivel)}"
+
+        barras = Patch()
+        barras["data"][0]["x"] = compactar_valores(df_ingresos.index)
+        barras["data"][0]["y"] = compactar_valores(df_ingresos)
+        barras["data"][1]["x"] = compactar_valores(df_gastos.index)
+        barras["data"][1]["y"] = compactar_valores(df_gastos)
 
-    if df is None:
-        return html.P("Sube un archivo para ver el análisis mensual."), None
+        for fig, titulo in ((linea, _titulo_linea(nivel)), (barras, _titulo_barras(nivel))):
+            fig["layout"]["title"]["text"] = titulo
+            fig["layout"]["xaxis"]["title"]["text"] = NOMBRES[nivel]
+            # Los dos gráficos muestran siempre el mismo rango
+            fijar_rango_x(fig, inicio, fin)
 
-    # Asegurar formato fecha
-    if "Date" not in df.columns:
-        return html.P("No se encontró la columna 'Date'."), None
+        return None, VISIBLE, linea, barras, no_update
 
-    df["Date"] = pd.to_datetime(df["Date"])
+    fig_linea, fig_barras = _figuras_mensuales(nivel, df_mes, df_gastos, df_ingresos)
+    return None, VISIBLE, compactar_figura(fig_linea), compactar_figura(fig_barras), data_json
 
-    # === APLICAR FILTROS DINÁMICOS ===
-    if instituciones and "Institution" in df.columns:
-        df = df[df["Institution"].isin(instituciones)]
 
-    if categorias and "Category" in df.columns:
-        df = df[df["Category"].isin(categorias)]
+def _titulo_linea(nivel):
+    return f"Balance {adjetivo(nivel)}"
 
-    if df.empty:
-        return html.P("No hay datos para los filtros seleccionados."), None
 
-    # === RESAMPLE MENSUAL ===
-    # Balance mensual total (ingresos - gastos)
-    df_mes = df.resample("ME", on="Date")["Amount"].sum().to_frame("Balance")
+def _titulo_barras(nivel):
+    return f"Ingresos y gastos {adjetivo(nivel, plural=True)}"
+
+
+def _series_mensuales(piramide, nivel, inicio=None, fin=None, **filtros):
+    # Balance por periodo (ingresos - gastos)
+    df_mes = serie_nivel(piramide, nivel, inicio=inicio, fin=fin, **filtros).to_frame("Balance")
 
     # Gastos (negativos)
-    df_gastos = df[df["Amount"] < 0].resample("ME", on="Date")["Amount"].sum()
+    df_gastos = serie_nivel(piramide, nivel, signo="gasto", inicio=inicio, fin=fin, **filtros)
 
     # Ingresos (positivos)
-    df_ingresos = df[df["Amount"] > 0].resample("ME", on="Date")["Amount"].sum()
+    df_ingresos = serie_nivel(piramide, nivel, signo="ingreso", inicio=inicio, fin=fin, **filtros)
+
+    return df_mes, df_gastos, df_ingresos
+
+
+def _figuras_mensuales(nivel, df_mes, df_gastos, df_ingresos):
+    # El orden de las trazas importa: los Patch de actualizar_mensual las
+    # referencian por posición
 
     # ==========================
     #  GRÁFICO DE LÍNEA (BALANCE)
@@ -54,13 +126,13 @@ def actualizar_mensual(data_json, instituciones, categorias):
         x=df_mes.index,
         y=df_mes["Balance"],
         mode="lines+markers",
-        name="Balance mensual",
+        name=f"Balance {adjetivo(nivel)}",
         line=dict(color="blue", width=3)
     ))
 
     fig_linea.update_layout(
-        title="Balance mensual",
-        xaxis_title="Mes",
+        title=_titulo_linea(nivel),
+        xaxis_title=NOMBRES[nivel],
         yaxis_title="Balance (€)",
         template="forest_dark"
     )
@@ -85,11 +157,68 @@ def actualizar_mensual(data_json, instituciones, categorias):
     ))
 
     fig_barras.update_layout(
-        title="Ingresos y gastos mensuales",
-        xaxis_title="Mes",
+        title=_titulo_barras(nivel),
+        xaxis_title=NOMBRES[nivel],
         yaxis_title="Cantidad (€)",
         barmode="relative",   # usar 'relative' para que gastos (negativos) vayan hacia abajo
         template="simple_white"
     )
 
-    return dcc.Graph(figure=fig_linea), dcc.Graph(figure=fig_barras)
\ No newline at end of file
+    return fig_linea, fig_barras
+
+
+@callback(
+    Output("serie-mensaje", "children"),
+    Output("grafico-serie", "style"),
+    Output("grafico-serie", "figure"),
+    Input("tabs-renderizadas", "data"),
+    Input("serie-granularidad", "value"),
+    Input("filtro-institucion", "value"),
+    Input("filtro-categoria", "value"),
+    Input("grafico-serie", "relayoutData"),
+    State("Data", "data"),
+)
+def actualizar_serie(estado_tabs, granularidad, instituciones, categorias, relayout, data_json):
+    """
+    Saldo acumulado con zoom. La vista completa va diezmada al ancho del
+    gráfico; al hacer zoom solo se reenvían los puntos de la ventana (a
+    resolución completa si caben) con un Patch, sin tocar el layout.
+    """
+    comprobar_tab("tab-mensual", estado_tabs)
+
+    serie = serie_saldo(data_json, granularidad, instituciones, categorias)
+
+    if serie is None:
+        return html.P("Sube un archivo para ver la evolución del saldo."), OCULTO, no_update
+    if serie.empty:
+        return html.P("No hay datos para los filtros seleccionados."), OCULTO, no_update
+
+    if id_disparador() == "grafico-serie":
+        rango = rango_visible(relayout)
+        puntos = puntos_a_dibujar(ventana(serie, *rango))
+        fig = Patch()
+        fig["data"][0]["x"] = compactar_valores(puntos.index)
+        fig["data"][0]["y"] = compactar_valores(puntos)
+        return no_update, no_update, fig
+
+    puntos = puntos_a_dibujar(serie)
+
+    fig = go.Figure(go.Scatter(
+        x=puntos.index,
+        y=puntos.values,
+        mode="lines",
+        name="Saldo",
+        line=dict(color="#ffb48a", width=2)
+    ))
+
+    fig.update_layout(
+        title="Saldo acumulado" + (" (diario)" if granularidad == "dia" else " (por transacción)"),
+        xaxis_title="Fecha",
+        yaxis_title="Saldo (€)",
+        hovermode="x",
+        # Se conserva el zoom mientras no cambien el dataset, la granularidad o los filtros
+        uirevision=f"{data_json}|{granularidad}|{instituciones}|{categorias}",
+        template="forest_dark"
+    )
+
+    return None, VISIBLE, compactar_figura(fig)
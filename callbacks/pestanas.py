@@ -0,0 +1,56 @@
+# callbacks/pestanas.py
+# Evaluación perezosa por pestañas: cada pestaña solo calcula sus gráficos
+# la primera vez que se abre con un dataset; al volver a ella se reutiliza
+# lo ya renderizado hasta que se sube un dataset nuevo.
+from dash import Input, Output, State, ctx
+from dash import callback
+from dash.exceptions import MissingCallbackContextException, PreventUpdate
+
+
+@callback(
+    Output("tabs-renderizadas", "data"),
+    Input("tabs-principales", "value"),
+    Input("Data", "data"),
+    State("tabs-renderizadas", "data"),
+)
+def marcar_tab_activa(tab, dataset_id, estado):
+    """
+    Guarda qué pestañas se han renderizado ya con el dataset actual.
+    Solo se actualiza (y por tanto solo dispara los callbacks de la pestaña)
+    cuando una pestaña se abre por primera vez para ese dataset.
+    """
+    if estado is None or estado.get("dataset") != dataset_id:
+        # Dataset nuevo: ninguna pestaña está al día
+        estado = {"dataset": dataset_id, "renderizadas": [], "ultima": None}
+
+    if tab in estado["renderizadas"]:
+        raise PreventUpdate
+
+    return {
+        "dataset": dataset_id,
+        "renderizadas": estado["renderizadas"] + [tab],
+        "ultima": tab,
+    }
+
+
+def id_disparador():
+    """ID del componente que ha disparado el callback (None fuera de Dash)."""
+    try:
+        return ctx.triggered_id
+    except MissingCallbackContextException:
+        # Llamada directa fuera de Dash (p. ej. benchmarks)
+        return None
+
+
+def comprobar_tab(tab, estado):
+    """
+    Llamar al principio de cada callback de una pestaña.
+    Lanza PreventUpdate si el callback se ha disparado porque otra pestaña
+    se ha abierto por primera vez; deja pasar la carga inicial y los cambios
+    en los controles de la propia pestaña.
+    """
+    if id_disparador() != "tabs-renderizadas":
+        return
+
+    if estado is None or estado.get("ultima") != tab:
+        raise PreventUpdate
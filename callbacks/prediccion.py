@@ -5,42 +5,71 @@ import plotly.graph_objects as go
 import plotly.express as px  # solo si lo necesitas
 
 from dash import callback
-from utils.data_utils import df_from_store
+from dash.exceptions import PreventUpdate
+from callbacks.pestanas import comprobar_tab
+from utils.agregados import cubo_from_store, serie_mensual
+from utils.figuras import compactar_figura
+from utils.ml import precargar_ml
+from utils.modelos import modelo_arima, puntuaciones_isolation_forest, umbral_anomalias
+
+def _sin_progreso(valor):
+    """set_progress vacío para llamar a los callbacks fuera de Dash."""
+
+
+# Los modelos se calculan en segundo plano (background=True). Un callback
+# ligero comprueba primero la pestaña y publica la petición en un Store;
+# así no se lanza ningún proceso cuando la pestaña no está activa.
+# Antes de publicar la petición se carga la pila de ML en el servidor (solo
+# la primera vez), para que los trabajos la hereden al crearse con fork.
+@callback(
+    Output("pred-peticion", "data"),
+    Input("tabs-renderizadas", "data"),
+    Input("pred-meses", "value"),
+    State("Data", "data"),
+)
+def pedir_prediccion(estado_tabs, meses_pred, data_json):
+    comprobar_tab("tab-prediccion", estado_tabs)
+    if data_json is None:
+        raise PreventUpdate
+    precargar_ml()
+    return {"dataset": data_json, "meses": meses_pred}
 
-from pmdarima import auto_arima
-from sklearn.cluster import KMeans
-from sklearn.ensemble import IsolationForest
-from sklearn.linear_model import LinearRegression
 
 @callback(
     Output("prediccion-output", "children"),
-    Input("Data", "data"),
-    Input("pred-meses", "value")
+    Input("pred-peticion", "data"),
+    background=True,
+    progress=[Output("pred-progreso", "value"), Output("pred-progreso", "max")],
+    running=[
+        (Output("pred-progreso", "style"), {"visibility": "visible", "width": "300px"},
+         {"visibility": "hidden", "width": "300px"}),
+        (Output("pred-cancelar", "disabled"), False, True),
+    ],
+    cancel=[Input("pred-cancelar", "n_clicks")],
+    prevent_initial_call=True,
 )
-def actualizar_prediccion(data_json, meses_pred):
-    df = df_from_store(data_json)
-    if df is None:
-        return html.P("Sube un archivo para ver la predicción.")
+def actualizar_prediccion(set_progress, peticion):
+    set_progress = set_progress or _sin_progreso
+    set_progress(("0", "4"))
 
-    # Asegurar fecha
-    df["Date"] = pd.to_datetime(df["Date"])
+    cubo = cubo_from_store(peticion["dataset"]) if peticion else None
+    if cubo is None:
+        return html.P("Sube un archivo para ver la predicción.")
+    meses_pred = peticion["meses"]
 
     # Solo gastos (positivizados)
-    df_mensual = (
-        df[df["Amount"] < 0]
-        .resample("ME", on="Date")["Amount"]
-        .sum()
-        .abs()
-    )
+    df_mensual = serie_mensual(cubo, signo="gasto").abs()
 
     if len(df_mensual) < 6:
         return html.P("Se necesitan al menos 6 meses de historial.")
 
     # Último mes del historial
     last_date = df_mensual.index[-1]
+    set_progress(("1", "4"))
 
-    # Modelo ARIMA automático
-    modelo = auto_arima(df_mensual, seasonal=False, error_action="ignore")
+    # Modelo ARIMA automático (cacheado por serie: cambiar los meses solo predice)
+    modelo = modelo_arima(df_mensual, seasonal=False, error_action="ignore")
+    set_progress(("3", "4"))
 
     # Predicción
     forecast, conf_int = modelo.predict(n_periods=meses_pred, return_conf_int=True)
@@ -92,29 +121,31 @@ def actualizar_prediccion(data_json, meses_pred):
         height=600
     )
 
-    return dcc.Graph(figure=fig)
+    set_progress(("4", "4"))
+    return dcc.Graph(figure=compactar_figura(fig))
 
 # === CALLBACK DE SEGMENTACIÓN AVANZADA ===
 @callback(
     Output("cluster-output", "children"),
-    Input("Data", "data")
+    Input("tabs-renderizadas", "data"),
+    State("Data", "data"),
 )
-def segmentar_meses(data_json):
+def segmentar_meses(estado_tabs, data_json):
 
-    df = df_from_store(data_json)
-    if df is None:
-        return html.P("Sube un archivo para ver la segmentación de meses.")
+    comprobar_tab("tab-prediccion", estado_tabs)
 
-    df["Date"] = pd.to_datetime(df["Date"])
+    cubo = cubo_from_store(data_json)
+    if cubo is None:
+        return html.P("Sube un archivo para ver la segmentación de meses.")
 
     # ============================
-    #  1. AGREGACIÓN MENSUAL
+    #  1. AGREGACIÓN MENSUAL (desde el cubo)
     # ============================
-    mensual = pd.DataFrame()
-    mensual["gastos_abs"] = df[df["Amount"] < 0].resample("M", on="Date")["Amount"].sum().abs()
-    mensual["ingresos"]   = df[df["Amount"] > 0].resample("M", on="Date")["Amount"].sum().abs()
-    mensual["balance"]    = df.resample("M", on="Date")["Amount"].sum()
-    mensual["n_trans"]    = df.resample("M", on="Date")["Amount"].count()
+    mensual = pd.DataFrame({"balance": serie_mensual(cubo)})
+    mensual["gastos_abs"] = serie_mensual(cubo, signo="gasto").abs()
+    mensual["ingresos"]   = serie_mensual(cubo, signo="ingreso").abs()
+    mensual["n_trans"]    = serie_mensual(cubo, medida="count")
+    mensual = mensual[["gastos_abs", "ingresos", "balance", "n_trans"]]
     mensual = mensual.dropna().reset_index()
     mensual["Mes"] = mensual["Date"]
 
@@ -161,7 +192,7 @@ def segmentar_meses(data_json):
     fig.update_traces(marker=dict(size=20))     # puntos más grandes
     fig.update_layout(height=550)               # gráfico más pequeño
 
-    grafico = dcc.Graph(figure=fig)
+    grafico = dcc.Graph(figure=compactar_figura(fig))
 
     # ===============================
     #  4. TABLA RESUMEN CLUSTERS
@@ -254,50 +285,79 @@ def segmentar_meses(data_json):
         recomendaciones
     ])
 
+# El IsolationForest se ajusta una sola vez por dataset (en segundo plano) y
+# se cachean sus puntuaciones; mover el slider de sensibilidad solo recalcula
+# el umbral sobre esas puntuaciones, sin volver a ajustar el modelo.
+@callback(
+    Output("anom-peticion", "data"),
+    Input("tabs-renderizadas", "data"),
+    State("Data", "data"),
+)
+def pedir_anomalias(estado_tabs, data_json):
+    comprobar_tab("tab-prediccion", estado_tabs)
+    if data_json is None:
+        raise PreventUpdate
+    precargar_ml()
+    return {"dataset": data_json}
+
+
+@callback(
+    Output("anom-modelo", "data"),
+    Input("anom-peticion", "data"),
+    background=True,
+    progress=[Output("anom-progreso", "value"), Output("anom-progreso", "max")],
+    running=[
+        (Output("anom-progreso", "style"), {"visibility": "visible", "width": "300px"},
+         {"visibility": "hidden", "width": "300px"}),
+        (Output("anom-cancelar", "disabled"), False, True),
+    ],
+    cancel=[Input("anom-cancelar", "n_clicks")],
+    prevent_initial_call=True,
+)
+def ajustar_anomalias(set_progress, peticion):
+    """Ajusta (o recupera de la caché) el detector para el dataset pedido."""
+    set_progress = set_progress or _sin_progreso
+    set_progress(("0", "2"))
+
+    cubo = cubo_from_store(peticion["dataset"]) if peticion else None
+    if cubo is not None:
+        gastos = serie_mensual(cubo, signo="gasto").abs()
+        if len(gastos) >= 6:
+            puntuaciones_isolation_forest(gastos, random_state=123)
+
+    set_progress(("2", "2"))
+    return peticion
+
+
 @callback(
     Output("anom-output", "children"),
-    Input("Data", "data"),
-    Input("anom-contamination", "value")
+    Input("anom-modelo", "data"),
+    Input("anom-contamination", "value"),
+    prevent_initial_call=True,
 )
-def detectar_anomalias(data_json, contamination):
+def detectar_anomalias(peticion, contamination):
     """
     Detecta meses con gasto 'anómalo' usando Isolation Forest.
     Trabaja con el gasto mensual total (solo Amount < 0, en valor absoluto).
     """
-    df = df_from_store(data_json)
+    cubo = cubo_from_store(peticion["dataset"]) if peticion else None
 
-    if df is None:
+    if cubo is None:
         return html.P("Sube un archivo para ver la detección de anomalías.")
 
-    # Aseguramos formato fecha
-    if "Date" not in df.columns or "Amount" not in df.columns:
-        return html.P("No se encuentran las columnas 'Date' y 'Amount' necesarias.")
-
-    df["Date"] = pd.to_datetime(df["Date"])
-
     # Serie mensual de gastos (en valor absoluto, para que sea positiva)
-    gastos_mensuales = (
-        df[df["Amount"] < 0]
-        .resample("ME", on="Date")["Amount"]
-        .sum()
-        .abs()
-        .to_frame(name="Gasto")
-    )
+    gastos_mensuales = serie_mensual(cubo, signo="gasto").abs().to_frame(name="Gasto")
 
     if len(gastos_mensuales) < 6:
         return html.P("Se necesitan al menos 6 meses de historial de gastos para detectar anomalías.")
 
-    # ----- Modelo IsolationForest -----
-    modelo = IsolationForest(
-        contamination=float(contamination),
-        random_state=123
-    )
+    # ----- Modelo IsolationForest (puntuaciones cacheadas) -----
+    puntuaciones = puntuaciones_isolation_forest(gastos_mensuales["Gasto"], random_state=123)
 
-    modelo.fit(gastos_mensuales[["Gasto"]])
-    pred = modelo.predict(gastos_mensuales[["Gasto"]])  # 1 = normal, -1 = anómalo
-    score = modelo.decision_function(gastos_mensuales[["Gasto"]])
+    # La sensibilidad solo mueve el umbral: equivale a contamination=... en el modelo
+    es_anomalo, score = umbral_anomalias(puntuaciones, float(contamination))
 
-    gastos_mensuales["Es_anomalo"] = (pred == -1)
+    gastos_mensuales["Es_anomalo"] = es_anomalo
     gastos_mensuales["Score"] = score
 
     # Separamos normales y anómalos para el gráfico
@@ -353,7 +413,7 @@ def detectar_anomalias(data_json, contamination):
         )
 
     return html.Div([
-        dcc.Graph(figure=fig),
+        dcc.Graph(figure=compactar_figura(fig)),
         html.H4("Meses detectados como anómalos", style={"textAlign": "center", "marginTop": "20px"}),
         tabla_html
     ])
@@ -363,23 +423,31 @@ def detectar_anomalias(data_json, contamination):
     Output("recom-output", "children"),
     Input("recom-calc", "n_clicks"),
     State("Data", "data"),
+    background=True,
+    progress=[Output("recom-progreso", "value"), Output("recom-progreso", "max")],
+    running=[
+        (Output("recom-calc", "disabled"), True, False),
+        (Output("recom-progreso", "style"), {"visibility": "visible", "width": "300px"},
+         {"visibility": "hidden", "width": "300px"}),
+        (Output("recom-cancelar", "disabled"), False, True),
+    ],
+    cancel=[Input("recom-cancelar", "n_clicks")],
+    prevent_initial_call=True,
 )
-def recomendaciones_ahorro(n_clicks, data_json):
+def recomendaciones_ahorro(set_progress, n_clicks, data_json):
+    set_progress = set_progress or _sin_progreso
 
     if n_clicks == 0:
         return ""
 
-    df = df_from_store(data_json)
-    if df is None:
+    cubo = cubo_from_store(data_json)
+    if cubo is None:
         return html.P("Sube un archivo primero.")
 
     # --- Preparar datos ---
-    df["Date"] = pd.to_datetime(df["Date"])
-
-    # ingresos y gastos por mes
-    mensual = df.resample("ME", on="Date")["Amount"].sum().to_frame("Balance")
-    gastos = df[df["Amount"] < 0].resample("ME", on="Date")["Amount"].sum().abs()
-    ingresos = df[df["Amount"] > 0].resample("ME", on="Date")["Amount"].sum()
+    # ingresos y gastos por mes (desde el cubo)
+    gastos = serie_mensual(cubo, signo="gasto").abs()
+    ingresos = serie_mensual(cubo, signo="ingreso")
 
     df_ml = pd.DataFrame({
         "Ingresos": ingresos,
@@ -393,6 +461,8 @@ def recomendaciones_ahorro(n_clicks, data_json):
     X = df_ml[["Ingresos"]]
     y = df_ml["Gastos"]
 
+    from sklearn.linear_model import LinearRegression
+
     modelo = LinearRegression()
     modelo.fit(X, y)
 
@@ -405,8 +475,10 @@ def recomendaciones_ahorro(n_clicks, data_json):
     # 2) REGLAS INTELIGENTES DE AHORRO
     # ============================================================
     recomendaciones = []
+    total_meses = len(df_ml)
 
-    for mes, row in df_ml.iterrows():
+    for i, (mes, row) in enumerate(df_ml.iterrows()):
+        set_progress((str(i + 1), str(total_meses)))
 
         ingreso = row["Ingresos"]
         gasto_real = row["Gastos"]
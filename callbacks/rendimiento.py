@@ -0,0 +1,40 @@
+# callbacks/rendimiento.py
+# Panel de rendimiento (opcional, PANEL_RENDIMIENTO=1): las mismas métricas
+# que /metrics, resumidas por callback y refrescadas cada pocos segundos.
+from dash import Input, Output, dash_table
+
+from dash import callback
+from utils.metricas import resumen_metricas
+
+COLUMNAS_PANEL = [
+    {"name": "Callback", "id": "callback"},
+    {"name": "Llamadas", "id": "llamadas"},
+    {"name": "Errores", "id": "errores"},
+    {"name": "Media (ms)", "id": "media_ms"},
+    {"name": "p50 (ms)", "id": "p50_ms"},
+    {"name": "p95 (ms)", "id": "p95_ms"},
+    {"name": "CPU media (ms)", "id": "cpu_ms"},
+    {"name": "Respuesta máx. (KB)", "id": "salida_kb_max"},
+    {"name": "Aciertos caché", "id": "aciertos_cache"},
+    {"name": "Fallos caché", "id": "fallos_cache"},
+]
+
+
+@callback(
+    Output("rendimiento-output", "children"),
+    Input("rendimiento-intervalo", "n_intervals"),
+)
+def actualizar_rendimiento(n_intervals):
+    """
+    Tabla con las métricas de cada callback en este proceso.
+    El intervalo vive dentro de la pestaña, así que solo refresca
+    mientras el panel está abierto.
+    """
+    return dash_table.DataTable(
+        data=resumen_metricas(),
+        columns=COLUMNAS_PANEL,
+        sort_action="native",
+        sort_by=[{"column_id": "p95_ms", "direction": "desc"}],
+        style_cell={"textAlign": "left", "padding": "5px"},
+        style_header={"fontWeight": "bold"},
+    )
@@ -1,32 +1,38 @@
 # callbacks/resumen.py
-from dash import Input, Output, html, dcc
+from dash import Input, Output, State, html, dcc
 import pandas as pd
 import plotly.graph_objects as go
 
-from dash import callback
-from utils.data_utils import df_from_store
+from dash import Patch, callback
+from dash.exceptions import PreventUpdate
+from callbacks.pestanas import comprobar_tab
+from utils.agregados import cubo_from_store, filtrar_cubo, serie_mensual
+from utils.figuras import compactar_valores, figura_cacheada
+from utils.piramide import adjetivo, piramide_from_store, serie_nivel, vista
+from utils.series import fijar_rango_x, rango_visible
 
 @callback(
     Output("kpi-container", "children"),
-    Input("Data", "data")
+    Input("tabs-renderizadas", "data"),
+    State("Data", "data"),
 )
-def actualizar_kpis(data_json):
-    df = df_from_store(data_json)
+def actualizar_kpis(estado_tabs, data_json):
+    comprobar_tab("tab-resumen", estado_tabs)
 
-    if df is None:
-        return [html.P("Sube un archivo para ver el resumen.")]
+    cubo = cubo_from_store(data_json)
 
-    if "Date" in df.columns:
-        df["Date"] = pd.to_datetime(df["Date"])
+    if cubo is None:
+        return [html.P("Sube un archivo para ver el resumen.")]
 
-    total_gastado = df[df["Amount"] < 0]["Amount"].sum()
-    total_ingresos = df[df["Amount"] > 0]["Amount"].sum()
-    balance = df["Amount"].sum()
+    # Todos los KPIs salen del cubo mensual, sin recorrer las transacciones
+    total_gastado = filtrar_cubo(cubo, signo="gasto")["sum"].sum()
+    total_ingresos = filtrar_cubo(cubo, signo="ingreso")["sum"].sum()
+    balance = cubo["sum"].sum()
 
-    df_mensual = df.resample("ME", on="Date")["Amount"].sum()
+    df_mensual = serie_mensual(cubo)
     media_mensual = df_mensual.mean()
 
-    num_transacciones = len(df)
+    num_transacciones = int(cubo["count"].sum())
 
     def formato(eur):
         return f"{eur:,.2f} €".replace(",", ".").replace(".", ",", 1)
@@ -54,20 +60,66 @@ def actualizar_kpis(data_json):
 
 @callback(
     Output("grafico-resumen", "children"),
-    Input("Data", "data")
+    Input("tabs-renderizadas", "data"),
+    State("Data", "data"),
 )
-def actualizar_graficos_resumen(data_json):
-    df = df_from_store(data_json)
+def actualizar_graficos_resumen(estado_tabs, data_json):
+    comprobar_tab("tab-resumen", estado_tabs)
 
-    if df is None:
+    piramide = piramide_from_store(data_json)
+
+    if piramide is None:
         return html.P("Sube un archivo para ver los gráficos.")
 
-    df["Date"] = pd.to_datetime(df["Date"])
+    # Solo depende del dataset: se construye una vez y después sale de la caché
+    nivel, _, _ = vista(piramide)
+    figura = figura_cacheada(data_json, "resumen", lambda: _figura_resumen(piramide, nivel))
+    return dcc.Graph(id="grafico-resumen-figura", figure=figura)
+
+
+@callback(
+    Output("grafico-resumen-figura", "figure"),
+    Input("grafico-resumen-figura", "relayoutData"),
+    State("Data", "data"),
+)
+def reagregar_resumen(zoom, data_json):
+    """
+    Zoom en el gráfico del resumen: se reagrega el tramo visible con la
+    pirámide temporal (días, semanas...) y solo se envían las trazas.
+    """
+    rango = rango_visible(zoom)
+    piramide = piramide_from_store(data_json)
+    if piramide is None:
+        raise PreventUpdate
+
+    nivel, inicio, fin = vista(piramide, rango)
+    df_mensual, df_gastos, df_ingresos = _series_resumen(piramide, nivel, inicio, fin)
+
+    fig = Patch()
+    for i, serie in enumerate((df_gastos, df_ingresos, df_mensual["Balance"])):
+        fig["data"][i]["x"] = compactar_valores(serie.index)
+        fig["data"][i]["y"] = compactar_valores(serie)
+    fig["data"][2]["name"] = f"Balance {adjetivo(nivel)}"
+    fig["layout"]["title"]["text"] = _titulo_resumen(nivel)
+    fijar_rango_x(fig, inicio, fin)
+    return fig
+
+
+def _titulo_resumen(nivel):
+    return f"Resumen financiero {adjetivo(nivel)}"
+
+
+def _series_resumen(piramide, nivel, inicio=None, fin=None):
+    df_mensual = serie_nivel(piramide, nivel, inicio=inicio, fin=fin).to_frame("Balance")
+
+    df_gastos = serie_nivel(piramide, nivel, signo="gasto", inicio=inicio, fin=fin)
+    df_ingresos = serie_nivel(piramide, nivel, signo="ingreso", inicio=inicio, fin=fin)
+    return df_mensual, df_gastos, df_ingresos
 
-    df_mensual = df.resample("ME", on="Date")["Amount"].sum().to_frame("Balance")
 
-    df_gastos = df[df["Amount"] < 0].resample("ME", on="Date")["Amount"].sum()
-    df_ingresos = df[df["Amount"] > 0].resample("ME", on="Date")["Amount"].sum()
+def _figura_resumen(piramide, nivel):
+    # El orden de las trazas importa: reagregar_resumen las referencia por posición
+    df_mensual, df_gastos, df_ingresos = _series_resumen(piramide, nivel)
 
     fig = go.Figure()
 
@@ -89,16 +141,16 @@ def actualizar_graficos_resumen(data_json):
         x=df_mensual.index,
         y=df_mensual["Balance"],
         mode="lines+markers",
-        name="Balance mensual",
+        name=f"Balance {adjetivo(nivel)}",
         line=dict(color="blue")
     ))
 
     fig.update_layout(
-        title="Resumen financiero mensual",
+        title=_titulo_resumen(nivel),
         xaxis_title="Fecha",
         yaxis_title="Cantidad (€)",
         barmode="group",
         template="forest_dark"
     )
 
-    return dcc.Graph(figure=fig)
\ No newline at end of file
+    return fig
@@ -1,47 +1,126 @@
 # callbacks/upload.py
+import base64
+
 from dash import Input, Output, State, html
 import dash
 import pandas as pd
 
-from dash import callback
-from utils.data_utils import parse_contents
+from dash import callback, clientside_callback
+from callbacks.pestanas import id_disparador
+from utils.data_utils import guardar_dataset, dataset_ya_cargado, df_from_store
+from utils.incremental import anadir_dataset
+from utils.lotes import leer_lote
+from utils.persistencia import hash_origen
+from utils.subida import mensaje_carga
+
+# Los ficheros grandes se suben por la ruta /subir (assets/subida.js); el
+# script deja la respuesta en window.subidaResultado y este callback de
+# cliente la recoge sin hacer ninguna petición al servidor. El intervalo
+# solo se activa al pulsar el botón y se apaga al recoger la respuesta (o si
+# se cierra el selector sin elegir fichero): sin subidas no hay consultas.
+clientside_callback(
+    """
+    function(n_clicks, n_intervals) {
+        var resultado = window.subidaResultado;
+        if (resultado) {
+            window.subidaResultado = null;
+            window.subidaPendiente = false;
+            return [resultado, true];
+        }
+        return [window.dash_clientside.no_update, !window.subidaPendiente];
+    }
+    """,
+    Output("subida-resultado", "data"),
+    Output("subida-intervalo", "disabled"),
+    Input("subida-boton", "n_clicks"),
+    Input("subida-intervalo", "n_intervals"),
+    prevent_initial_call=True,
+)
+
+
+def _cargar(contents, filename):
+    """Parsea y guarda los archivos de dcc.Upload. Devuelve (mensaje, dataset_id)."""
+    if not contents:
+        return "No hay ningún archivo cargado.", None
+
+    # Con multiple=True dcc.Upload entrega listas (uno o varios archivos)
+    if not isinstance(contents, list):
+        contents, filename = [contents], [filename]
+    nombre = ", ".join(filename)
+
+    origen = hash_origen("".join(contents))
+    dataset_id, df = dataset_ya_cargado(origen)
+    if df is not None:
+        return mensaje_carga(df, nombre), dataset_id
+
+    # Zip, libros con varias hojas y varios archivos se leen como un lote
+    archivos = [(f, base64.b64decode(c.split(",")[1])) for c, f in zip(contents, filename)]
+    df = leer_lote(archivos)
+    if df is None:
+        return "Error al leer el archivo. Debe ser CSV, Excel o ZIP con al menos las columnas 'Date' y 'Amount'.", None
+
+    mensaje = mensaje_carga(df, nombre)
+
+    dataset_id = guardar_dataset(df, origen=origen)
+
+    return mensaje, dataset_id
+
+
+def _anadir(base_id, nuevo_id, filename):
+    """Añade el dataset recién cargado al que ya estaba en Data."""
+    resultado = anadir_dataset(base_id, nuevo_id)
+    if resultado is None:
+        return "No se pudo añadir el archivo: vuelve a cargar el histórico.", dash.no_update
+
+    dataset_id, anadidas, duplicadas = resultado
+    total = len(df_from_store(dataset_id))
+    mensaje = (
+        f"Archivo '{filename}' añadido. Transacciones nuevas: {anadidas}. "
+        f"Duplicadas descartadas: {duplicadas}. Total: {total} filas."
+    )
+    return mensaje, dataset_id
+
 
 @callback(
     Output("upload-status", "children"),
     Output("Data", "data"),
     Input("upload-data", "contents"),
+    Input("subida-resultado", "data"),
     State("upload-data", "filename"),
+    State("modo-carga", "value"),
+    State("Data", "data"),
 )
-def update_output(contents, filename):
+def update_output(contents, resultado_subida, filename, modo, data_actual):
     """
-    Cuando el usuario sube un archivo, este callback:
-    - lo convierte en DataFrame
-    - lo guarda en Data como JSON
+    Cuando el usuario sube uno o varios archivos (CSV, Excel o ZIP), este callback:
+    - los convierte en DataFrame (todas las hojas y miembros del zip)
+    - lo normaliza al esquema canónico del ledger (tipos, categorías, flags)
+    - lo guarda en la caché del servidor (Data solo guarda su ID)
     - muestra un mensaje de estado
+    Si el mismo archivo ya se había cargado antes, se reabre su copia
+    columnar en disco en lugar de volver a parsearlo.
+    Si el archivo llegó por la subida en streaming (/subir), ya viene
+    parseado y guardado: solo se publica su ID y el mensaje.
+    En modo "añadir", el archivo se incorpora al dataset actual en lugar
+    de sustituirlo.
     """
 
-    if contents is None:
-        return "No hay ningún archivo cargado.", dash.no_update
-
-    df = parse_contents(contents, filename)
-    if df is None:
-        return "Error al leer el archivo. Asegúrate de que es CSV o Excel.", dash.no_update
-
-    filas = len(df)
-    columnas = list(df.columns)
+    if id_disparador() == "subida-resultado":
+        if not resultado_subida:
+            return dash.no_update, dash.no_update
+        mensaje = resultado_subida["mensaje"]
+        dataset_id = resultado_subida.get("dataset")
+        filename = resultado_subida.get("nombre")
+    else:
+        mensaje, dataset_id = _cargar(contents, filename)
+        if isinstance(filename, list):
+            filename = ", ".join(filename)
 
-    rango_fechas = ""
-    for col in df.columns:
-        if "date" in col.lower():
-            try:
-                df[col] = pd.to_datetime(df[col])
-                rango_fechas = f" | Rango de fechas: {df[col].min().date()} – {df[col].max().date()}"
-            except Exception:
-                pass
-            break
+    if not dataset_id:
+        return mensaje, dash.no_update
 
-    mensaje = f"Archivo '{filename}' cargado correctamente. Filas: {filas}. Columnas: {', '.join(columnas)}{rango_fechas}"
+    if modo == "anadir" and data_actual and data_actual != dataset_id:
+        return _anadir(data_actual, dataset_id, filename)
 
-    data_json = df.to_json(date_format="iso", orient="split")
+    return mensaje, dataset_id
 
-    return mensaje, data_json
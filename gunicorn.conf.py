@@ -0,0 +1,18 @@
+# gunicorn.conf.py
+# gunicorn lee este archivo en el proceso maestro al arrancar.
+import os
+
+# Con PRECARGAR_ML=1 la pila de ML se importa una sola vez en el maestro y
+# los workers la heredan al hacer fork (páginas compartidas): cada worker
+# nuevo arranca sin pagar esos segundos de importación. Por defecto se carga
+# de forma perezosa al abrir la pestaña Predicción.
+if os.environ.get("PRECARGAR_ML", "0") == "1":
+    from utils.ml import precargar_ml
+
+    precargar_ml()
+
+# Geometría de los mapas: sin assets/topojson/ (python -m utils.geometria)
+# no se arranca, salvo con MAPAS_CDN=1 (ver utils/geometria.py)
+from utils.geometria import exigir_geometria  # noqa: E402
+
+exigir_geometria()
@@ -0,0 +1,14 @@
+# tests/conftest.py
+# Configuración común de las pruebas (python -m pytest).
+import os
+import sys
+import tempfile
+
+# Cachés en disco en un directorio temporal: las pruebas no tocan cache/.
+# Se fija antes de importar la app, que lee estas variables al cargarse.
+_TMP = tempfile.mkdtemp(prefix="tests-dashboard-")
+os.environ.setdefault("DATASETS_DIR", os.path.join(_TMP, "datasets"))
+os.environ.setdefault("JOBS_DIR", os.path.join(_TMP, "jobs"))
+os.environ.setdefault("CACHE_DIR", os.path.join(_TMP, "compartida"))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
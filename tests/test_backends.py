@@ -0,0 +1,131 @@
+# tests/test_backends.py
+# BackendRedis contra un servidor RESP falso en memoria (sin Redis real).
+import fnmatch
+import socketserver
+import threading
+
+import numpy as np
+import pytest
+
+from utils import backends
+from utils.backends import BackendDisco, BackendRedis, clave_compartida
+
+
+class _ServidorRESP(socketserver.ThreadingTCPServer):
+    """Servidor RESP mínimo: GET, SET (con EX), EXISTS, DEL y SCAN (en una sola vuelta)."""
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _ManejadorRESP)
+        self.datos = {}
+        self.expiraciones = {}
+
+
+class _ManejadorRESP(socketserver.StreamRequestHandler):
+    def _comando(self):
+        linea = self.rfile.readline()
+        if not linea:
+            return None
+        args = []
+        for _ in range(int(linea[1:-2])):
+            longitud = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(longitud + 2)[:-2])
+        return args
+
+    def handle(self):
+        datos = self.server.datos
+        while True:
+            args = self._comando()
+            if args is None:
+                return
+            orden = args[0].upper()
+            if orden == b"GET":
+                valor = datos.get(args[1])
+                if valor is None:
+                    self.wfile.write(b"$-1\r\n")
+                else:
+                    self.wfile.write(b"$%d\r\n%s\r\n" % (len(valor), valor))
+            elif orden == b"SET":
+                datos[args[1]] = args[2]
+                if len(args) == 5 and args[3].upper() == b"EX":
+                    self.server.expiraciones[args[1]] = int(args[4])
+                self.wfile.write(b"+OK\r\n")
+            elif orden == b"EXISTS":
+                self.wfile.write(b":%d\r\n" % (args[1] in datos))
+            elif orden == b"DEL":
+                self.wfile.write(b":%d\r\n" % sum(datos.pop(k, None) is not None for k in args[1:]))
+            elif orden == b"SCAN":
+                patron = args[args.index(b"MATCH") + 1].decode()
+                claves = [k for k in datos if fnmatch.fnmatchcase(k.decode(), patron)]
+                respuesta = b"*2\r\n$1\r\n0\r\n*%d\r\n" % len(claves)
+                respuesta += b"".join(b"$%d\r\n%s\r\n" % (len(k), k) for k in claves)
+                self.wfile.write(respuesta)
+            else:
+                self.wfile.write(b"-ERR comando no soportado\r\n")
+
+
+@pytest.fixture
+def servidor():
+    servidor = _ServidorRESP()
+    hilo = threading.Thread(target=servidor.serve_forever, daemon=True)
+    hilo.start()
+    yield servidor
+    servidor.shutdown()
+    servidor.server_close()
+
+
+@pytest.fixture
+def backend(servidor):
+    host, puerto = servidor.server_address
+    return BackendRedis(f"redis://{host}:{puerto}/0")
+
+
+def test_ida_y_vuelta(backend, servidor):
+    valor = {"serie": np.arange(1000, dtype=np.uint64), "texto": "ñandú €", "n": 3}
+    backend.escribir("clave", valor, expiracion=60)
+
+    leido = backend.leer("clave")
+    assert leido["texto"] == valor["texto"] and leido["n"] == 3
+    np.testing.assert_array_equal(leido["serie"], valor["serie"])
+    assert servidor.expiraciones[b"clave"] == 60
+
+
+def test_contiene_y_borrar(backend):
+    assert backend.leer("no-existe") is None
+    assert not backend.contiene("k")
+
+    backend.escribir("k", [1, 2, 3])
+    assert backend.contiene("k")
+
+    backend.borrar("k")
+    assert not backend.contiene("k")
+    assert backend.leer("k") is None
+
+
+def test_vaciar_solo_claves_de_las_caches(backend, servidor):
+    backend.escribir(clave_compartida("cubos", "ds1"), 1)
+    backend.escribir(clave_compartida("modelos", ("a", 2), version=1), 2)
+    servidor.datos[b"otra-app:clave"] = b"x"
+
+    backend.vaciar()
+    assert list(servidor.datos) == [b"otra-app:clave"]
+
+
+def test_valor_grande(backend):
+    # Varios MB: la respuesta llega en muchos trozos del socket
+    valor = np.random.default_rng(0).random(1_000_000)
+    backend.escribir("grande", valor)
+    np.testing.assert_array_equal(backend.leer("grande"), valor)
+
+
+def test_error_del_servidor(backend):
+    with pytest.raises(RuntimeError):
+        backend._comando("PING")
+
+
+def test_backend_obligatorio_con_memoria(monkeypatch):
+    # Con CACHE_BACKEND=memoria no hay backend, salvo para lo que lo exige
+    monkeypatch.setattr(backends, "TIPO_BACKEND", "memoria")
+    assert backends.backend_compartido() is None
+    assert isinstance(backends.backend_compartido(obligatorio=True), BackendDisco)
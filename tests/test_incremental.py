@@ -0,0 +1,101 @@
+# tests/test_incremental.py
+# El modo "añadir" actualiza cubo, pirámide e índices solo con las filas
+# nuevas: el resultado debe ser el mismo que reconstruirlos desde cero.
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.generador import generar_ledger
+from utils import agregados, indices, piramide
+from utils.data_utils import concatenar_ledgers, df_from_store, guardar_dataset
+from utils.incremental import anadir_dataset
+
+
+def _normalizar(tabla):
+    """Categóricas a texto y filas ordenadas: el orden de las categorías puede cambiar."""
+    tabla = tabla.copy()
+    for columna in tabla.columns:
+        if isinstance(tabla[columna].dtype, pd.CategoricalDtype):
+            tabla[columna] = tabla[columna].astype(str)
+    claves = [c for c in tabla.columns if c not in ("sum", "count", "min", "max")]
+    return tabla.sort_values(claves).reset_index(drop=True)
+
+
+@pytest.fixture(scope="module")
+def anadido():
+    """(ID del dataset ampliado, nº de añadidas, nº de repetidas)."""
+    base = generar_ledger(5000, semilla=1)
+    base.loc[base.index[:7], "Description"] = None
+    base_id = guardar_dataset(base)
+
+    # Estructuras de la base ya calculadas, como tras usar la app
+    agregados.cubo_from_store(base_id)
+    piramide.piramide_from_store(base_id)
+    indices.indices_from_store(base_id)
+
+    # Extracto nuevo: meses posteriores, categorías y comercios que la base
+    # no tiene, filas sin descripción y 50 transacciones ya cargadas
+    nuevo = generar_ledger(800, semilla=2)
+    nuevo["Date"] = nuevo["Date"] + pd.Timedelta(days=400)
+    nuevo["Category"] = nuevo["Category"].cat.add_categories(["AAA Nueva"])
+    nuevo["Description"] = nuevo["Description"].cat.add_categories(["ZZ nuevo comercio"])
+    nuevo.loc[nuevo.index[:10], "Category"] = "AAA Nueva"
+    nuevo.loc[nuevo.index[10:15], "Description"] = None
+    nuevo.loc[nuevo.index[15:20], "Description"] = "ZZ nuevo comercio"
+    nuevo = concatenar_ledgers([nuevo, base.iloc[100:150]])
+
+    return anadir_dataset(base_id, guardar_dataset(nuevo))
+
+
+def test_cuenta_repetidas(anadido):
+    dataset_id, anadidas, repetidas = anadido
+    assert (anadidas, repetidas) == (800, 50)
+    assert len(df_from_store(dataset_id)) == 5800
+
+
+def test_cubo_igual_que_reconstruido(anadido):
+    dataset_id = anadido[0]
+    incremental = agregados._cubos.get(dataset_id)
+    assert incremental is not None
+
+    completo = agregados.construir_cubo(df_from_store(dataset_id))
+    pd.testing.assert_frame_equal(_normalizar(incremental), _normalizar(completo), check_dtype=False)
+
+
+def test_piramide_igual_que_reconstruida(anadido):
+    dataset_id = anadido[0]
+    incremental = piramide._piramides.get(dataset_id)
+    assert incremental is not None
+
+    completa = piramide.construir_piramide(df_from_store(dataset_id))
+    for nivel in piramide.NIVELES:
+        pd.testing.assert_frame_equal(
+            _normalizar(incremental[nivel]), _normalizar(completa[nivel]), check_dtype=False
+        )
+
+
+def test_indices_igual_que_reconstruidos(anadido):
+    dataset_id = anadido[0]
+    incremental = indices._indices.get(dataset_id)
+    assert incremental is not None
+
+    df = df_from_store(dataset_id)
+    completo = indices.IndicesLedger(df)
+    assert incremental.n_filas == completo.n_filas
+
+    for texto in ["market", "zz nuevo", "a", "sin resultados xyz"]:
+        np.testing.assert_array_equal(
+            incremental.descripcion.buscar(texto), completo.descripcion.buscar(texto)
+        )
+        np.testing.assert_array_equal(
+            incremental.descripcion.buscar_prefijo(texto), completo.descripcion.buscar_prefijo(texto)
+        )
+    np.testing.assert_array_equal(incremental.descripcion._limites, completo.descripcion._limites)
+
+    desde, hasta = (np.datetime64(df["Date"].quantile(q)) for q in (0.3, 0.9))
+    np.testing.assert_array_equal(
+        np.sort(incremental.fecha.rango(desde, hasta)), np.sort(completo.fecha.rango(desde, hasta))
+    )
+    np.testing.assert_array_equal(
+        np.sort(incremental.importe.rango(-50, 20)), np.sort(completo.importe.rango(-50, 20))
+    )
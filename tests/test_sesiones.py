@@ -0,0 +1,40 @@
+# tests/test_sesiones.py
+# Un dataset solo se sirve a las sesiones que lo han subido.
+import pytest
+
+import app
+from benchmarks.generador import generar_ledger
+from utils.data_utils import df_from_store, guardar_dataset
+from utils.sesiones import COOKIE_SESION
+
+
+def _en_sesion(sesion_id, funcion):
+    """Ejecuta `funcion` dentro de una petición con la cookie de sesión indicada."""
+    cabeceras = {"Cookie": f"{COOKIE_SESION}={sesion_id}"}
+    with app.server.test_request_context("/", headers=cabeceras):
+        app.server.preprocess_request()
+        return funcion()
+
+
+@pytest.fixture(scope="module")
+def dataset_id():
+    """Dataset subido por la sesión "propietaria"."""
+    ledger = generar_ledger(500, semilla=7)
+    return _en_sesion("propietaria", lambda: guardar_dataset(ledger))
+
+
+def test_solo_la_sesion_que_lo_sube(dataset_id):
+    assert _en_sesion("propietaria", lambda: df_from_store(dataset_id)) is not None
+    assert _en_sesion("otra", lambda: df_from_store(dataset_id)) is None
+
+    # Fuera de una petición (scripts, benchmarks) no hay sesión que comprobar
+    assert df_from_store(dataset_id) is not None
+
+
+def test_informe_de_sesiones_solo_la_propia(dataset_id):
+    _en_sesion("otra", lambda: guardar_dataset(generar_ledger(100, semilla=8)))
+
+    cliente = app.server.test_client()
+    cliente.set_cookie("localhost", COOKIE_SESION, "propietaria")
+    sesiones = cliente.get("/sesiones").get_json()["sesiones"]
+    assert [s["sesion"] for s in sesiones] == ["propieta"]
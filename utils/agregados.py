@@ -0,0 +1,159 @@
+# utils/agregados.py
+import os
+
+import pandas as pd
+
+from utils.cache import CacheLRU
+from utils.data_utils import derivado_from_store
+
+# === CUBO MENSUAL ===
+# Agregado precalculado que alimenta todas las pestañas:
+#   Mes × Category × Subcategory × Institution × Country × Signo
+# con las medidas sum, count, min y max del importe.
+DIMENSIONES_CUBO = ["Mes", "Category", "Subcategory", "Institution", "Country", "Signo"]
+MEDIDAS_CUBO = ["sum", "count", "min", "max"]
+
+SIGNOS = ["gasto", "ingreso", "cero"]
+
+_cubos = CacheLRU(
+    max_items=int(os.environ.get("DATASET_CACHE_ITEMS", 8)),
+    ttl=int(os.environ.get("DATASET_CACHE_TTL", 4 * 3600)),
+    max_bytes=int(os.environ.get("CUBO_CACHE_MB", 256)) * 1024 ** 2,
+    nombre="cubos",
+    compartida=True,
+)
+
+
+def construir_cubo(df):
+    """Agrega el ledger canónico al cubo mensual (una fila por combinación observada)."""
+    # Redondeamos a céntimos para que las sumas no arrastren el error de representación
+    importe = df["Amount"].astype("float64").round(2)
+
+    # Mes etiquetado con su último día, igual que resample("ME")
+    mes = df["Date"].dt.to_period("M").dt.end_time.dt.normalize()
+
+    signo = pd.Series(
+        pd.Categorical.from_codes(
+            (importe > 0).astype("int8") + 2 * (importe == 0).astype("int8"),
+            categories=SIGNOS,
+        ),
+        index=df.index,
+    )
+
+    agrupado = pd.DataFrame({
+        "Mes": mes,
+        "Category": df["Category"],
+        "Subcategory": df["Subcategory"],
+        "Institution": df["Institution"],
+        "Country": df["Country"],
+        "Signo": signo,
+        "Amount": importe,
+    })
+
+    cubo = (
+        agrupado
+        .groupby(DIMENSIONES_CUBO, observed=True, dropna=False, sort=False)["Amount"]
+        .agg(MEDIDAS_CUBO)
+        .reset_index()
+    )
+    return cubo
+
+
+def cubo_from_store(dataset_id):
+    """
+    Devuelve el cubo mensual del dataset guardado en Data.
+    Se construye una sola vez por dataset (aunque lo pidan a la vez varios
+    workers) y después se sirve desde caché.
+    """
+    return derivado_from_store(_cubos, dataset_id, construir_cubo)
+
+
+def actualizar_cubo(cubo_base, cubo_nuevo, ledger):
+    """
+    Cubo del ledger ampliado a partir del cubo anterior y del de las filas
+    añadidas: solo se reagregan los meses afectados; el resto se reutiliza.
+    `ledger` es el ledger ya ampliado (de él salen las categorías comunes).
+    """
+    # Mismas categorías en las dos partes para que concat siga siendo categórico
+    partes = []
+    for cubo in (cubo_base, cubo_nuevo):
+        cubo = cubo.copy()
+        for col in DIMENSIONES_CUBO:
+            if col in ledger.columns:
+                cubo[col] = cubo[col].cat.set_categories(ledger[col].cat.categories)
+        partes.append(cubo)
+    cubo_base, cubo_nuevo = partes
+
+    afectados = cubo_base["Mes"].isin(cubo_nuevo["Mes"].unique())
+
+    reagregado = (
+        pd.concat([cubo_base[afectados], cubo_nuevo], ignore_index=True)
+        .groupby(DIMENSIONES_CUBO, observed=True, dropna=False, sort=False)
+        .agg({"sum": "sum", "count": "sum", "min": "min", "max": "max"})
+        .reset_index()
+    )
+
+    return pd.concat([cubo_base[~afectados], reagregado], ignore_index=True)
+
+
+def ampliar_cubo(base_id, nuevas, ledger):
+    """
+    Cubo del dataset ampliado actualizando solo los meses de las filas
+    nuevas. None si el cubo de la base no está calculado (se construirá
+    entero la primera vez que se pida).
+    """
+    cubo_base = _cubos.get(base_id)
+    if cubo_base is None:
+        return None
+    return actualizar_cubo(cubo_base, construir_cubo(nuevas), ledger)
+
+
+def guardar_cubo(dataset_id, cubo):
+    _cubos.set(dataset_id, cubo)
+
+
+def filtrar_cubo(cubo, signo=None, **filtros):
+    """
+    Filtra el cubo por signo ('gasto', 'ingreso') y por dimensiones.
+    Cada filtro acepta un valor o una lista de valores, p. ej. Institution=["Sofi"].
+    """
+    if signo is not None:
+        cubo = cubo[cubo["Signo"] == signo]
+
+    for dimension, valores in filtros.items():
+        if not valores:
+            continue
+        if not isinstance(valores, (list, tuple, set)):
+            valores = [valores]
+        cubo = cubo[cubo[dimension].isin([str(v) for v in valores])]
+
+    return cubo
+
+
+def serie_mensual(cubo, signo=None, medida="sum", **filtros):
+    """
+    Serie mensual equivalente a df.resample("ME", on="Date")["Amount"].<medida>()
+    sobre las transacciones filtradas: cubre desde el primer hasta el último mes
+    con datos y rellena los meses vacíos con 0 (sum/count).
+    """
+    c = filtrar_cubo(cubo, signo=signo, **filtros)
+    if c.empty:
+        return pd.Series(dtype="float64", name="Amount")
+
+    agregacion = {"sum": "sum", "count": "sum", "min": "min", "max": "max"}[medida]
+    serie = c.groupby("Mes")[medida].agg(agregacion).sort_index()
+
+    meses = pd.date_range(serie.index.min(), serie.index.max(), freq="ME", name="Date")
+    if medida in ("sum", "count"):
+        serie = serie.reindex(meses, fill_value=0)
+    else:
+        serie = serie.reindex(meses)
+
+    serie.name = "Amount"
+    return serie
+
+
+def total_por(cubo, dimension, signo=None, **filtros):
+    """Suma del importe agrupada por una dimensión del cubo."""
+    c = filtrar_cubo(cubo, signo=signo, **filtros)
+    return c.groupby(dimension, observed=True)["sum"].sum()
@@ -0,0 +1,185 @@
+# utils/backends.py
+# Segundo nivel de las cachés (cubos, índices, modelos...): un almacén
+# compartido por todos los workers de gunicorn, para que la siguiente
+# petición de un usuario no tenga que recalcular nada aunque la atienda
+# otro proceso. Se elige con CACHE_BACKEND:
+#
+#   memoria → sin segundo nivel: cada proceso guarda solo lo suyo.
+#   disco   → diskcache (SQLite + ficheros) en CACHE_DIR; por defecto.
+#   redis   → cualquier servidor que hable el protocolo de Redis
+#             (Redis, Valkey, KeyDB...) en CACHE_REDIS_URL.
+#
+# Las claves llevan la versión del formato y el nombre de la caché; los
+# valores se guardan con pickle.
+import hashlib
+import os
+import pickle
+import socket
+import threading
+from urllib.parse import urlparse
+
+import diskcache
+
+# Versión del formato de las entradas: cambiarla invalida todo lo guardado
+VERSION_CACHE = 1
+
+TIPO_BACKEND = os.environ.get("CACHE_BACKEND", "disco")
+
+DIRECTORIO_CACHE = os.environ.get(
+    "CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache", "compartida"),
+)
+
+# Tamaño máximo en disco (diskcache expulsa lo menos usado al superarlo)
+LIMITE_DISCO_BYTES = int(os.environ.get("CACHE_DISCO_MB", 4096)) * 1024 ** 2
+
+REDIS_URL = os.environ.get("CACHE_REDIS_URL", "redis://localhost:6379/0")
+
+# Segundos que una entrada vive en el backend compartido
+EXPIRACION = int(os.environ.get("CACHE_EXPIRACION", 7 * 24 * 3600))
+
+
+class BackendDisco:
+    """diskcache: seguro entre procesos, y con límite de tamaño en disco."""
+
+    def __init__(self, directorio=DIRECTORIO_CACHE, limite_bytes=LIMITE_DISCO_BYTES):
+        self._cache = diskcache.Cache(directorio, size_limit=limite_bytes)
+
+    def leer(self, clave):
+        return self._cache.get(clave)
+
+    def escribir(self, clave, valor, expiracion=EXPIRACION):
+        self._cache.set(clave, valor, expire=expiracion)
+
+    def contiene(self, clave):
+        return clave in self._cache
+
+    def borrar(self, clave):
+        self._cache.delete(clave)
+
+    def vaciar(self):
+        self._cache.clear()
+
+
+class BackendRedis:
+    """
+    Cliente mínimo del protocolo de Redis (RESP): GET, SET, EXISTS, DEL y
+    SCAN bastan, así que no hace falta el paquete redis. Una conexión por hilo.
+    """
+
+    def __init__(self, url=REDIS_URL, timeout=5):
+        partes = urlparse(url)
+        self.direccion = (partes.hostname or "localhost", partes.port or 6379)
+        self.password = partes.password
+        self.db = int((partes.path or "/0").lstrip("/") or 0)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _conexion(self):
+        conexion = getattr(self._local, "conexion", None)
+        if conexion is None:
+            sock = socket.create_connection(self.direccion, timeout=self.timeout)
+            conexion = (sock, sock.makefile("rb"))
+            self._local.conexion = conexion
+            if self.password:
+                self._comando("AUTH", self.password)
+            if self.db:
+                self._comando("SELECT", self.db)
+        return conexion
+
+    def _comando(self, *args):
+        sock, lector = self._conexion()
+        partes = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            dato = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            partes.append(b"$%d\r\n%s\r\n" % (len(dato), dato))
+        try:
+            sock.sendall(b"".join(partes))
+            return self._respuesta(lector)
+        except OSError:
+            # Conexión rota: la siguiente llamada abre otra
+            self._local.conexion = None
+            sock.close()
+            raise
+
+    def _respuesta(self, lector):
+        linea = lector.readline()
+        if not linea:
+            raise ConnectionError("El servidor cerró la conexión")
+        tipo, resto = linea[:1], linea[1:-2]
+        if tipo == b"+":
+            return resto
+        if tipo == b"-":
+            raise RuntimeError(resto.decode("utf-8", "replace"))
+        if tipo == b":":
+            return int(resto)
+        if tipo == b"$":
+            longitud = int(resto)
+            if longitud < 0:
+                return None
+            dato = lector.read(longitud + 2)
+            return dato[:-2]
+        if tipo == b"*":
+            return [self._respuesta(lector) for _ in range(int(resto))]
+        raise RuntimeError(f"Respuesta no reconocida: {linea!r}")
+
+    def leer(self, clave):
+        dato = self._comando("GET", clave)
+        return None if dato is None else pickle.loads(dato)
+
+    def escribir(self, clave, valor, expiracion=EXPIRACION):
+        self._comando("SET", clave, pickle.dumps(valor, protocol=pickle.HIGHEST_PROTOCOL), "EX", expiracion)
+
+    def contiene(self, clave):
+        return self._comando("EXISTS", clave) == 1
+
+    def borrar(self, clave):
+        self._comando("DEL", clave)
+
+    def vaciar(self):
+        """Borra las entradas de las cachés (solo las claves de este formato: la base puede ser compartida)."""
+        cursor = b"0"
+        while True:
+            cursor, claves = self._comando("SCAN", cursor, "MATCH", f"v{VERSION_CACHE}:*", "COUNT", 1000)
+            if claves:
+                self._comando("DEL", *claves)
+            if cursor == b"0":
+                return
+
+
+_BACKENDS = {"disco": BackendDisco, "redis": BackendRedis}
+
+_backends = {}
+_pid_backends = None
+_lock = threading.Lock()
+
+
+def backend_compartido(obligatorio=False):
+    """
+    Backend configurado (None con CACHE_BACKEND=memoria). Se abre la primera
+    vez que se usa en cada proceso: tras un fork no se heredan conexiones.
+    Con obligatorio=True nunca devuelve None: con CACHE_BACKEND=memoria se
+    usa el de disco, para lo que tiene que sobrevivir al proceso que lo
+    calcula (p. ej. los modelos ajustados en un trabajo en segundo plano).
+    """
+    global _pid_backends
+    tipo = TIPO_BACKEND if TIPO_BACKEND in _BACKENDS else ("disco" if obligatorio else None)
+    if tipo is None:
+        return None
+    with _lock:
+        if _pid_backends != os.getpid():
+            _backends.clear()
+            _pid_backends = os.getpid()
+        if tipo not in _backends:
+            _backends[tipo] = _BACKENDS[tipo]()
+        return _backends[tipo]
+
+
+def clave_compartida(cache, clave, version=0):
+    """
+    Clave en el backend: versión del formato + caché + versión de la caché +
+    clave. Las claves que no son texto (tuplas) se resumen con un hash.
+    """
+    if not isinstance(clave, str):
+        clave = hashlib.sha1(repr(clave).encode("utf-8")).hexdigest()[:24]
+    return f"v{VERSION_CACHE}:{cache}:{version}:{clave}"
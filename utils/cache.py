@@ -0,0 +1,205 @@
+# utils/cache.py
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+from utils.backends import backend_compartido, clave_compartida
+from utils.jobs import trabajo_exclusivo
+from utils.metricas import registrar_cache
+
+# Cachés con nombre: el gestor de sesiones y las métricas las recorren
+CACHES = {}
+
+
+def tamano_objeto(valor):
+    """Estimación (en bytes) de la memoria que ocupa un objeto cacheado."""
+    if isinstance(valor, (pd.DataFrame, pd.Series)):
+        uso = valor.memory_usage(deep=True)
+        return int(uso.sum()) if isinstance(valor, pd.DataFrame) else int(uso)
+    if hasattr(valor, "tamano_bytes"):
+        return int(valor.tamano_bytes())
+    # Contenedores (p. ej. la pirámide temporal, un dict de DataFrames): se suma su contenido
+    if isinstance(valor, dict):
+        return sys.getsizeof(valor) + sum(tamano_objeto(k) + tamano_objeto(v) for k, v in valor.items())
+    if isinstance(valor, (list, tuple)):
+        return sys.getsizeof(valor) + sum(tamano_objeto(v) for v in valor)
+    return sys.getsizeof(valor)
+
+
+class CacheLRU:
+    """
+    Caché en memoria con expulsión LRU, caducidad (TTL) y presupuesto de memoria.
+
+    - max_items: número máximo de entradas.
+    - ttl: segundos que una entrada puede pasar sin usarse antes de caducar.
+    - max_bytes: memoria total permitida; al superarla se expulsan las
+      entradas menos usadas recientemente.
+    - nombre: registra la caché en CACHES (memoria por sesión, métricas).
+    - compartida: si es True, cada entrada se guarda también en el backend
+      compartido (utils/backends.py). get() busca allí lo que no está en
+      memoria: lo calculado por otro worker o lo expulsado por falta de
+      memoria se recupera sin recalcularlo. Con compartida="siempre" se
+      guarda también con CACHE_BACKEND=memoria (en el backend de disco).
+    - version: cambiarla invalida lo guardado en el backend para esta caché.
+    """
+
+    def __init__(self, max_items=8, ttl=3600, max_bytes=512 * 1024 ** 2, nombre=None,
+                 compartida=False, version=0):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.nombre = nombre
+        self.compartida = bool(compartida) and nombre is not None
+        self._backend_obligatorio = compartida == "siempre"
+        self.version = version
+        self._datos = OrderedDict()   # clave -> (valor, tamaño, último acceso)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        if nombre is not None:
+            CACHES[nombre] = self
+
+    def get(self, clave, default=None):
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is not None:
+                valor, tamano, ultimo = entrada
+                if self.ttl and time.monotonic() - ultimo > self.ttl:
+                    self._quitar(clave)
+                else:
+                    # Marcamos la entrada como la más reciente
+                    self._datos[clave] = (valor, tamano, time.monotonic())
+                    self._datos.move_to_end(clave)
+                    registrar_cache(True)
+                    return valor
+
+        # No está en memoria: se busca en el backend compartido
+        valor = self._leer_compartida(clave)
+        if valor is None:
+            registrar_cache(False)
+            return default
+
+        registrar_cache(True)
+        self._guardar(clave, valor)
+        return valor
+
+    def set(self, clave, valor):
+        self._guardar(clave, valor)
+        self._escribir_compartida(clave, valor)
+
+    def _guardar(self, clave, valor):
+        tamano = tamano_objeto(valor)
+        with self._lock:
+            if clave in self._datos:
+                self._quitar(clave)
+
+            self._datos[clave] = (valor, tamano, time.monotonic())
+            self._bytes += tamano
+            self._expulsar()
+
+    def construir_exclusivo(self, clave, construir):
+        """
+        Tras un fallo de get(): llama a construir() y guarda el resultado,
+        pero una sola vez aunque lo pidan a la vez varios workers. Los demás
+        esperan al cerrojo y se llevan lo que guardó el primero.
+        """
+        with trabajo_exclusivo(f"{self.nombre}-{clave_compartida(self.nombre, clave, self.version)}"):
+            # Otro worker puede haberlo construido mientras esperábamos
+            valor = self.get(clave)
+            if valor is None:
+                valor = construir()
+                if valor is not None:
+                    self.set(clave, valor)
+        return valor
+
+    def __contains__(self, clave):
+        return self.get(clave) is not None
+
+    def __len__(self):
+        return len(self._datos)
+
+    def pop(self, clave, default=None):
+        with self._lock:
+            if clave not in self._datos:
+                return default
+            return self._quitar(clave)
+
+    def clear(self):
+        with self._lock:
+            self._datos.clear()
+            self._bytes = 0
+
+    @property
+    def bytes_usados(self):
+        return self._bytes
+
+    def claves(self):
+        with self._lock:
+            return list(self._datos)
+
+    def bytes_de(self, claves):
+        """Memoria que ocupan las entradas indicadas (las que estén en memoria)."""
+        with self._lock:
+            return sum(self._datos[c][1] for c in claves if c in self._datos)
+
+    def desalojar(self, claves):
+        """
+        Saca de memoria las entradas indicadas (si la caché es compartida,
+        siguen en el backend). Devuelve los bytes liberados.
+        """
+        with self._lock:
+            presentes = [c for c in claves if c in self._datos]
+            liberados = sum(self._datos[c][1] for c in presentes)
+            for c in presentes:
+                self._quitar(c)
+        return liberados
+
+    def _quitar(self, clave):
+        valor, tamano, _ = self._datos.pop(clave)
+        self._bytes -= tamano
+        return valor
+
+    def _expulsar(self):
+        """Aplica TTL, número de entradas y presupuesto de memoria."""
+        ahora = time.monotonic()
+
+        # 1) Entradas caducadas
+        if self.ttl:
+            caducadas = [c for c, (_, _, t) in self._datos.items() if ahora - t > self.ttl]
+            for clave in caducadas:
+                self._quitar(clave)
+
+        # 2) LRU hasta cumplir número de entradas y presupuesto de memoria
+        #    (la entrada recién insertada siempre se conserva)
+        while len(self._datos) > 1 and (
+            len(self._datos) > self.max_items or self._bytes > self.max_bytes
+        ):
+            self._quitar(next(iter(self._datos)))
+
+    # === BACKEND COMPARTIDO ===
+    def _escribir_compartida(self, clave, valor):
+        if not self.compartida:
+            return
+        backend = backend_compartido(obligatorio=self._backend_obligatorio)
+        if backend is None:
+            return
+        try:
+            backend.escribir(clave_compartida(self.nombre, clave, self.version), valor)
+        except Exception as e:
+            # Sin backend la caché sigue funcionando, solo que por proceso
+            print("No se pudo guardar la entrada en la caché compartida:", e)
+
+    def _leer_compartida(self, clave):
+        if not self.compartida:
+            return None
+        backend = backend_compartido(obligatorio=self._backend_obligatorio)
+        if backend is None:
+            return None
+        try:
+            return backend.leer(clave_compartida(self.nombre, clave, self.version))
+        except Exception as e:
+            print("No se pudo leer de la caché compartida:", e)
+            return None
@@ -1,38 +1,276 @@
 # utils/data_utils.py
-import base64
-import io
+import hashlib
+import os
+import numpy as np
 import pandas as pd
+from pandas.api.types import union_categoricals
 
-def parse_contents(contents, filename):
+from utils.cache import CacheLRU
+from utils.paises import guardar_paises
+from utils.persistencia import (
+    cargar_columnar, dataset_de_origen, guardar_columnar, marcar_uso, registrar_origen,
+)
+from utils.sesiones import autorizar, registrar_uso, tiene_acceso
+
+# Caché de datasets en el servidor: el dcc.Store("Data") solo guarda el ID
+# del dataset y el DataFrame ya parseado vive aquí.
+_datasets = CacheLRU(
+    max_items=int(os.environ.get("DATASET_CACHE_ITEMS", 8)),
+    ttl=int(os.environ.get("DATASET_CACHE_TTL", 4 * 3600)),
+    max_bytes=int(os.environ.get("DATASET_CACHE_MB", 1024)) * 1024 ** 2,
+    nombre="datasets",
+)
+
+# === MODELO CANÓNICO DEL LEDGER ===
+COLUMNAS_LEDGER = [
+    "Institution", "Category", "Subcategory", "Date", "Description",
+    "Country", "Amount", "Recurrent", "Tax Deduction", "Source",
+]
+DIMENSIONES = ["Institution", "Category", "Subcategory", "Country"]
+FLAGS = ["Recurrent", "Tax Deduction"]
+
+_VALORES_VERDADEROS = {"true", "yes", "y", "si", "sí", "s", "1", "x", "verdadero"}
+
+
+def _a_booleano(serie):
+    """Convierte una columna de flags (bool, 0/1, 'Yes', 'TRUE'...) a booleanos."""
+    if serie.dtype == bool:
+        return serie
+    return serie.astype("string").str.strip().str.lower().isin(_VALORES_VERDADEROS)
+
+
+def _a_categoria(serie):
+    """Pasa una dimensión a categórica de strings (evita mezclas str/int)."""
+    valores = serie.astype("string").str.strip().to_numpy(dtype=object, na_value=None)
+    return pd.Series(pd.Categorical(valores), index=serie.index)
+
+
+def normalizar_ledger(df, fuente=None):
+    """
+    Construye el ledger canónico a partir del DataFrame leído del archivo.
+    Se ejecuta una sola vez al subir el archivo:
+    - Date → datetime64
+    - Institution, Category, Subcategory, Country, Description → categóricas
+    - Amount → float64 (float32 no guarda los céntimos de importes grandes)
+    - Recurrent, Tax Deduction → booleanos
+    - Source → archivo/hoja de origen (`fuente`) si el archivo no la trae
+    Devuelve None si faltan las columnas imprescindibles (Date y Amount).
+    """
+    if df is None or "Date" not in df.columns or "Amount" not in df.columns:
+        return None
+
+    ledger = pd.DataFrame(index=df.index)
+
+    for col in COLUMNAS_LEDGER:
+        if col not in df.columns:
+            # Columna opcional ausente: la creamos vacía para respetar el esquema
+            if col in FLAGS:
+                ledger[col] = False
+            elif col == "Source" and fuente is not None:
+                ledger[col] = pd.Categorical.from_codes(np.zeros(len(df), dtype="int8"), categories=[fuente])
+            elif col in ("Date", "Amount"):
+                continue
+            else:
+                ledger[col] = pd.Categorical([None] * len(df))
+            continue
+
+        if col == "Date":
+            ledger[col] = pd.to_datetime(df[col], errors="coerce")
+        elif col == "Amount":
+            ledger[col] = pd.to_numeric(df[col], errors="coerce").astype("float64")
+        elif col in FLAGS:
+            ledger[col] = _a_booleano(df[col])
+        else:
+            ledger[col] = _a_categoria(df[col])
+
+    # Descartamos filas sin fecha o sin importe válidos
+    ledger = ledger.dropna(subset=["Date", "Amount"]).reset_index(drop=True)
+
+    return ledger
+
+
+def concatenar_ledgers(partes, ordenar_categorias=True):
     """
-    Recibe el contenido codificado y el nombre del archivo,
-    devuelve un DataFrame de pandas.
+    Une varios trozos ya normalizados en un único ledger.
+    Las columnas categóricas se unen con union_categoricals para que el
+    resultado siga siendo categórico (pd.concat las convertiría a object).
+    Con ordenar_categorias=False se conservan los códigos del primer trozo
+    y las categorías nuevas se añaden al final (lo usan los añadidos
+    incrementales para poder ampliar los índices en lugar de rehacerlos).
     """
-    if contents is None or filename is None:
+    partes = [p for p in partes if p is not None and len(p) > 0]
+    if not partes:
         return None
+    if len(partes) == 1:
+        return partes[0]
+
+    columnas = {}
+    for col in partes[0].columns:
+        if isinstance(partes[0][col].dtype, pd.CategoricalDtype):
+            columnas[col] = union_categoricals([p[col] for p in partes], sort_categories=ordenar_categorias)
+        else:
+            columnas[col] = np.concatenate([p[col].to_numpy() for p in partes])
+
+    return pd.DataFrame(columnas)
 
-    content_type, content_string = contents.split(",")
 
-    # Decodificar el contenido base64
-    decoded = base64.b64decode(content_string)
+def _bloques_excel(ruta, filas_por_bloque):
+    """Lee la primera hoja de un .xlsx fila a fila (modo solo lectura) en bloques."""
+    from openpyxl import load_workbook
+
+    libro = load_workbook(ruta, read_only=True, data_only=True)
+    try:
+        filas = libro.worksheets[0].iter_rows(values_only=True)
+        cabecera = next(filas, None)
+        if cabecera is None:
+            return
+        cabecera = [str(c).strip() if c is not None else "" for c in cabecera]
 
+        bloque = []
+        for fila in filas:
+            bloque.append(fila)
+            if len(bloque) >= filas_por_bloque:
+                yield pd.DataFrame(bloque, columns=cabecera)
+                bloque = []
+        if bloque:
+            yield pd.DataFrame(bloque, columns=cabecera)
+    finally:
+        libro.close()
+
+
+def leer_archivo_por_bloques(ruta, filename, filas_por_bloque=100_000, progreso=None):
+    """
+    Lee un CSV/Excel desde disco por bloques y devuelve el ledger normalizado.
+    Cada bloque se normaliza (tipos compactos) antes de leer el siguiente, así
+    la memoria máxima se mantiene cerca del tamaño final del DataFrame.
+    `progreso(filas_leidas)` se llama tras cada bloque si se indica.
+    """
+    nombre = filename.lower()
     try:
-        # Según la extensión del archivo, usamos read_csv o read_excel
-        if filename.lower().endswith(".csv"):
-            df = pd.read_csv(io.StringIO(decoded.decode("utf-8")))
-        elif filename.lower().endswith((".xls", ".xlsx")):
-            df = pd.read_excel(io.BytesIO(decoded))
+        if nombre.endswith(".csv"):
+            bloques = pd.read_csv(ruta, chunksize=filas_por_bloque)
+        elif nombre.endswith(".xlsx"):
+            bloques = _bloques_excel(ruta, filas_por_bloque)
+        elif nombre.endswith(".xls"):
+            # El formato antiguo no admite lectura en streaming
+            bloques = [pd.read_excel(ruta)]
         else:
             return None
+
+        partes = []
+        filas_leidas = 0
+        for bloque in bloques:
+            parte = normalizar_ledger(bloque, fuente=filename)
+            if parte is None:
+                return None
+            partes.append(parte)
+            filas_leidas += len(bloque)
+            if progreso is not None:
+                progreso(filas_leidas)
     except Exception as e:
         print("Error al leer el archivo:", e)
         return None
 
+    return concatenar_ledgers(partes)
+
+
+def hash_dataframe(df):
+    """Hash del contenido de un DataFrame (columnas + valores)."""
+    h = hashlib.sha1()
+    h.update("|".join(map(str, df.columns)).encode("utf-8"))
+    h.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return h.hexdigest()[:20]
+
+
+def guardar_dataset(df, origen=None, dataset_id=None):
+    """
+    Guarda el DataFrame en la caché del servidor (y su copia columnar en
+    disco) y devuelve su ID (hash del contenido), que es lo único que se
+    envía al navegador. `origen` es el hash del archivo subido, para no
+    volver a parsearlo si se sube otra vez. Los datasets derivados (p. ej.
+    un añadido incremental) pueden pasar ya su `dataset_id`.
+    """
+    if dataset_id is None:
+        dataset_id = hash_dataframe(df)
+    _datasets.set(dataset_id, df)
+    guardar_columnar(dataset_id, df)
+    # Dimensión de países (Country → ISO-3) para el mapa, una vez por dataset
+    guardar_paises(dataset_id, df)
+    autorizar(dataset_id)
+    registrar_uso(dataset_id)
+    if origen is not None:
+        registrar_origen(origen, dataset_id)
+    return dataset_id
+
+
+def _cargar_dataset(dataset_id):
+    """DataFrame del dataset: caché en memoria → copia columnar en disco."""
+    df = _datasets.get(dataset_id)
+    if df is None:
+        df = cargar_columnar(dataset_id)
+        if df is not None:
+            _datasets.set(dataset_id, df)
     return df
 
 
-def df_from_store(data_json):
-    """Convierte el JSON guardado en Data a un DataFrame pandas."""
-    if data_json is None:
+def dataset_ya_cargado(origen):
+    """
+    Si el archivo con hash `origen` ya se convirtió antes (en esta sesión,
+    en otro worker o antes de un reinicio), devuelve (dataset_id, df).
+    Si no, devuelve (None, None).
+    """
+    dataset_id = dataset_de_origen(origen)
+    if dataset_id is None:
+        return None, None
+
+    df = _cargar_dataset(dataset_id)
+    if df is None:
+        return None, None
+    # Quien sube el mismo archivo puede usar el dataset ya convertido
+    autorizar(dataset_id)
+    return dataset_id, df
+
+
+def df_from_store(dataset_id):
+    """
+    Recupera el DataFrame asociado al ID guardado en Data.
+    Si ya no está en memoria se reabre la copia columnar del disco;
+    devuelve None si no hay dataset, si no existe en ningún sitio o si la
+    sesión no lo ha subido.
+    """
+    if dataset_id is None or not tiene_acceso(dataset_id):
+        return None
+
+    df = _cargar_dataset(dataset_id)
+    if df is None:
+        return None
+    registrar_uso(dataset_id)
+    # Mientras se use, su copia en disco no es de las que se borran primero
+    marcar_uso(dataset_id)
+
+    # Copia superficial: no duplica los datos, pero evita que las
+    # asignaciones de columnas de un callback modifiquen la caché.
+    return df.copy(deep=False)
+
+
+def derivado_from_store(cache, dataset_id, construir, clave=None):
+    """
+    Estructura derivada del dataset (cubo, índices, pirámide...) guardada en
+    `cache` bajo `clave` (por defecto el ID del dataset). Si no está, se
+    construye con construir(df) una sola vez aunque la pidan a la vez varios
+    workers. Devuelve None si no hay dataset o la sesión no tiene acceso.
+    """
+    if dataset_id is None or not tiene_acceso(dataset_id):
+        return None
+
+    clave = dataset_id if clave is None else clave
+    valor = cache.get(clave)
+    if valor is not None:
+        registrar_uso(dataset_id)
+        marcar_uso(dataset_id)
+        return valor
+
+    df = df_from_store(dataset_id)
+    if df is None:
         return None
-    return pd.read_json(data_json, orient="split")
+    return cache.construir_exclusivo(clave, lambda: construir(df))
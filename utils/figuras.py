@@ -0,0 +1,182 @@
+# utils/figuras.py
+# Caché de figuras de Plotly ya serializadas. Construir un go.Figure valida
+# cada traza y cuesta bastante más que leer su JSON: las figuras que solo
+# dependen del dataset y de los controles se guardan por
+# (dataset, figura, valores de los controles) y volver a una vista ya vista
+# es solo una búsqueda en la caché.
+#
+# Las figuras se envían además en formato compacto: arrays numéricos en
+# base64 (typed arrays), importes redondeados a céntimos, fechas sin la
+# hora cuando es medianoche y la plantilla por nombre. assets/figuras.js
+# lo expande en el navegador antes de dibujar.
+import base64
+import datetime
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import plotly.io as pio
+from flask import Response
+from plotly.io.json import to_json_plotly
+
+from utils.cache import CacheLRU
+
+# Cambiarla invalida las figuras guardadas (p. ej. al modificar una figura
+# o el tema forest_dark): la caché compartida sobrevive a los reinicios
+VERSION_FIGURAS = 5
+
+_figuras = CacheLRU(
+    max_items=int(os.environ.get("FIGURAS_CACHE_ITEMS", 256)),
+    ttl=int(os.environ.get("DATASET_CACHE_TTL", 4 * 3600)),
+    max_bytes=int(os.environ.get("FIGURAS_CACHE_MB", 64)) * 1024 ** 2,
+    nombre="figuras",
+    compartida=True,
+    version=VERSION_FIGURAS,
+)
+
+
+def figura_cacheada(dataset_id, nombre, construir, *valores):
+    """
+    Devuelve la figura (dict compacto listo para dcc.Graph) de `nombre`
+    para el dataset y los valores de los controles. Si no está en caché se
+    llama a construir(), que devuelve un go.Figure (o None si no hay nada
+    que dibujar), y se guarda ya serializada: un dict de tipos JSON que se
+    devuelve tal cual, sin volver a validarlo ni a convertirlo.
+    """
+    clave = (dataset_id, nombre, *valores)
+
+    figura = _figuras.get(clave)
+    if figura is None:
+        fig = construir()
+        if fig is None:
+            return None
+        # Se serializa una sola vez, al construirla (numpy, fechas... → JSON)
+        figura = json.loads(to_json_plotly(compactar_figura(fig)))
+        _figuras.set(clave, figura)
+
+    return figura
+
+
+# === SERIALIZACIÓN COMPACTA ===
+# Plantillas que el navegador ya tiene (las sirve /plantillas.js)
+PLANTILLAS_COMPARTIDAS = ("forest_dark", "simple_white")
+
+# Arrays más cortos van como lista JSON: con pocos valores base64 no compensa
+MIN_ELEMENTOS_BINARIO = 16
+
+# Atributos de las trazas que contienen datos (el resto es estilo)
+CAMPOS_DATOS = {"x", "y", "z", "values", "lat", "lon", "customdata", "base", "size", "color"}
+
+_json_plantillas = {}
+
+
+def _json_plantilla(nombre):
+    if nombre not in _json_plantillas:
+        _json_plantillas[nombre] = pio.templates[nombre].to_plotly_json()
+    return _json_plantillas[nombre]
+
+
+def _es_fecha(valor):
+    return isinstance(valor, (datetime.date, np.datetime64))
+
+
+def _binario(valores, tipo, **extra):
+    return {"dtype": tipo, "bdata": base64.b64encode(valores.astype("<" + tipo).tobytes()).decode("ascii"), **extra}
+
+
+def compactar_valores(valores, decimales=2):
+    """
+    Array de una traza en formato compacto. Con pocos valores, lista JSON
+    (fechas en ISO, números redondeados a `decimales`); con más, typed
+    array en base64 como los de plotly.js ({"dtype", "bdata"}) más dos
+    campos propios que entiende assets/figuras.js:
+    - "escala": los importes viajan como enteros de céntimos (i4) y se
+      multiplican por la escala al decodificar;
+    - "unidad": fechas como días ("D", i4) o segundos ("s", f8) desde 1970.
+    Lo que no son números ni fechas se devuelve tal cual.
+    """
+    if isinstance(valores, (pd.Index, pd.Series)):
+        valores = valores.to_numpy()
+    elif isinstance(valores, (list, tuple)):
+        valores = np.asarray(valores) if valores else valores
+    if not isinstance(valores, np.ndarray) or valores.ndim != 1 or len(valores) == 0:
+        return valores
+
+    corto = len(valores) < MIN_ELEMENTOS_BINARIO
+
+    if valores.dtype == object and _es_fecha(valores[0]):
+        valores = pd.DatetimeIndex(valores).to_numpy()
+    if valores.dtype.kind == "M":
+        dias = valores.astype("datetime64[D]")
+        unidad = "D" if (valores == dias).all() else "s"
+        if corto:
+            return np.datetime_as_string(valores, unit=unidad).tolist()
+        if unidad == "D":
+            return _binario(dias.astype("int64"), "i4", unidad="D")
+        return _binario(valores.astype("datetime64[s]").astype("int64"), "f8", unidad="s")
+
+    if valores.dtype.kind not in "iuf":
+        return valores.tolist()
+    if valores.dtype.kind == "f" and decimales is not None:
+        valores = valores.astype("float64").round(decimales)
+
+    if corto:
+        # NaN → None (null en JSON): huecos en la línea
+        return [None if v != v else v for v in valores.tolist()]
+
+    if valores.dtype.kind in "iu":
+        enteros, escala = valores, None
+    elif decimales is not None and np.isfinite(valores).all():
+        enteros, escala = np.rint(valores * 10 ** decimales), 10.0 ** -decimales
+    else:
+        return _binario(valores, "f8")
+
+    if np.abs(enteros).max() >= 2 ** 31:
+        return _binario(valores, "f8")
+    if escala is None:
+        return _binario(enteros, "i4")
+    return _binario(enteros, "i4", escala=escala)
+
+
+def _compactar_traza(traza, decimales):
+    compacta = {}
+    for clave, valor in traza.items():
+        if isinstance(valor, dict):
+            compacta[clave] = _compactar_traza(valor, decimales)
+        elif clave in CAMPOS_DATOS:
+            compacta[clave] = compactar_valores(valor, decimales)
+        else:
+            compacta[clave] = valor
+    return compacta
+
+
+def compactar_figura(fig, decimales=2):
+    """
+    dict de la figura listo para dcc.Graph con los datos de las trazas
+    compactados y, si usa una de PLANTILLAS_COMPARTIDAS, solo su nombre.
+    `decimales=None` no redondea (datos que no son importes).
+    """
+    figura = fig.to_plotly_json()
+    figura["data"] = [_compactar_traza(traza, decimales) for traza in figura["data"]]
+
+    plantilla = figura["layout"].get("template")
+    if plantilla is not None:
+        for nombre in PLANTILLAS_COMPARTIDAS:
+            if nombre in pio.templates and plantilla == _json_plantilla(nombre):
+                figura["layout"]["template"] = nombre
+                break
+
+    return figura
+
+
+def registrar_ruta_plantillas(server):
+    """GET /plantillas.js: las plantillas compartidas, para assets/figuras.js."""
+
+    @server.route("/plantillas.js")
+    def plantillas():
+        plantillas = {n: pio.templates[n] for n in PLANTILLAS_COMPARTIDAS if n in pio.templates}
+        return Response(
+            f"window.plantillasFiguras = {to_json_plotly(plantillas)};",
+            mimetype="application/javascript",
+        )
@@ -0,0 +1,140 @@
+# utils/geometria.py
+# Geometría de los mapas servida por la propia aplicación. plotly.js
+# descarga el topojson del mundo de cdn.plot.ly en cada carga, lo que falla
+# en máquinas sin salida a internet. Si assets/topojson/ contiene los
+# ficheros (world_110m.json...), los mapas los piden a /geometria/<versión>/
+# con caché de un año: la versión es un hash del contenido, así que al
+# cambiar la geometría cambia la URL.
+#
+# Descargarlos es un paso obligatorio del despliegue: en una máquina con red
+# y antes de copiar la app a la máquina sin salida a internet,
+#   python -m utils.geometria              (termina con error si falla)
+#   python -m utils.geometria --comprobar  (solo comprueba que están)
+# gunicorn (gunicorn.conf.py) no arranca sin ellos salvo con MAPAS_CDN=1.
+import hashlib
+import json
+import os
+import sys
+import urllib.request
+
+from dash import get_relative_path
+from flask import abort, send_from_directory
+
+DIRECTORIO_GEOMETRIA = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "assets", "topojson"
+)
+
+# Los que pide plotly.js para mapas del mundo (<scope>_<resolución>m.json)
+FICHEROS_GEOMETRIA = ["world_110m.json", "world_50m.json"]
+
+URL_CDN = "https://cdn.plot.ly/"
+TIMEOUT_DESCARGA = 30
+
+# Un año: la URL lleva la versión, así que el navegador no tiene que revalidar
+CACHE_SEGUNDOS = 365 * 24 * 3600
+
+# Con MAPAS_CDN=1 se acepta arrancar sin geometría local (mapas desde la CDN)
+PERMITIR_CDN = os.environ.get("MAPAS_CDN", "0") == "1"
+
+_version = None
+
+
+def version_geometria():
+    """Hash de los ficheros de geometría locales, o None si no está world_110m.json."""
+    global _version
+    if _version is None:
+        if not os.path.exists(os.path.join(DIRECTORIO_GEOMETRIA, FICHEROS_GEOMETRIA[0])):
+            return None
+        h = hashlib.sha1()
+        for nombre in FICHEROS_GEOMETRIA:
+            ruta = os.path.join(DIRECTORIO_GEOMETRIA, nombre)
+            if os.path.exists(ruta):
+                with open(ruta, "rb") as f:
+                    h.update(f.read())
+        _version = h.hexdigest()[:12]
+    return _version
+
+
+def config_mapa():
+    """
+    config de dcc.Graph para los mapas: la geometría local si existe; si no,
+    plotly.js la sigue pidiendo a su CDN.
+    """
+    version = version_geometria()
+    if version is None:
+        return {}
+    # Relativa al prefijo de la app (requests_pathname_prefix)
+    return {"topojsonURL": get_relative_path(f"/geometria/{version}/")}
+
+
+def registrar_ruta_geometria(server):
+    """GET /geometria/<versión>/<fichero>.json: la geometría de assets/topojson/."""
+
+    @server.route("/geometria/<version>/<nombre>")
+    def geometria(version, nombre):
+        if nombre not in FICHEROS_GEOMETRIA or version != version_geometria():
+            abort(404)
+
+        respuesta = send_from_directory(DIRECTORIO_GEOMETRIA, nombre, max_age=CACHE_SEGUNDOS)
+        respuesta.cache_control.public = True
+        respuesta.cache_control.immutable = True
+        return respuesta
+
+    if version_geometria() is None:
+        print("Sin geometría local en", DIRECTORIO_GEOMETRIA, "- los mapas usarán", URL_CDN)
+
+
+def geometria_completa():
+    """True si están todos los ficheros de geometría en assets/topojson/."""
+    return all(os.path.exists(os.path.join(DIRECTORIO_GEOMETRIA, n)) for n in FICHEROS_GEOMETRIA)
+
+
+def descargar_geometria():
+    """
+    Descarga los ficheros de geometría de la CDN de plotly a assets/topojson/.
+    Devuelve True si están todos (y son JSON válido).
+    """
+    os.makedirs(DIRECTORIO_GEOMETRIA, exist_ok=True)
+    correctos = True
+    for nombre in FICHEROS_GEOMETRIA:
+        destino = os.path.join(DIRECTORIO_GEOMETRIA, nombre)
+        temporal = f"{destino}.tmp"
+        try:
+            with urllib.request.urlopen(URL_CDN + nombre, timeout=TIMEOUT_DESCARGA) as respuesta:
+                datos = respuesta.read()
+            json.loads(datos)
+            with open(temporal, "wb") as f:
+                f.write(datos)
+            os.replace(temporal, destino)
+            print("Descargado", destino)
+        except Exception as e:
+            print("Error al descargar", nombre, e)
+            correctos = False
+            if os.path.exists(temporal):
+                os.remove(temporal)
+    return correctos
+
+
+def exigir_geometria():
+    """
+    Para el arranque en producción (gunicorn.conf.py): sin la geometría local
+    se intenta descargar y, si no se puede, no se arranca (salvo MAPAS_CDN=1),
+    en lugar de depender en silencio de la CDN.
+    """
+    if geometria_completa() or PERMITIR_CDN:
+        return
+    if not descargar_geometria():
+        raise RuntimeError(
+            f"Falta la geometría de los mapas en {DIRECTORIO_GEOMETRIA}. Ejecuta "
+            "'python -m utils.geometria' en una máquina con red y copia assets/topojson/ "
+            "con la app, o arranca con MAPAS_CDN=1 para usar cdn.plot.ly."
+        )
+
+
+if __name__ == "__main__":
+    if "--comprobar" in sys.argv[1:]:
+        correcta = geometria_completa()
+        print("Geometría local:", "completa" if correcta else f"incompleta en {DIRECTORIO_GEOMETRIA}")
+    else:
+        correcta = descargar_geometria()
+    sys.exit(0 if correcta else 1)
@@ -0,0 +1,98 @@
+# utils/incremental.py
+# Modo "añadir": incorpora un extracto nuevo al ledger ya cargado sin
+# volver a procesar todo el histórico. Las transacciones repetidas se
+# detectan por un hash de Institution + Date + Description + Amount.
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+from utils.agregados import ampliar_cubo, guardar_cubo
+from utils.cache import CacheLRU
+from utils.data_utils import concatenar_ledgers, df_from_store, guardar_dataset
+from utils.indices import ampliar_indices, guardar_indices
+from utils.piramide import ampliar_piramide, guardar_piramide
+
+COLUMNAS_CLAVE = ["Institution", "Date", "Description", "Amount"]
+
+# Hashes (ordenados) de las transacciones de cada dataset
+_hashes = CacheLRU(
+    max_items=int(os.environ.get("DATASET_CACHE_ITEMS", 8)),
+    ttl=int(os.environ.get("DATASET_CACHE_TTL", 4 * 3600)),
+    max_bytes=int(os.environ.get("HASHES_CACHE_MB", 128)) * 1024 ** 2,
+    nombre="hashes",
+    compartida=True,
+)
+
+
+def hash_transacciones(df):
+    """Hash (uint64) de cada transacción según las columnas clave."""
+    # Las categóricas se hashean por su valor, no por su código
+    return pd.util.hash_pandas_object(df[COLUMNAS_CLAVE], index=False).to_numpy()
+
+
+def _hashes_dataset(dataset_id, df):
+    hashes = _hashes.get(dataset_id)
+    if hashes is None:
+        hashes = np.sort(hash_transacciones(df))
+        _hashes.set(dataset_id, hashes)
+    return hashes
+
+
+def _contiene(ordenados, valores):
+    """valores ∈ ordenados con búsqueda binaria (no recorre el histórico)."""
+    if len(ordenados) == 0:
+        return np.zeros(len(valores), dtype=bool)
+    posiciones = np.searchsorted(ordenados, valores).clip(max=len(ordenados) - 1)
+    return ordenados[posiciones] == valores
+
+
+def anadir_dataset(base_id, nuevo_id):
+    """
+    Añade las transacciones del dataset `nuevo_id` al dataset `base_id`.
+    Se descartan las que ya estaban en la base (las repetidas dentro del
+    propio archivo se conservan: pueden ser compras idénticas reales).
+    Devuelve (dataset_id, añadidas, duplicadas) o None si falta alguno.
+
+    El cubo mensual, la pirámide temporal y los índices de búsqueda, si ya
+    estaban calculados para la base, se actualizan solo con las filas nuevas.
+    """
+    base = df_from_store(base_id)
+    nuevo = df_from_store(nuevo_id)
+    if base is None or nuevo is None:
+        return None
+
+    hashes_base = _hashes_dataset(base_id, base)
+    hashes_nuevo = hash_transacciones(nuevo)
+    repetidas = _contiene(hashes_base, hashes_nuevo)
+
+    nuevas = nuevo[~repetidas].reset_index(drop=True)
+    duplicadas = int(repetidas.sum())
+    if nuevas.empty:
+        return base_id, 0, duplicadas
+
+    # ID derivado de los dos datasets: no hace falta hashear todo el ledger
+    dataset_id = hashlib.sha1(f"{base_id}+{nuevo_id}".encode("utf-8")).hexdigest()[:20]
+
+    # Sin reordenar categorías: los códigos de la base no cambian
+    ledger = concatenar_ledgers([base, nuevas], ordenar_categorias=False)
+
+    # Primero se calcula todo lo derivado y después se guarda: si algo
+    # falla, no queda ningún dataset a medio actualizar
+    hashes_nuevas = np.sort(hashes_nuevo[~repetidas])
+    hashes = np.insert(hashes_base, np.searchsorted(hashes_base, hashes_nuevas), hashes_nuevas)
+    cubo = ampliar_cubo(base_id, nuevas, ledger)
+    piramide = ampliar_piramide(base_id, nuevas, ledger)
+    indices = ampliar_indices(base_id, ledger, len(base))
+
+    guardar_dataset(ledger, dataset_id=dataset_id)
+    _hashes.set(dataset_id, hashes)
+    if cubo is not None:
+        guardar_cubo(dataset_id, cubo)
+    if piramide is not None:
+        guardar_piramide(dataset_id, piramide)
+    if indices is not None:
+        guardar_indices(dataset_id, indices)
+
+    return dataset_id, len(nuevas), duplicadas
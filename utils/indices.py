@@ -0,0 +1,250 @@
+# utils/indices.py
+import bisect
+import os
+import unicodedata
+from collections import defaultdict
+
+import numpy as np
+
+from utils.cache import CacheLRU
+from utils.data_utils import derivado_from_store
+
+_indices = CacheLRU(
+    max_items=int(os.environ.get("DATASET_CACHE_ITEMS", 8)),
+    ttl=int(os.environ.get("DATASET_CACHE_TTL", 4 * 3600)),
+    max_bytes=int(os.environ.get("INDICES_CACHE_MB", 256)) * 1024 ** 2,
+    nombre="indices",
+    compartida=True,
+)
+
+_VACIO = np.array([], dtype=np.int64)
+
+
+def normalizar_texto(texto):
+    """Minúsculas, sin tildes y con los espacios colapsados."""
+    texto = unicodedata.normalize("NFKD", str(texto).lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return " ".join(texto.split())
+
+
+class IndiceTexto:
+    """
+    Índice de trigramas sobre una columna categórica de texto (Description).
+
+    Como la columna es categórica, el índice se construye sobre los comercios
+    distintos (las categorías) y no sobre cada fila; después cada comercio se
+    traduce a las posiciones de sus filas.
+    """
+
+    def __init__(self, serie):
+        codigos = serie.cat.codes.to_numpy()
+        self.textos = [normalizar_texto(c) for c in serie.cat.categories]
+
+        # trigrama -> códigos de categoría que lo contienen
+        trigramas = defaultdict(list)
+        tokens = set()
+        for codigo, texto in enumerate(self.textos):
+            for tg in {texto[i:i + 3] for i in range(len(texto) - 2)}:
+                trigramas[tg].append(codigo)
+            for token in texto.split():
+                tokens.add((token, codigo))
+        self._trigramas = {tg: np.array(cods, dtype=np.int64) for tg, cods in trigramas.items()}
+
+        # Lista ordenada de (token, código) para búsquedas por prefijo
+        self._tokens = sorted(tokens)
+
+        # Filas agrupadas por código: orden[limites[c]:limites[c + 1]] son las filas de c
+        self._orden = np.argsort(codigos, kind="stable")
+        self._limites = np.searchsorted(codigos[self._orden], np.arange(len(self.textos) + 1))
+
+    def ampliar(self, serie, n_base):
+        """
+        Índice para la columna ampliada con filas nuevas al final.
+        Requiere que `serie` conserve los códigos de las categorías antiguas
+        (las nuevas van al final): solo se indexan los textos nuevos y las
+        filas nuevas se intercalan en la ordenación existente.
+        """
+        nuevo = IndiceTexto.__new__(IndiceTexto)
+        categorias = serie.cat.categories
+        n_antiguas = len(self.textos)
+
+        nuevo.textos = self.textos + [normalizar_texto(c) for c in categorias[n_antiguas:]]
+
+        trigramas = defaultdict(list)
+        tokens = []
+        for codigo in range(n_antiguas, len(nuevo.textos)):
+            texto = nuevo.textos[codigo]
+            for tg in {texto[i:i + 3] for i in range(len(texto) - 2)}:
+                trigramas[tg].append(codigo)
+            tokens.extend((token, codigo) for token in set(texto.split()))
+
+        nuevo._trigramas = dict(self._trigramas)
+        for tg, cods in trigramas.items():
+            anterior = nuevo._trigramas.get(tg, _VACIO)
+            nuevo._trigramas[tg] = np.concatenate([anterior, np.array(cods, dtype=np.int64)])
+
+        nuevo._tokens = list(self._tokens)
+        for token in tokens:
+            bisect.insort(nuevo._tokens, token)
+
+        # Las filas nuevas de cada código van detrás de las antiguas del mismo
+        # código. Las filas sin descripción (código -1) forman el bloque inicial
+        # orden[:limites[0]]: las nuevas se añaden al final de ese bloque.
+        codigos = serie.cat.codes.to_numpy()[n_base:]
+        nulas = codigos < 0
+        orden_nuevas = np.argsort(codigos, kind="stable")
+        limites = np.concatenate([
+            self._limites,
+            np.full(len(nuevo.textos) - n_antiguas, self._limites[-1]),
+        ])
+        posiciones = np.where(
+            nulas[orden_nuevas], limites[0], limites[codigos[orden_nuevas] + 1]
+        )
+        nuevo._orden = np.insert(self._orden, posiciones, orden_nuevas + n_base)
+
+        cuenta = np.bincount(codigos[~nulas], minlength=len(nuevo.textos))
+        nuevo._limites = limites + int(nulas.sum()) + np.concatenate([[0], np.cumsum(cuenta)])
+        return nuevo
+
+    def _codigos_subcadena(self, consulta):
+        if not consulta:
+            # Consulta vacía (p. ej. solo espacios): no hay nada que buscar
+            return []
+        if len(consulta) < 3:
+            # Consultas muy cortas: basta con recorrer los comercios distintos
+            return [c for c, texto in enumerate(self.textos) if consulta in texto]
+
+        trigramas = {consulta[i:i + 3] for i in range(len(consulta) - 2)}
+        listas = []
+        for tg in trigramas:
+            lista = self._trigramas.get(tg)
+            if lista is None:
+                return []
+            listas.append(lista)
+
+        # Intersección empezando por la lista más corta
+        listas.sort(key=len)
+        candidatos = listas[0]
+        for lista in listas[1:]:
+            candidatos = np.intersect1d(candidatos, lista, assume_unique=True)
+            if len(candidatos) == 0:
+                return []
+
+        # Verificación final (los trigramas solo filtran candidatos)
+        return [c for c in candidatos if consulta in self.textos[c]]
+
+    def _codigos_prefijo(self, consulta):
+        if not consulta:
+            return []
+        inicio = bisect.bisect_left(self._tokens, (consulta,))
+        codigos = set()
+        for token, codigo in self._tokens[inicio:]:
+            if not token.startswith(consulta):
+                break
+            codigos.add(codigo)
+        return sorted(codigos)
+
+    def _filas(self, codigos):
+        if len(codigos) == 0:
+            return _VACIO
+        trozos = [self._orden[self._limites[c]:self._limites[c + 1]] for c in codigos]
+        return np.sort(np.concatenate(trozos))
+
+    def buscar(self, texto):
+        """Posiciones de las filas cuya descripción contiene `texto` (ninguna si está vacío)."""
+        return self._filas(self._codigos_subcadena(normalizar_texto(texto)))
+
+    def buscar_prefijo(self, texto):
+        """Posiciones de las filas con alguna palabra que empieza por `texto`."""
+        return self._filas(self._codigos_prefijo(normalizar_texto(texto)))
+
+
+class IndiceOrdenado:
+    """
+    Permutación que ordena una columna numérica o de fechas.
+    Los filtros de rango se resuelven con búsqueda binaria (searchsorted)
+    y devuelven directamente las posiciones de las filas.
+    """
+
+    def __init__(self, valores):
+        self.orden = np.argsort(valores, kind="stable")
+        self.valores = valores[self.orden]
+
+    def ampliar(self, valores_nuevos, n_base):
+        """
+        Índice con valores nuevos añadidos al final (posiciones n_base, ...):
+        se ordenan solo los nuevos y se intercalan con búsqueda binaria.
+        """
+        nuevo = IndiceOrdenado.__new__(IndiceOrdenado)
+        orden_nuevos = np.argsort(valores_nuevos, kind="stable")
+        ordenados = valores_nuevos[orden_nuevos]
+
+        # side="right": a igual valor, las filas antiguas van primero (orden estable)
+        posiciones = np.searchsorted(self.valores, ordenados, side="right")
+        nuevo.valores = np.insert(self.valores, posiciones, ordenados)
+        nuevo.orden = np.insert(self.orden, posiciones, orden_nuevos + n_base)
+        return nuevo
+
+    def rango(self, minimo=None, maximo=None):
+        """Posiciones de las filas con minimo <= valor <= maximo (extremos opcionales)."""
+        i = 0 if minimo is None else np.searchsorted(self.valores, minimo, side="left")
+        j = len(self.valores) if maximo is None else np.searchsorted(self.valores, maximo, side="right")
+        return self.orden[i:j]
+
+    def tamano_bytes(self):
+        return self.orden.nbytes + self.valores.nbytes
+
+
+class IndicesLedger:
+    """Índices de búsqueda de un dataset, construidos una sola vez."""
+
+    def __init__(self, df):
+        self.n_filas = len(df)
+        self.descripcion = IndiceTexto(df["Description"])
+        self.fecha = IndiceOrdenado(df["Date"].to_numpy())
+        self.importe = IndiceOrdenado(df["Amount"].to_numpy())
+
+    def ampliar(self, ledger, n_base):
+        """Índices del ledger ampliado (filas nuevas a partir de n_base)."""
+        nuevo = IndicesLedger.__new__(IndicesLedger)
+        nuevo.n_filas = len(ledger)
+        nuevo.descripcion = self.descripcion.ampliar(ledger["Description"], n_base)
+        nuevo.fecha = self.fecha.ampliar(ledger["Date"].to_numpy()[n_base:], n_base)
+        nuevo.importe = self.importe.ampliar(ledger["Amount"].to_numpy()[n_base:], n_base)
+        return nuevo
+
+    def mascara(self, posiciones):
+        """Bitmap (array booleano) con True en las posiciones indicadas."""
+        mascara = np.zeros(self.n_filas, dtype=bool)
+        mascara[posiciones] = True
+        return mascara
+
+    def tamano_bytes(self):
+        """Estimación para el presupuesto de memoria de la caché."""
+        d = self.descripcion
+        return (
+            d._orden.nbytes + d._limites.nbytes
+            + sum(a.nbytes for a in d._trigramas.values())
+            + sum(len(t) for t in d.textos) * 2
+            + self.fecha.tamano_bytes() + self.importe.tamano_bytes()
+        )
+
+
+def indices_from_store(dataset_id):
+    """Devuelve (y construye la primera vez) los índices del dataset guardado en Data."""
+    return derivado_from_store(_indices, dataset_id, IndicesLedger)
+
+
+def ampliar_indices(base_id, ledger, n_base):
+    """
+    Índices del dataset ampliado a partir de los de la base, sin
+    reconstruirlos desde cero. None si los de la base no están calculados.
+    """
+    indices = _indices.get(base_id)
+    if indices is None or indices.n_filas != n_base:
+        return None
+    return indices.ampliar(ledger, n_base)
+
+
+def guardar_indices(dataset_id, indices):
+    _indices.set(dataset_id, indices)
@@ -0,0 +1,74 @@
+# utils/jobs.py
+# Ejecución en segundo plano de los callbacks lentos (modelos de ML).
+# Los callbacks con background=True se ejecutan en un proceso aparte gestionado
+# por Dash (DiskcacheManager), así no bloquean al worker de gunicorn.
+import functools
+import os
+import time
+from contextlib import contextmanager
+
+import diskcache
+import psutil
+from dash import DiskcacheManager
+
+DIRECTORIO_JOBS = os.environ.get(
+    "JOBS_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache", "jobs"),
+)
+
+# Caché en disco compartida por el servidor y los procesos de los trabajos:
+# guarda resultados, progreso y los cerrojos de deduplicación
+cache_jobs = diskcache.Cache(DIRECTORIO_JOBS)
+
+
+
+class GestorSegundoPlano(DiskcacheManager):
+    """
+    DiskcacheManager que pasa a cada trabajo la sesión de la petición que lo
+    lanza: el proceso del trabajo no ve las cookies y la necesita para
+    comprobar a quién pertenece el dataset (utils/sesiones.py).
+    """
+
+    def call_job_fn(self, key, job_fn, args, context):
+        from utils.sesiones import sesion_actual
+
+        trabajo = functools.partial(_con_sesion, sesion_actual(), job_fn)
+        return super().call_job_fn(key, trabajo, args, context)
+
+
+def _con_sesion(sesion_id, job_fn, *args):
+    from utils.sesiones import fijar_sesion_trabajo
+
+    fijar_sesion_trabajo(sesion_id)
+    return job_fn(*args)
+
+
+background_manager = GestorSegundoPlano(cache_jobs, expire=3600)
+
+# Tiempo máximo que un cerrojo puede quedarse huérfano
+_EXPIRACION_CERROJO = 30 * 60
+
+
+@contextmanager
+def trabajo_exclusivo(clave):
+    """
+    Garantiza que solo un proceso calcula `clave` a la vez.
+    Si otro trabajo idéntico está en marcha, se espera a que termine (y el
+    llamante encontrará su resultado ya cacheado). Los cerrojos de procesos
+    que ya no existen (p. ej. un trabajo cancelado) se liberan solos.
+    """
+    nombre = f"cerrojo-{clave}"
+    pid = os.getpid()
+
+    while not cache_jobs.add(nombre, pid, expire=_EXPIRACION_CERROJO):
+        propietario = cache_jobs.get(nombre)
+        if propietario is not None and not psutil.pid_exists(propietario):
+            cache_jobs.delete(nombre)
+            continue
+        time.sleep(0.1)
+
+    try:
+        yield
+    finally:
+        if cache_jobs.get(nombre) == pid:
+            cache_jobs.delete(nombre)
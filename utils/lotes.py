@@ -0,0 +1,205 @@
+# utils/lotes.py
+# Ingesta de lotes: archivos .zip, libros Excel con varias hojas (una por
+# cuenta) y subidas de varios archivos a la vez. Cada hoja/archivo es un
+# trabajo independiente que se parsea en un pool de procesos y el
+# resultado se une en un solo ledger con la columna Source. Los trabajos
+# solo llevan la ruta, el miembro del zip y la hoja: cada proceso abre lo
+# suyo, así que ni el zip ni el libro entero se copian a cada trabajo.
+import os
+import shutil
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+import pandas as pd
+
+from utils.data_utils import concatenar_ledgers, normalizar_ledger
+
+EXTENSIONES_TABLA = (".csv", ".xls", ".xlsx")
+
+TAMANO_TROZO = 1024 * 1024   # 1 MB
+
+# Procesos del pool (por defecto, todos los núcleos)
+PROCESOS_INGESTA = int(os.environ.get("INGESTA_PROCESOS", os.cpu_count() or 1))
+
+_pool = None
+
+
+def _pool_procesos():
+    """
+    Pool reutilizado entre subidas (no se arrancan procesos en cada una).
+    Usa el método de arranque por defecto de la plataforma: _leer_trabajo es
+    una función del módulo, así que sirve también con spawn/forkserver.
+    """
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=PROCESOS_INGESTA)
+    return _pool
+
+
+def hojas_excel(fuente, nombre):
+    """Nombres de las hojas de un libro Excel (ruta o fichero), sin cargar las celdas."""
+    if nombre.lower().endswith(".xlsx"):
+        from openpyxl import load_workbook
+
+        libro = load_workbook(fuente, read_only=True)
+        try:
+            return libro.sheetnames
+        finally:
+            libro.close()
+    return pd.ExcelFile(fuente).sheet_names
+
+
+@contextmanager
+def _abrir(ruta, miembro=None):
+    """
+    Ruta o fichero de donde leer: el archivo `ruta` o, si se indica, su
+    miembro `miembro` (ruta es entonces un .zip). Los CSV del zip se leen
+    descomprimiendo en streaming; los Excel necesitan acceso aleatorio y
+    se descomprimen a un temporal, sin pasar nunca entero por memoria.
+    """
+    if miembro is None:
+        yield ruta
+        return
+
+    with zipfile.ZipFile(ruta) as archivo, archivo.open(miembro) as datos:
+        if miembro.lower().endswith(".csv"):
+            yield datos
+            return
+
+        fd, temporal = tempfile.mkstemp(suffix=os.path.splitext(miembro)[1])
+        try:
+            with os.fdopen(fd, "wb") as destino:
+                shutil.copyfileobj(datos, destino, TAMANO_TROZO)
+            yield temporal
+        finally:
+            os.remove(temporal)
+
+
+def _trabajos_archivo(ruta, nombre, miembro=None):
+    """
+    Trabajos (fuente, ruta, miembro, hoja) de un archivo CSV/Excel: solo
+    la ubicación, cada proceso del pool abre después su propia hoja.
+    """
+    if nombre.lower().endswith(".csv"):
+        return [(nombre, ruta, miembro, None)]
+
+    with _abrir(ruta, miembro) as fuente:
+        hojas = hojas_excel(fuente, nombre)
+    if len(hojas) == 1:
+        return [(nombre, ruta, miembro, hojas[0])]
+    return [(f"{nombre}:{hoja}", ruta, miembro, hoja) for hoja in hojas]
+
+
+def _trabajos_zip(ruta, nombre_zip):
+    """Trabajos de los CSV/Excel de un .zip en disco; el resto de ficheros se ignora."""
+    trabajos = []
+    with zipfile.ZipFile(ruta) as archivo:
+        miembros = sorted(
+            info.filename for info in archivo.infolist()
+            if not info.is_dir()
+            and not info.filename.startswith("__MACOSX/")
+            and info.filename.lower().endswith(EXTENSIONES_TABLA)
+        )
+    for miembro in miembros:
+        trabajos += [
+            (f"{nombre_zip}/{fuente}", ruta, miembro, hoja)
+            for fuente, _, _, hoja in _trabajos_archivo(ruta, miembro, miembro)
+        ]
+    return trabajos
+
+
+def _leer_trabajo(trabajo):
+    """Parsea y normaliza una hoja o archivo (se ejecuta en el pool)."""
+    fuente, ruta, miembro, hoja = trabajo
+    try:
+        with _abrir(ruta, miembro) as datos:
+            if hoja is None:
+                df = pd.read_csv(datos)
+            else:
+                df = pd.read_excel(datos, sheet_name=hoja)
+    except Exception as e:
+        print(f"Error al leer '{fuente}':", e)
+        return None
+
+    # Hojas sin Date/Amount (resúmenes, listas...) devuelven None y se omiten
+    return normalizar_ledger(df, fuente=fuente)
+
+
+def _avisar(partes, progreso):
+    """Recorre las partes según se leen y avisa de las filas acumuladas."""
+    filas_leidas = 0
+    for parte in partes:
+        if parte is not None and progreso is not None:
+            filas_leidas += len(parte)
+            progreso(filas_leidas)
+        yield parte
+
+
+def _a_disco(nombre, datos):
+    """Vuelca a un temporal los bytes de un archivo subido y devuelve su ruta."""
+    fd, ruta = tempfile.mkstemp(suffix=os.path.splitext(nombre)[1])
+    with os.fdopen(fd, "wb") as destino:
+        destino.write(datos)
+    return ruta
+
+
+def leer_lote(archivos, progreso=None):
+    """
+    Lee una lista de archivos [(nombre, datos_o_ruta), ...] (CSV, Excel o
+    zip) y devuelve un único ledger normalizado con la columna Source
+    (archivo, miembro del zip y hoja de donde sale cada fila).
+    Devuelve None si ninguna hoja tiene las columnas Date y Amount.
+    `progreso(filas_leidas)` se llama al terminar cada hoja si se indica.
+    """
+    # Los trabajos se pasan por ruta: lo que llega en memoria va a un temporal
+    temporales = []
+    try:
+        trabajos = []
+        for nombre, fuente in archivos:
+            if not nombre.lower().endswith((".zip",) + EXTENSIONES_TABLA):
+                continue
+            if isinstance(fuente, bytes):
+                fuente = _a_disco(nombre, fuente)
+                temporales.append(fuente)
+            if nombre.lower().endswith(".zip"):
+                trabajos += _trabajos_zip(fuente, nombre)
+            else:
+                trabajos += _trabajos_archivo(fuente, nombre)
+    except Exception as e:
+        print("Error al leer el archivo:", e)
+        _borrar(temporales)
+        return None
+
+    try:
+        partes = _leer_trabajos(trabajos, progreso)
+    finally:
+        _borrar(temporales)
+
+    # Sin quitar repetidas entre partes: filas iguales de hojas o archivos
+    # distintos pueden ser transacciones reales (Source las distingue)
+    partes = [p for p in partes if p is not None]
+    return concatenar_ledgers(partes)
+
+
+def _leer_trabajos(trabajos, progreso):
+    """Partes leídas de cada trabajo, en el pool si hay varios."""
+    if len(trabajos) > 1 and PROCESOS_INGESTA > 1:
+        try:
+            return list(_avisar(_pool_procesos().map(_leer_trabajo, trabajos), progreso))
+        except Exception as e:
+            # Sin pool (plataforma sin procesos, un proceso que murió sin
+            # memoria...): se descarta el pool y las hojas se leen aquí
+            print("Error en el pool de ingesta:", e)
+            global _pool
+            _pool = None
+    return list(_avisar((_leer_trabajo(t) for t in trabajos), progreso))
+
+
+def _borrar(rutas):
+    for ruta in rutas:
+        try:
+            os.remove(ruta)
+        except OSError:
+            pass
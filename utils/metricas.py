@@ -0,0 +1,311 @@
+# utils/metricas.py
+# Instrumentación de los callbacks: tiempo de reloj y de CPU, bytes de la
+# petición y de la respuesta y aciertos/fallos de caché por callback.
+# Se exponen en formato de texto de Prometheus en /metrics.
+#
+# Cada worker (y cada proceso de gunicorn) cuenta lo suyo y publica cada
+# pocos segundos una copia en la caché de trabajos (utils/jobs.py, en disco
+# y compartida por los procesos de la máquina). /metrics y el panel suman
+# las de todos los procesos, así que da igual qué worker responda.
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from contextvars import ContextVar
+from functools import wraps
+
+from dash import _callback
+from dash.exceptions import PreventUpdate
+from flask import Response, has_request_context, request
+
+from utils.jobs import cache_jobs
+
+# Límites (en segundos) del histograma de latencias
+CUBETAS_LATENCIA = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Latencias recientes que se guardan por callback para el panel (p50/p95)
+_RECIENTES = 500
+
+# Segundos entre dos publicaciones de las métricas de un proceso
+PUBLICAR_CADA = float(os.environ.get("METRICAS_PUBLICAR_CADA", 5))
+
+# Las métricas de un proceso que ya no publica (un worker reiniciado) se
+# siguen sumando este tiempo, para que los contadores no bajen al momento
+TTL_METRICAS = int(os.environ.get("METRICAS_TTL", 7 * 24 * 3600))
+
+_CLAVE_PROCESOS = "metricas-procesos"
+
+_lock = threading.Lock()
+_metricas = {}
+
+# Identificador de este proceso en la caché (pid + aleatorio: los pid se
+# reutilizan) y momento de su última publicación
+_proceso = {"pid": None, "id": None, "publicado": 0.0}
+_lock_proceso = threading.Lock()
+
+# Funciones que añaden su propio texto a /metrics (memoria, sesiones...)
+_colectores = []
+
+# Contadores de caché de la llamada en curso (None fuera de un callback)
+_llamada_actual = ContextVar("llamada_actual", default=None)
+
+
+def _nuevas_metricas():
+    return {
+        "resultados": defaultdict(int),     # ok / sin_cambios / error
+        "duracion": 0.0,
+        "cpu": 0.0,
+        "bytes_entrada": 0,
+        "bytes_salida": 0,
+        "bytes_salida_max": 0,
+        "cache": defaultdict(int),          # acierto / fallo
+        "cubetas": [0] * len(CUBETAS_LATENCIA),
+        "recientes": deque(maxlen=_RECIENTES),
+    }
+
+
+def registrar_cache(acierto):
+    """Anota un acierto o fallo de caché en el callback que se está ejecutando."""
+    contadores = _llamada_actual.get()
+    if contadores is not None:
+        contadores["acierto" if acierto else "fallo"] += 1
+
+
+def _registrar(nombre, resultado, duracion, cpu, bytes_entrada, bytes_salida, cache):
+    with _lock:
+        if _proceso["pid"] not in (None, os.getpid()):
+            # Proceso hijo (fork): lo heredado ya lo publica el padre
+            _metricas.clear()
+        m = _metricas.setdefault(nombre, _nuevas_metricas())
+        m["resultados"][resultado] += 1
+        m["duracion"] += duracion
+        m["cpu"] += cpu
+        m["bytes_entrada"] += bytes_entrada
+        m["bytes_salida"] += bytes_salida
+        m["bytes_salida_max"] = max(m["bytes_salida_max"], bytes_salida)
+        for clave, n in cache.items():
+            m["cache"][clave] += n
+        for i, limite in enumerate(CUBETAS_LATENCIA):
+            if duracion <= limite:
+                m["cubetas"][i] += 1
+        m["recientes"].append(duracion)
+
+    _publicar()
+
+
+# === AGREGACIÓN ENTRE PROCESOS ===
+def _copia_metricas():
+    """Métricas de este proceso como tipos simples (para guardarlas en la caché)."""
+    with _lock:
+        return {
+            nombre: {
+                **m,
+                "resultados": dict(m["resultados"]),
+                "cache": dict(m["cache"]),
+                "cubetas": list(m["cubetas"]),
+                "recientes": list(m["recientes"]),
+            }
+            for nombre, m in _metricas.items()
+        }
+
+
+def _registrar_proceso(id_proceso):
+    try:
+        with cache_jobs.transact():
+            procesos = cache_jobs.get(_CLAVE_PROCESOS, set())
+            procesos.add(id_proceso)
+            cache_jobs.set(_CLAVE_PROCESOS, procesos)
+    except Exception as e:
+        print("No se pudo registrar el proceso para las métricas:", e)
+
+
+def _publicar(forzar=False):
+    """Guarda las métricas de este proceso en la caché compartida (como mucho cada PUBLICAR_CADA s)."""
+    with _lock_proceso:
+        ahora = time.monotonic()
+        if _proceso["pid"] != os.getpid():
+            # Primer uso en este proceso (o tras un fork): se da de alta
+            _proceso.update(pid=os.getpid(), id=f"{os.getpid()}-{uuid.uuid4().hex[:8]}")
+            _registrar_proceso(_proceso["id"])
+        elif not forzar and ahora - _proceso["publicado"] < PUBLICAR_CADA:
+            return
+        _proceso["publicado"] = ahora
+
+    try:
+        cache_jobs.set(f"metricas-{_proceso['id']}", _copia_metricas(), expire=TTL_METRICAS)
+    except Exception as e:
+        # Sin caché, /metrics muestra al menos lo de este proceso
+        print("No se pudieron publicar las métricas:", e)
+
+
+def _sumar(total, m):
+    for clave in ("resultados", "cache"):
+        for valor, n in m[clave].items():
+            total[clave][valor] += n
+    for clave in ("duracion", "cpu", "bytes_entrada", "bytes_salida"):
+        total[clave] += m[clave]
+    total["bytes_salida_max"] = max(total["bytes_salida_max"], m["bytes_salida_max"])
+    total["cubetas"] = [a + b for a, b in zip(total["cubetas"], m["cubetas"])]
+    # Sin límite: el panel calcula los percentiles con las recientes de todos
+    total["recientes"].extend(m["recientes"])
+
+
+def _metricas_globales():
+    """Suma de las métricas publicadas por todos los procesos (incluido este)."""
+    _publicar(forzar=True)
+    try:
+        procesos = cache_jobs.get(_CLAVE_PROCESOS, set())
+        copias = {p: cache_jobs.get(f"metricas-{p}") for p in procesos}
+    except Exception as e:
+        print("No se pudieron leer las métricas de los demás procesos:", e)
+        copias = {_proceso["id"]: _copia_metricas()}
+
+    caducados = {p for p, copia in copias.items() if copia is None}
+    if caducados:
+        try:
+            with cache_jobs.transact():
+                cache_jobs.set(_CLAVE_PROCESOS, cache_jobs.get(_CLAVE_PROCESOS, set()) - caducados)
+        except Exception as e:
+            print("No se pudieron olvidar las métricas caducadas:", e)
+
+    totales = {}
+    for copia in copias.values():
+        for nombre, m in (copia or {}).items():
+            total = totales.setdefault(nombre, {**_nuevas_metricas(), "recientes": []})
+            _sumar(total, m)
+    return totales
+
+
+def _instrumentar(nombre, func):
+    @wraps(func)
+    def envoltura(*args, **kwargs):
+        bytes_entrada = (request.content_length or 0) if has_request_context() else 0
+        cache = defaultdict(int)
+        token = _llamada_actual.set(cache)
+        inicio, inicio_cpu = time.perf_counter(), time.thread_time()
+        resultado, respuesta = "error", None
+        try:
+            respuesta = func(*args, **kwargs)
+            resultado = "ok"
+            return respuesta
+        except PreventUpdate:
+            resultado = "sin_cambios"
+            raise
+        finally:
+            _llamada_actual.reset(token)
+            _registrar(
+                nombre, resultado,
+                time.perf_counter() - inicio, time.thread_time() - inicio_cpu,
+                bytes_entrada, len(respuesta) if isinstance(respuesta, str) else 0,
+                cache,
+            )
+
+    envoltura._instrumentado = True
+    return envoltura
+
+
+def instrumentar_callbacks(paquete="callbacks"):
+    """
+    Envuelve todos los callbacks registrados con @callback desde `paquete`.
+    Hay que llamarlo después de importar los módulos de callbacks y antes
+    de la primera petición (Dash mueve entonces los callbacks a la app).
+    En los callbacks en segundo plano se mide la petición al servidor
+    (lanzar el trabajo y consultar su progreso), no el proceso del trabajo.
+    """
+    for entrada in _callback.GLOBAL_CALLBACK_MAP.values():
+        func = entrada.get("callback")   # los clientside_callback no tienen
+        modulo = getattr(func, "__module__", "")
+        if getattr(func, "_instrumentado", False) or not modulo.startswith(paquete + "."):
+            continue
+        nombre = f"{modulo[len(paquete) + 1:]}.{func.__name__}"
+        entrada["callback"] = _instrumentar(nombre, func)
+
+
+def _percentil(ordenados, p):
+    if not ordenados:
+        return 0.0
+    return ordenados[min(len(ordenados) - 1, int(p * len(ordenados)))]
+
+
+def resumen_metricas():
+    """Una fila por callback con sus totales y percentiles recientes (para el panel)."""
+    filas = []
+    for nombre, m in sorted(_metricas_globales().items()):
+        llamadas = sum(m["resultados"].values())
+        recientes = sorted(m["recientes"])
+        filas.append({
+            "callback": nombre,
+            "llamadas": llamadas,
+            "errores": m["resultados"].get("error", 0),
+            "media_ms": round(1000 * m["duracion"] / llamadas, 1) if llamadas else 0.0,
+            "p50_ms": round(1000 * _percentil(recientes, 0.50), 1),
+            "p95_ms": round(1000 * _percentil(recientes, 0.95), 1),
+            "cpu_ms": round(1000 * m["cpu"] / llamadas, 1) if llamadas else 0.0,
+            "salida_kb_max": round(m["bytes_salida_max"] / 1024, 1),
+            "aciertos_cache": m["cache"].get("acierto", 0),
+            "fallos_cache": m["cache"].get("fallo", 0),
+        })
+    return filas
+
+
+def texto_prometheus():
+    """Métricas en el formato de exposición de texto de Prometheus."""
+    lineas = []
+
+    def metrica(nombre, tipo, ayuda):
+        lineas.append(f"# HELP {nombre} {ayuda}")
+        lineas.append(f"# TYPE {nombre} {tipo}")
+
+    datos = sorted(_metricas_globales().items())
+
+    metrica("dashboard_callback_llamadas_total", "counter", "Llamadas a cada callback por resultado.")
+    for nombre, m in datos:
+        for resultado, n in sorted(m["resultados"].items()):
+            lineas.append(f'dashboard_callback_llamadas_total{{callback="{nombre}",resultado="{resultado}"}} {n}')
+
+    metrica("dashboard_callback_duracion_segundos", "histogram", "Tiempo de reloj de cada callback.")
+    for nombre, m in datos:
+        for limite, n in zip(CUBETAS_LATENCIA, m["cubetas"]):
+            lineas.append(f'dashboard_callback_duracion_segundos_bucket{{callback="{nombre}",le="{limite}"}} {n}')
+        total = sum(m["resultados"].values())
+        lineas.append(f'dashboard_callback_duracion_segundos_bucket{{callback="{nombre}",le="+Inf"}} {total}')
+        lineas.append(f'dashboard_callback_duracion_segundos_sum{{callback="{nombre}"}} {m["duracion"]:.6f}')
+        lineas.append(f'dashboard_callback_duracion_segundos_count{{callback="{nombre}"}} {total}')
+
+    metrica("dashboard_callback_cpu_segundos_total", "counter", "Tiempo de CPU del hilo que ejecuta el callback.")
+    for nombre, m in datos:
+        lineas.append(f'dashboard_callback_cpu_segundos_total{{callback="{nombre}"}} {m["cpu"]:.6f}')
+
+    metrica("dashboard_callback_bytes_entrada_total", "counter", "Bytes de las peticiones recibidas.")
+    for nombre, m in datos:
+        lineas.append(f'dashboard_callback_bytes_entrada_total{{callback="{nombre}"}} {m["bytes_entrada"]}')
+
+    metrica("dashboard_callback_bytes_salida_total", "counter", "Bytes de las respuestas enviadas.")
+    for nombre, m in datos:
+        lineas.append(f'dashboard_callback_bytes_salida_total{{callback="{nombre}"}} {m["bytes_salida"]}')
+
+    metrica("dashboard_callback_bytes_salida_max", "gauge", "Respuesta más grande enviada.")
+    for nombre, m in datos:
+        lineas.append(f'dashboard_callback_bytes_salida_max{{callback="{nombre}"}} {m["bytes_salida_max"]}')
+
+    metrica("dashboard_callback_cache_total", "counter", "Consultas a las cachés del servidor por resultado.")
+    for nombre, m in datos:
+        for resultado, n in sorted(m["cache"].items()):
+            lineas.append(f'dashboard_callback_cache_total{{callback="{nombre}",resultado="{resultado}"}} {n}')
+
+    return "\n".join(lineas) + "\n" + "".join(colector() for colector in _colectores)
+
+
+def registrar_colector(func):
+    """Añade a /metrics el texto (formato Prometheus) que devuelva `func()`."""
+    if func not in _colectores:
+        _colectores.append(func)
+
+
+def registrar_ruta_metricas(server):
+    """Registra GET /metrics en el servidor Flask de la app."""
+
+    @server.route("/metrics")
+    def metricas():
+        return Response(texto_prometheus(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,18 @@
+# utils/ml.py
+# Carga perezosa de la pila de ML (pmdarima, scikit-learn y, por debajo,
+# statsmodels y scipy). Importarla cuesta varios segundos, así que no se
+# hace al arrancar el servidor sino la primera vez que se abre la pestaña
+# Predicción (o en el proceso maestro de gunicorn, ver gunicorn.conf.py).
+import importlib
+
+MODULOS_ML = ("pmdarima", "sklearn.ensemble", "sklearn.linear_model")
+
+
+def precargar_ml():
+    """
+    Importa la pila de ML en el proceso actual (solo cuesta la primera vez).
+    Los trabajos en segundo plano se crean con fork, así que la heredan ya
+    cargada en lugar de importarla cada uno.
+    """
+    for modulo in MODULOS_ML:
+        importlib.import_module(modulo)
@@ -0,0 +1,90 @@
+# utils/modelos.py
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from utils.cache import CacheLRU
+
+# Versión del formato de los modelos guardados: cambiarla invalida los antiguos
+VERSION_MODELOS = 1
+
+# Modelos ya ajustados: en memoria (acotado, los más antiguos se expulsan)
+# y en el backend compartido, donde los encuentran los demás workers. Se
+# ajustan en los procesos de los trabajos en segundo plano, que no duran:
+# aunque CACHE_BACKEND=memoria, se guardan en disco para no perderlos
+_modelos = CacheLRU(
+    max_items=int(os.environ.get("MODELOS_CACHE_ITEMS", 32)),
+    ttl=int(os.environ.get("MODELOS_CACHE_TTL", 24 * 3600)),
+    nombre="modelos",
+    compartida="siempre",
+    version=VERSION_MODELOS,
+)
+
+
+def clave_modelo(tipo, serie, opciones):
+    """Hash de la serie (fechas + valores), del tipo de modelo y de sus opciones."""
+    h = hashlib.sha1()
+    h.update(f"{tipo}|v{VERSION_MODELOS}|".encode("utf-8"))
+    h.update(json.dumps(opciones, sort_keys=True, default=str).encode("utf-8"))
+    h.update(np.asarray(serie.index.asi8).tobytes())
+    h.update(np.asarray(serie.values, dtype="float64").round(2).tobytes())
+    return h.hexdigest()[:24]
+
+
+def modelo_cacheado(tipo, serie, ajustar, **opciones):
+    """
+    Devuelve el modelo ajustado para (tipo, serie, opciones).
+    Orden de búsqueda: caché en memoria → caché compartida → ajustar(serie, **opciones).
+    Si otro proceso está ajustando el mismo modelo, se espera a su resultado
+    en lugar de repetir el ajuste.
+    """
+    clave = clave_modelo(tipo, serie, opciones)
+
+    modelo = _modelos.get(clave)
+    if modelo is not None:
+        return modelo
+    return _modelos.construir_exclusivo(clave, lambda: ajustar(serie, **opciones))
+
+
+# pmdarima y scikit-learn se importan al ajustar (ver utils/ml.py)
+def _ajustar_arima(serie, **opciones):
+    from pmdarima import auto_arima
+
+    return auto_arima(serie, **opciones)
+
+
+def modelo_arima(serie, **opciones):
+    """
+    auto_arima cacheado: la búsqueda stepwise del orden solo se hace una vez
+    por serie; cambiar el horizonte de predicción solo llama a predict().
+    """
+    return modelo_cacheado("arima", serie, _ajustar_arima, **opciones)
+
+
+def _puntuar_isolation_forest(serie, **opciones):
+    from sklearn.ensemble import IsolationForest
+
+    X = serie.to_frame(name="Gasto")
+    modelo = IsolationForest(**opciones).fit(X)
+    return modelo.score_samples(X)
+
+
+def puntuaciones_isolation_forest(serie, **opciones):
+    """
+    score_samples de un IsolationForest ajustado una sola vez por serie.
+    El ajuste no depende de `contamination` (solo fija el umbral), así que
+    se cachean las puntuaciones y el umbral se calcula aparte.
+    """
+    return modelo_cacheado("isolation_forest", serie, _puntuar_isolation_forest, **opciones)
+
+
+def umbral_anomalias(puntuaciones, contamination):
+    """
+    Marca como anómalos los valores por debajo del percentil `contamination`,
+    igual que IsolationForest(contamination=...). Devuelve (es_anomalo, score)
+    donde score es el equivalente a decision_function (más bajo = más raro).
+    """
+    offset = np.percentile(puntuaciones, 100.0 * contamination)
+    return puntuaciones < offset, puntuaciones - offset
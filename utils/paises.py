@@ -0,0 +1,336 @@
+# utils/paises.py
+# Dimensión de países: cada valor de Country del ledger con su código
+# ISO-3. Se calcula una vez al guardar el dataset (solo hay unas pocas
+# categorías) y el mapa dibuja por código (locationmode="ISO-3"), sin que
+# plotly resuelva nombres en cada render.
+#
+# Los patrones son los que usa plotly.js con locationmode="country names"
+# (paquete country-regex), así que se reconocen los mismos nombres.
+import os
+import re
+from functools import lru_cache
+
+import pandas as pd
+
+from utils.cache import CacheLRU
+
+PATRONES_ISO3 = {
+    "AFG": "afghan",
+    "ALA": r"\b\wland",
+    "ALB": "albania",
+    "DZA": "algeria",
+    "ASM": "^(?=.*americ).*samoa",
+    "AND": "andorra",
+    "AGO": "angola",
+    "AIA": "anguill?a",
+    "ATA": "antarctica",
+    "ATG": "antigua",
+    "ARG": "argentin",
+    "ARM": "armenia",
+    "ABW": r"^(?!.*bonaire).*\baruba",
+    "AUS": "australia",
+    "AUT": r"^(?!.*hungary).*austria|\baustri.*\bemp",
+    "AZE": "azerbaijan",
+    "BHS": "bahamas",
+    "BHR": "bahrain",
+    "BGD": "bangladesh|^(?=.*east).*paki?stan",
+    "BRB": "barbados",
+    "BLR": "belarus|byelo",
+    "BEL": "^(?!.*luxem).*belgium",
+    "BLZ": "belize|^(?=.*british).*honduras",
+    "BEN": "benin|dahome",
+    "BMU": "bermuda",
+    "BTN": "bhutan",
+    "BOL": "bolivia",
+    "BES": r"^(?=.*bonaire).*eustatius|^(?=.*carib).*netherlands|\bbes.?islands",
+    "BIH": "herzegovina|bosnia",
+    "BWA": "botswana|bechuana",
+    "BVT": "bouvet",
+    "BRA": "brazil",
+    "IOT": "british.?indian.?ocean",
+    "BRN": "brunei",
+    "BGR": "bulgaria",
+    "BFA": r"burkina|\bfaso|upper.?volta",
+    "BDI": "burundi",
+    "CPV": "verde",
+    "KHM": "cambodia|kampuchea|khmer",
+    "CMR": "cameroon",
+    "CAN": "canada",
+    "CYM": "cayman",
+    "CAF": r"\bcentral.african.republic",
+    "TCD": r"\bchad",
+    "CHL": r"\bchile",
+    "CHN": r"^(?!.*\bmac)(?!.*\bhong)(?!.*\btai)(?!.*\brep).*china|^(?=.*peo)(?=.*rep).*china",
+    "CXR": "christmas",
+    "CCK": r"\bcocos|keeling",
+    "COL": "colombia",
+    "COM": "comoro",
+    "COG": r"^(?!.*\bdem)(?!.*\bd[\.]?r)(?!.*kinshasa)(?!.*zaire)(?!.*belg)(?!.*l.opoldville)(?!.*free).*\bcongo",
+    "COK": r"\bcook",
+    "CRI": "costa.?rica",
+    "CIV": "ivoire|ivory",
+    "HRV": "croatia",
+    "CUB": r"\bcuba",
+    "CUW": r"^(?!.*bonaire).*\bcura(c|ç)ao",
+    "CYP": "cyprus",
+    "CSK": "czechoslovakia",
+    "CZE": "^(?=.*rep).*czech|czechia|bohemia",
+    "COD": r"\bdem.*congo|congo.*\bdem|congo.*\bd[\.]?r|\bd[\.]?r.*congo|belgian.?congo|congo.?free.?state|kinshasa|zaire|l.opoldville|drc|droc|rdc",
+    "DNK": "denmark",
+    "DJI": "djibouti",
+    "DMA": "dominica(?!n)",
+    "DOM": "dominican.rep",
+    "ECU": "ecuador",
+    "EGY": "egypt",
+    "SLV": "el.?salvador",
+    "GNQ": "guine.*eq|eq.*guine|^(?=.*span).*guinea",
+    "ERI": "eritrea",
+    "EST": "estonia",
+    "ETH": "ethiopia|abyssinia",
+    "FLK": "falkland|malvinas",
+    "FRO": "faroe|faeroe",
+    "FJI": "fiji",
+    "FIN": "finland",
+    "FRA": r"^(?!.*\bdep)(?!.*martinique).*france|french.?republic|\bgaul",
+    "GUF": "^(?=.*french).*guiana",
+    "PYF": "french.?polynesia|tahiti",
+    "ATF": "french.?southern",
+    "GAB": "gabon",
+    "GMB": "gambia",
+    "GEO": "^(?!.*south).*georgia",
+    "DDR": "german.?democratic.?republic|democratic.?republic.*germany|east.germany",
+    "DEU": r"^(?!.*east).*germany|^(?=.*\bfed.*\brep).*german",
+    "GHA": "ghana|gold.?coast",
+    "GIB": "gibraltar",
+    "GRC": "greece|hellenic|hellas",
+    "GRL": "greenland",
+    "GRD": "grenada",
+    "GLP": "guadeloupe",
+    "GUM": r"\bguam",
+    "GTM": "guatemala",
+    "GGY": "guernsey",
+    "GIN": "^(?!.*eq)(?!.*span)(?!.*bissau)(?!.*portu)(?!.*new).*guinea",
+    "GNB": "bissau|^(?=.*portu).*guinea",
+    "GUY": "guyana|british.?guiana",
+    "HTI": "haiti",
+    "HMD": "heard.*mcdonald",
+    "VAT": "holy.?see|vatican|papal.?st",
+    "HND": "^(?!.*brit).*honduras",
+    "HKG": "hong.?kong",
+    "HUN": "^(?!.*austr).*hungary",
+    "ISL": "iceland",
+    "IND": "india(?!.*ocea)",
+    "IDN": "indonesia",
+    "IRN": r"\biran|persia",
+    "IRQ": r"\biraq|mesopotamia",
+    "IRL": "(^ireland)|(^republic.*ireland)",
+    "IMN": r"^(?=.*isle).*\bman",
+    "ISR": "israel",
+    "ITA": "italy",
+    "JAM": "jamaica",
+    "JPN": "japan",
+    "JEY": "jersey",
+    "JOR": "jordan",
+    "KAZ": "kazak",
+    "KEN": "kenya|british.?east.?africa|east.?africa.?prot",
+    "KIR": "kiribati",
+    "PRK": r"^(?=.*democrat|people|north|d.*p.*.r).*\bkorea|dprk|korea.*(d.*p.*r)",
+    "KWT": "kuwait",
+    "KGZ": "kyrgyz|kirghiz",
+    "LAO": r"\blaos?\b",
+    "LVA": "latvia",
+    "LBN": "lebanon",
+    "LSO": "lesotho|basuto",
+    "LBR": "liberia",
+    "LBY": "libya",
+    "LIE": "liechtenstein",
+    "LTU": "lithuania",
+    "LUX": "^(?!.*belg).*luxem",
+    "MAC": "maca(o|u)",
+    "MDG": "madagascar|malagasy",
+    "MWI": "malawi|nyasa",
+    "MYS": "malaysia",
+    "MDV": "maldive",
+    "MLI": r"\bmali\b",
+    "MLT": r"\bmalta",
+    "MHL": "marshall",
+    "MTQ": "martinique",
+    "MRT": "mauritania",
+    "MUS": "mauritius",
+    "MYT": r"\bmayotte",
+    "MEX": r"\bmexic",
+    "FSM": "fed.*micronesia|micronesia.*fed",
+    "MCO": "monaco",
+    "MNG": "mongolia",
+    "MNE": "^(?!.*serbia).*montenegro",
+    "MSR": "montserrat",
+    "MAR": r"morocco|\bmaroc",
+    "MOZ": "mozambique",
+    "MMR": "myanmar|burma",
+    "NAM": "namibia",
+    "NRU": "nauru",
+    "NPL": "nepal",
+    "NLD": r"^(?!.*\bant)(?!.*\bcarib).*netherlands",
+    "ANT": r"^(?=.*\bant).*(nether|dutch)",
+    "NCL": "new.?caledonia",
+    "NZL": "new.?zealand",
+    "NIC": "nicaragua",
+    "NER": r"\bniger(?!ia)",
+    "NGA": "nigeria",
+    "NIU": "niue",
+    "NFK": "norfolk",
+    "MNP": "mariana",
+    "NOR": "norway",
+    "OMN": r"\boman|trucial",
+    "PAK": "^(?!.*east).*paki?stan",
+    "PLW": "palau",
+    "PSE": r"palestin|\bgaza|west.?bank",
+    "PAN": "panama",
+    "PNG": "papua|new.?guinea",
+    "PRY": "paraguay",
+    "PER": "peru",
+    "PHL": "philippines",
+    "PCN": "pitcairn",
+    "POL": "poland",
+    "PRT": "portugal",
+    "PRI": "puerto.?rico",
+    "QAT": "qatar",
+    "KOR": r"^(?!.*d.*p.*r)(?!.*democrat)(?!.*people)(?!.*north).*\bkorea(?!.*d.*p.*r)",
+    "MDA": "moldov|b(a|e)ssarabia",
+    "REU": "r(e|é)union",
+    "ROU": "r(o|u|ou)mania",
+    "RUS": r"\brussia|soviet.?union|u\.?s\.?s\.?r|socialist.?republics",
+    "RWA": "rwanda",
+    "BLM": "barth(e|é)lemy",
+    "SHN": "helena",
+    "KNA": r"kitts|\bnevis",
+    "LCA": r"\blucia",
+    "MAF": "^(?=.*collectivity).*martin|^(?=.*france).*martin(?!ique)|^(?=.*french).*martin(?!ique)",
+    "SPM": "miquelon",
+    "VCT": "vincent",
+    "WSM": "^(?!.*amer).*samoa",
+    "SMR": "san.?marino",
+    "STP": r"\bs(a|ã)o.?tom(e|é)",
+    "SAU": r"\bsa\w*.?arabia",
+    "SEN": "senegal",
+    "SRB": "^(?!.*monte).*serbia",
+    "SYC": "seychell",
+    "SLE": "sierra",
+    "SGP": "singapore",
+    "SXM": "^(?!.*martin)(?!.*saba).*maarten",
+    "SVK": "^(?!.*cze).*slovak",
+    "SVN": "slovenia",
+    "SLB": "solomon",
+    "SOM": "somali",
+    "ZAF": r"south.africa|s\\..?africa",
+    "SGS": "south.?georgia|sandwich",
+    "SSD": r"\bs\w*.?sudan",
+    "ESP": "spain",
+    "LKA": "sri.?lanka|ceylon",
+    "SDN": r"^(?!.*\bs(?!u)).*sudan",
+    "SUR": "surinam|dutch.?guiana",
+    "SJM": "svalbard",
+    "SWZ": "swaziland",
+    "SWE": "sweden",
+    "CHE": "switz|swiss",
+    "SYR": "syria",
+    "TWN": "taiwan|taipei|formosa|^(?!.*peo)(?=.*rep).*china",
+    "TJK": "tajik",
+    "THA": r"thailand|\bsiam",
+    "MKD": "macedonia|fyrom",
+    "TLS": "^(?=.*leste).*timor|^(?=.*east).*timor",
+    "TGO": "togo",
+    "TKL": "tokelau",
+    "TON": "tonga",
+    "TTO": "trinidad|tobago",
+    "TUN": "tunisia",
+    "TUR": "turkey",
+    "TKM": "turkmen",
+    "TCA": "turks",
+    "TUV": "tuvalu",
+    "UGA": "uganda",
+    "UKR": "ukrain",
+    "ARE": r"emirates|^u\.?a\.?e\.?$|united.?arab.?em",
+    "GBR": r"united.?kingdom|britain|^u\.?k\.?$",
+    "TZA": "tanzania",
+    "USA": r"united.?states\b(?!.*islands)|\bu\.?s\.?a\.?\b|^\s*u\.?s\.?\b(?!.*islands)",
+    "UMI": "minor.?outlying.?is",
+    "URY": "uruguay",
+    "UZB": "uzbek",
+    "VUT": "vanuatu|new.?hebrides",
+    "VEN": "venezuela",
+    "VNM": "^(?!.*republic).*viet.?nam|^(?=.*socialist).*viet.?nam",
+    "VGB": r"^(?=.*\bu\.?\s?k).*virgin|^(?=.*brit).*virgin|^(?=.*kingdom).*virgin",
+    "VIR": r"^(?=.*\bu\.?\s?s).*virgin|^(?=.*states).*virgin",
+    "WLF": "futuna|wallis",
+    "ESH": "western.sahara",
+    "YEM": r"^(?!.*arab)(?!.*north)(?!.*sana)(?!.*peo)(?!.*dem)(?!.*south)(?!.*aden)(?!.*\bp\.?d\.?r).*yemen",
+    "YMD": r"^(?=.*peo).*yemen|^(?!.*rep)(?=.*dem).*yemen|^(?=.*south).*yemen|^(?=.*aden).*yemen|^(?=.*\bp\.?d\.?r).*yemen",
+    "YUG": "yugoslavia",
+    "ZMB": "zambia|northern.?rhodesia",
+    "EAZ": "zanzibar",
+    "ZWE": "zimbabwe|^(?!.*northern).*rhodesia",
+}
+
+_patrones = {codigo: re.compile(patron, re.IGNORECASE) for codigo, patron in PATRONES_ISO3.items()}
+
+_paises = CacheLRU(
+    max_items=int(os.environ.get("PAISES_CACHE_ITEMS", 64)),
+    ttl=int(os.environ.get("DATASET_CACHE_TTL", 4 * 3600)),
+    nombre="paises",
+    compartida=True,
+)
+
+
+@lru_cache(maxsize=4096)
+def iso3(nombre):
+    """Código ISO-3 de un nombre de país (o de un código ISO-3 ya escrito); None si no se reconoce."""
+    if not isinstance(nombre, str) or not nombre.strip():
+        return None
+
+    nombre = nombre.strip()
+    if len(nombre) == 3 and nombre.isupper() and nombre in PATRONES_ISO3:
+        return nombre
+
+    for codigo, patron in _patrones.items():
+        if patron.search(nombre):
+            return codigo
+    return None
+
+
+def tabla_paises(paises):
+    """DataFrame (Country, ISO3) con los valores distintos de la columna Country."""
+    if isinstance(paises.dtype, pd.CategoricalDtype):
+        # Solo las categorías: no hace falta recorrer las filas
+        valores = list(paises.cat.categories)
+    else:
+        valores = list(pd.unique(paises.dropna()))
+
+    return pd.DataFrame({
+        "Country": [str(v) for v in valores],
+        "ISO3": [iso3(str(v)) for v in valores],
+    })
+
+
+def guardar_paises(dataset_id, df):
+    """Calcula y guarda la tabla de países del dataset (al guardarlo)."""
+    if "Country" not in df.columns:
+        return
+    tabla = tabla_paises(df["Country"])
+    # Se avisa una vez por dataset, no en cada dibujo del mapa
+    sin_codigo = tabla.loc[tabla["ISO3"].isna(), "Country"]
+    if not sin_codigo.empty:
+        print("Países sin código ISO-3 (no se dibujan en el mapa):", ", ".join(sin_codigo))
+    _paises.set(dataset_id, tabla)
+
+
+def paises_dataset(dataset_id, paises):
+    """
+    Tabla de países del dataset. Si ya no está en caché se vuelve a
+    calcular con los valores de Country que se pasan (p. ej. los del cubo).
+    """
+    tabla = _paises.get(dataset_id)
+    if tabla is None:
+        tabla = tabla_paises(paises)
+        _paises.set(dataset_id, tabla)
+    return tabla
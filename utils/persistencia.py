@@ -0,0 +1,165 @@
+# utils/persistencia.py
+# Copia columnar en disco (Arrow IPC) de los datasets ya normalizados.
+# El fichero se escribe una sola vez por contenido y después se abre con
+# memory-map: cargarlo tras un reinicio, o desde otro worker de gunicorn,
+# no vuelve a parsear el Excel y todos los procesos comparten las mismas
+# páginas del fichero en la caché del sistema operativo.
+#
+# El directorio tiene un tamaño máximo (DATASETS_DISCO_MB): al guardar uno
+# nuevo se borran los que llevan más tiempo sin usarse (cada uso actualiza
+# la fecha de modificación del fichero) y los de versiones antiguas del
+# formato. Así no se acumulan los ledgers que un "añadir" deja obsoletos.
+import hashlib
+import os
+import time
+
+import pyarrow as pa
+
+DIRECTORIO_DATASETS = os.environ.get(
+    "DATASETS_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache", "datasets"),
+)
+
+# Versión del formato en disco: cambiarla invalida las copias antiguas
+VERSION_FORMATO = 3
+
+# Tamaño máximo de los datasets en disco
+MAX_BYTES_DISCO = int(os.environ.get("DATASETS_DISCO_MB", 4096)) * 1024 ** 2
+
+# Un uso solo se anota en el fichero si el anterior es más antiguo que esto
+_INTERVALO_USO = 60
+
+
+def hash_origen(datos):
+    """Hash de los bytes (o del texto) del archivo subido tal cual."""
+    if isinstance(datos, str):
+        datos = datos.encode("utf-8")
+    return hashlib.sha1(datos).hexdigest()[:20]
+
+
+def _ruta_dataset(dataset_id):
+    return os.path.join(DIRECTORIO_DATASETS, f"{dataset_id}.v{VERSION_FORMATO}.arrow")
+
+
+def _ruta_origen(origen):
+    return os.path.join(DIRECTORIO_DATASETS, "origenes", f"{origen}.txt")
+
+
+def _escribir_atomico(ruta, escribir):
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    escribir(temporal)
+    os.replace(temporal, ruta)
+
+
+def guardar_columnar(dataset_id, df):
+    """
+    Escribe el ledger en formato Arrow IPC sin comprimir (requisito para
+    poder leerlo con memory-map sin copias). Si ya existe no se reescribe.
+    """
+    ruta = _ruta_dataset(dataset_id)
+    if os.path.exists(ruta):
+        return
+
+    def escribir(temporal):
+        tabla = pa.Table.from_pandas(df, preserve_index=False)
+        with pa.OSFile(temporal, "wb") as sink:
+            with pa.ipc.new_file(sink, tabla.schema) as writer:
+                writer.write_table(tabla)
+
+    try:
+        _escribir_atomico(ruta, escribir)
+    except (OSError, pa.ArrowException) as e:
+        print("No se pudo guardar el dataset en disco:", e)
+        return
+    liberar_disco(conservar=ruta)
+
+
+def marcar_uso(dataset_id):
+    """Anota el uso del dataset (fecha de modificación) para liberar_disco."""
+    ruta = _ruta_dataset(dataset_id)
+    try:
+        if time.time() - os.path.getmtime(ruta) > _INTERVALO_USO:
+            os.utime(ruta)
+    except OSError:
+        pass
+
+
+def liberar_disco(conservar=None, max_bytes=MAX_BYTES_DISCO):
+    """
+    Borra los datasets de versiones antiguas del formato y, si el resto
+    supera max_bytes, los menos usados recientemente (nunca `conservar`).
+    Borrar un fichero abierto con memory-map no afecta a quien ya lo tiene
+    cargado; si se vuelve a pedir, df_from_store devolverá None.
+    """
+    try:
+        nombres = os.listdir(DIRECTORIO_DATASETS)
+    except OSError:
+        return
+
+    ficheros = []
+    for nombre in nombres:
+        if not nombre.endswith(".arrow"):
+            continue
+        ruta = os.path.join(DIRECTORIO_DATASETS, nombre)
+        try:
+            if not nombre.endswith(f".v{VERSION_FORMATO}.arrow"):
+                os.remove(ruta)
+                continue
+            info = os.stat(ruta)
+        except OSError:
+            continue
+        ficheros.append((info.st_mtime, info.st_size, ruta))
+
+    total = sum(tamano for _, tamano, _ in ficheros)
+    for _, tamano, ruta in sorted(ficheros):
+        if total <= max_bytes:
+            break
+        if ruta == conservar:
+            continue
+        try:
+            os.remove(ruta)
+            total -= tamano
+        except OSError as e:
+            print("No se pudo borrar el dataset del disco:", e)
+
+
+def cargar_columnar(dataset_id):
+    """
+    Abre con memory-map el dataset guardado y lo devuelve como DataFrame.
+    Las columnas numéricas y de fechas apuntan directamente al fichero
+    (solo lectura); devuelve None si no existe o no se puede leer.
+    """
+    ruta = _ruta_dataset(dataset_id)
+    if not os.path.exists(ruta):
+        return None
+    try:
+        with pa.memory_map(ruta, "r") as fuente:
+            tabla = pa.ipc.open_file(fuente).read_all()
+        # split_blocks evita consolidar columnas (lo que obligaría a copiar)
+        return tabla.to_pandas(split_blocks=True)
+    except (OSError, pa.ArrowException) as e:
+        print("No se pudo cargar el dataset guardado:", e)
+        return None
+
+
+def registrar_origen(origen, dataset_id):
+    """Recuerda qué dataset salió de un archivo (hash de sus bytes)."""
+    def escribir(temporal):
+        with open(temporal, "w") as f:
+            f.write(dataset_id)
+
+    try:
+        _escribir_atomico(_ruta_origen(origen), escribir)
+    except OSError as e:
+        print("No se pudo registrar el origen del dataset:", e)
+
+
+def dataset_de_origen(origen):
+    """ID del dataset ya convertido a partir de ese archivo, o None."""
+    ruta = _ruta_origen(origen)
+    if not os.path.exists(ruta):
+        return None
+    with open(ruta) as f:
+        dataset_id = f.read().strip()
+    return dataset_id if os.path.exists(_ruta_dataset(dataset_id)) else None
@@ -0,0 +1,224 @@
+# utils/piramide.py
+# Pirámide temporal: el importe agregado por día, semana, mes, trimestre y
+# año (× Institution × Category × Signo, con sum y count). Se calcula una
+# vez por dataset: el nivel diario sale de las transacciones y cada nivel
+# superior del diario, sin volver a recorrerlas. Los gráficos con eje de
+# fechas eligen el nivel según el rango visible (relayoutData): al hacer
+# zoom en un mes se ven los días, y una década entera se ve por trimestres.
+import os
+
+import pandas as pd
+
+from utils.agregados import SIGNOS, filtrar_cubo
+from utils.cache import CacheLRU
+from utils.data_utils import derivado_from_store
+
+DIMENSIONES_PIRAMIDE = ["Periodo", "Institution", "Category", "Signo"]
+
+# Nivel → (frecuencia del periodo, frecuencia de pd.date_range). Los
+# periodos se etiquetan con su último día, como el cubo mensual.
+NIVELES = {
+    "dia": ("D", "D"),
+    "semana": ("W-SUN", "W-SUN"),
+    "mes": ("M", "ME"),
+    "trimestre": ("Q", "QE"),
+    "anio": ("Y", "YE"),
+}
+
+# Nombre y adjetivo de cada nivel para ejes, títulos y leyendas ("Balance mensual")
+NOMBRES = {"dia": "Día", "semana": "Semana", "mes": "Mes", "trimestre": "Trimestre", "anio": "Año"}
+ADJETIVOS = {
+    "dia": "diario",
+    "semana": "semanal",
+    "mes": "mensual",
+    "trimestre": "trimestral",
+    "anio": "anual",
+}
+
+# Máximo de periodos (barras o puntos) en el rango visible: se usa el
+# nivel más fino que no lo supere
+MAX_PERIODOS = int(os.environ.get("PIRAMIDE_MAX_PERIODOS", 120))
+
+# La vista completa nunca baja de este nivel (los gráficos son mensuales)
+NIVEL_VISTA_COMPLETA = "mes"
+
+_piramides = CacheLRU(
+    max_items=int(os.environ.get("DATASET_CACHE_ITEMS", 8)),
+    ttl=int(os.environ.get("DATASET_CACHE_TTL", 4 * 3600)),
+    max_bytes=int(os.environ.get("PIRAMIDE_CACHE_MB", 256)) * 1024 ** 2,
+    nombre="piramides",
+    compartida=True,
+)
+
+
+# === CONSTRUCCIÓN ===
+def _fin_periodo(fechas, nivel):
+    """Último día del periodo de `nivel` que contiene cada fecha."""
+    if nivel == "dia":
+        return fechas.dt.normalize()
+    return fechas.dt.to_period(NIVELES[nivel][0]).dt.end_time.dt.normalize()
+
+
+def construir_piramide(df):
+    """Dict nivel → DataFrame (Periodo, Institution, Category, Signo, sum, count)."""
+    # A céntimos para que las sumas no arrastren el error de representación
+    importe = df["Amount"].astype("float64").round(2)
+
+    signo = pd.Series(
+        pd.Categorical.from_codes(
+            (importe > 0).astype("int8") + 2 * (importe == 0).astype("int8"),
+            categories=SIGNOS,
+        ),
+        index=df.index,
+    )
+
+    diario = (
+        pd.DataFrame({
+            "Periodo": df["Date"].dt.normalize(),
+            "Institution": df["Institution"],
+            "Category": df["Category"],
+            "Signo": signo,
+            "Amount": importe,
+        })
+        .groupby(DIMENSIONES_PIRAMIDE, observed=True, dropna=False, sort=False)["Amount"]
+        .agg(["sum", "count"])
+        .reset_index()
+    )
+
+    piramide = {"dia": diario}
+    for nivel in list(NIVELES)[1:]:
+        # Cada nivel se agrega desde el diario (mucho más pequeño que el ledger)
+        agrupado = diario.assign(Periodo=_fin_periodo(diario["Periodo"], nivel))
+        piramide[nivel] = (
+            agrupado
+            .groupby(DIMENSIONES_PIRAMIDE, observed=True, dropna=False, sort=False)
+            .agg({"sum": "sum", "count": "sum"})
+            .reset_index()
+        )
+
+    return piramide
+
+
+def piramide_from_store(dataset_id):
+    """
+    Devuelve la pirámide temporal del dataset guardado en Data.
+    Se construye una sola vez por dataset (aunque lo pidan a la vez varios
+    workers) y después se sirve desde caché.
+    """
+    return derivado_from_store(_piramides, dataset_id, construir_piramide)
+
+
+def actualizar_piramide(piramide_base, piramide_nueva, ledger):
+    """
+    Pirámide del ledger ampliado a partir de la anterior y de la de las
+    filas añadidas: en cada nivel solo se reagregan los periodos (días,
+    semanas, meses...) que tienen filas nuevas; el resto se reutiliza.
+    """
+    piramide = {}
+    for nivel in NIVELES:
+        # Mismas categorías en las dos partes para que concat siga siendo categórico
+        partes = []
+        for parte in (piramide_base[nivel], piramide_nueva[nivel]):
+            parte = parte.copy()
+            for col in ("Institution", "Category"):
+                parte[col] = parte[col].cat.set_categories(ledger[col].cat.categories)
+            partes.append(parte)
+        base, nueva = partes
+
+        afectados = base["Periodo"].isin(nueva["Periodo"].unique())
+        reagregado = (
+            pd.concat([base[afectados], nueva], ignore_index=True)
+            .groupby(DIMENSIONES_PIRAMIDE, observed=True, dropna=False, sort=False)
+            .agg({"sum": "sum", "count": "sum"})
+            .reset_index()
+        )
+        piramide[nivel] = pd.concat([base[~afectados], reagregado], ignore_index=True)
+
+    return piramide
+
+
+def ampliar_piramide(base_id, nuevas, ledger):
+    """
+    Pirámide del dataset ampliado con las filas `nuevas`, sin recorrer el
+    histórico. None si la de la base no está calculada (se construirá
+    entera la primera vez que se pida).
+    """
+    piramide_base = _piramides.get(base_id)
+    if piramide_base is None:
+        return None
+    return actualizar_piramide(piramide_base, construir_piramide(nuevas), ledger)
+
+
+def guardar_piramide(dataset_id, piramide):
+    _piramides.set(dataset_id, piramide)
+
+
+# === ELECCIÓN DEL NIVEL ===
+def extension(piramide):
+    """(primer día, último día) con datos."""
+    dias = piramide["dia"]["Periodo"]
+    return dias.min(), dias.max()
+
+
+def nivel_para_rango(inicio, fin, minimo=None):
+    """
+    Nivel más fino con el que el rango [inicio, fin] no pasa de
+    MAX_PERIODOS periodos. Con `minimo` no se baja de ese nivel.
+    """
+    inicio, fin = pd.Timestamp(inicio), pd.Timestamp(fin)
+    niveles = list(NIVELES)
+    desde = niveles.index(minimo) if minimo else 0
+
+    for nivel in niveles[desde:-1]:
+        frecuencia = NIVELES[nivel][0]
+        periodos = (fin.to_period(frecuencia) - inicio.to_period(frecuencia)).n + 1
+        if periodos <= MAX_PERIODOS:
+            return nivel
+    return niveles[-1]
+
+
+def vista(piramide, rango=(None, None)):
+    """
+    (nivel, inicio, fin) a dibujar para un rango de rango_zoom(): el rango
+    pedido, o toda la extensión del dataset si es (None, None) (vista
+    completa, sin bajar de NIVEL_VISTA_COMPLETA).
+    """
+    inicio, fin = rango
+    if inicio is None or fin is None:
+        inicio, fin = extension(piramide)
+        return nivel_para_rango(inicio, fin, minimo=NIVEL_VISTA_COMPLETA), None, None
+    return nivel_para_rango(inicio, fin), pd.Timestamp(inicio), pd.Timestamp(fin)
+
+
+def adjetivo(nivel, plural=False):
+    """'mensual' / 'mensuales', 'diario' / 'diarios'..."""
+    palabra = ADJETIVOS[nivel]
+    if not plural:
+        return palabra
+    return palabra + ("s" if palabra[-1] in "aeiou" else "es")
+
+
+# === SERIES ===
+def serie_nivel(piramide, nivel, signo=None, medida="sum", inicio=None, fin=None, **filtros):
+    """
+    Serie del importe por periodo de `nivel` (como serie_mensual del cubo),
+    con los periodos vacíos a 0. Con inicio/fin solo se devuelven los
+    periodos que se solapan con ese rango.
+    """
+    c = filtrar_cubo(piramide[nivel], signo=signo, **filtros)
+
+    frecuencia, frecuencia_rango = NIVELES[nivel]
+    if inicio is not None:
+        c = c[c["Periodo"] >= pd.Timestamp(inicio).normalize()]
+    if fin is not None:
+        c = c[c["Periodo"] <= pd.Timestamp(fin).to_period(frecuencia).end_time.normalize()]
+
+    if c.empty:
+        return pd.Series(dtype="float64", name="Amount")
+
+    serie = c.groupby("Periodo")[medida].sum().sort_index()
+
+    periodos = pd.date_range(serie.index.min(), serie.index.max(), freq=frecuencia_rango, name="Date")
+    serie = serie.reindex(periodos, fill_value=0)
+    serie.name = "Amount"
+    return serie
@@ -0,0 +1,197 @@
+# utils/series.py
+# Series temporales largas (saldo diario o transacción a transacción) para
+# los gráficos con zoom. La serie completa se calcula una vez por dataset y
+# filtros; en cada petición se recorta a la ventana visible y, si tiene más
+# puntos de los que el navegador puede dibujar con soltura, se diezma al
+# ancho del gráfico en píxeles (MinMax + LTTB). Al hacer zoom se vuelve a
+# pedir la ventana, que va a resolución completa cuando ya cabe en ese ancho.
+import math
+import os
+
+import numpy as np
+import pandas as pd
+from dash.exceptions import PreventUpdate
+
+from utils.cache import CacheLRU
+from utils.data_utils import derivado_from_store
+
+# Puntos que se envían al diezmar (~ un punto por píxel de ancho)
+ANCHO_PIXELES = int(os.environ.get("SERIES_ANCHO_PX", 1600))
+
+_series = CacheLRU(
+    max_items=int(os.environ.get("SERIES_CACHE_ITEMS", 32)),
+    ttl=int(os.environ.get("DATASET_CACHE_TTL", 4 * 3600)),
+    max_bytes=int(os.environ.get("SERIES_CACHE_MB", 256)) * 1024 ** 2,
+    nombre="series",
+    compartida=True,
+)
+
+
+# === SERIE DE SALDO ===
+def _lista(valores):
+    """Filtro de un Dropdown múltiple como tupla ordenada (para la clave de caché)."""
+    if valores is None:
+        return ()
+    if isinstance(valores, str):
+        return (valores,)
+    return tuple(sorted(valores))
+
+
+def serie_saldo(dataset_id, granularidad="dia", instituciones=None, categorias=None):
+    """
+    Saldo acumulado del dataset (pd.Series indexada por fecha, ordenada),
+    al final de cada día o tras cada transacción. Acepta los mismos filtros
+    que la pestaña Mensual. Devuelve None si no hay dataset.
+    """
+    instituciones, categorias = _lista(instituciones), _lista(categorias)
+    return derivado_from_store(
+        _series, dataset_id,
+        lambda df: _construir_serie(df, granularidad, instituciones, categorias),
+        clave=(dataset_id, granularidad, instituciones, categorias),
+    )
+
+
+def _construir_serie(df, granularidad, instituciones, categorias):
+    mascara = np.ones(len(df), dtype=bool)
+    if instituciones:
+        mascara &= df["Institution"].isin(instituciones).to_numpy()
+    if categorias:
+        mascara &= df["Category"].isin(categorias).to_numpy()
+
+    fechas = df["Date"].to_numpy()[mascara]
+    # A céntimos antes de acumular
+    importes = df["Amount"].to_numpy()[mascara].round(2)
+
+    orden = np.argsort(fechas, kind="stable")
+    fechas, importes = fechas[orden], importes[orden]
+
+    if granularidad == "dia":
+        dias, inverso = np.unique(fechas.astype("datetime64[D]"), return_inverse=True)
+        fechas, importes = dias.astype("datetime64[ns]"), np.bincount(inverso, weights=importes)
+
+    return pd.Series(np.cumsum(importes).round(2), index=pd.DatetimeIndex(fechas), name="Saldo")
+
+
+def ventana(serie, inicio=None, fin=None):
+    """Tramo de la serie entre dos fechas, con un punto más a cada lado para que la línea no se corte."""
+    i = 0 if inicio is None else max(serie.index.searchsorted(pd.Timestamp(inicio)) - 1, 0)
+    j = len(serie) if fin is None else serie.index.searchsorted(pd.Timestamp(fin), side="right") + 1
+    return serie.iloc[i:j]
+
+
+def rango_zoom(relayout):
+    """
+    Rango del eje x pedido en un relayoutData de Plotly:
+    (inicio, fin), (None, None) al volver a la vista completa o None si el
+    evento no cambia el eje x (p. ej. {"autosize": True}).
+    """
+    if not relayout:
+        return None
+    if relayout.get("xaxis.autorange"):
+        return None, None
+    if "xaxis.range[0]" in relayout and "xaxis.range[1]" in relayout:
+        return relayout["xaxis.range[0]"], relayout["xaxis.range[1]"]
+    if "xaxis.range" in relayout:
+        inicio, fin = relayout["xaxis.range"]
+        return inicio, fin
+    return None
+
+
+def rango_visible(relayout):
+    """
+    rango_zoom() para los callbacks disparados por relayoutData: los eventos
+    que no cambian el eje x (autosize, leyenda...) cancelan el callback.
+    """
+    rango = rango_zoom(relayout)
+    if rango is None:
+        raise PreventUpdate
+    return rango
+
+
+def fijar_rango_x(fig, inicio=None, fin=None):
+    """
+    Escribe en el Patch `fig` el rango del eje x: el del zoom, o autorange
+    en la vista completa. Sin uirevision, plotly aplica el rango que trae la
+    figura, así que cada Patch que cambia los datos tiene que llevarlo.
+    """
+    if inicio is None:
+        fig["layout"]["xaxis"]["autorange"] = True
+    else:
+        fig["layout"]["xaxis"]["autorange"] = False
+        fig["layout"]["xaxis"]["range"] = [str(inicio), str(fin)]
+
+
+# === DIEZMADO ===
+def _preseleccion_minmax(y, n_cubetas):
+    """Índices del mínimo y del máximo de cada cubeta (de igual número de puntos)."""
+    n = len(y)
+    tamano = math.ceil(n / n_cubetas)
+    relleno = np.full(tamano * n_cubetas - n, np.nan)
+    cubetas = np.concatenate([y, relleno]).reshape(n_cubetas, tamano)
+
+    # Las cubetas que solo tienen relleno se descartan
+    validas = ~np.isnan(cubetas).all(axis=1)
+    desplazamiento = np.arange(n_cubetas)[validas] * tamano
+    minimos = np.nanargmin(cubetas[validas], axis=1) + desplazamiento
+    maximos = np.nanargmax(cubetas[validas], axis=1) + desplazamiento
+
+    return np.unique(np.concatenate([[0], minimos, maximos, [n - 1]]))
+
+
+def lttb(x, y, n):
+    """
+    Largest-Triangle-Three-Buckets: índices de `n` puntos que conservan la
+    forma de la serie (en cada cubeta, el que forma el triángulo de mayor
+    área con el punto elegido antes y la media de la cubeta siguiente).
+    """
+    total = len(x)
+    if n >= total or n < 3:
+        return np.arange(total)
+
+    bordes = np.linspace(1, total - 1, n - 1).astype(np.int64)
+    indices = np.empty(n, dtype=np.int64)
+    indices[0], indices[-1] = 0, total - 1
+
+    anterior = 0
+    for i in range(n - 2):
+        inicio, fin = bordes[i], max(bordes[i + 1], bordes[i] + 1)
+        siguiente_fin = bordes[i + 2] if i + 2 < n - 1 else total
+        media_x = x[fin:max(siguiente_fin, fin + 1)].mean()
+        media_y = y[fin:max(siguiente_fin, fin + 1)].mean()
+
+        areas = np.abs(
+            (x[anterior] - media_x) * (y[inicio:fin] - y[anterior])
+            - (x[anterior] - x[inicio:fin]) * (media_y - y[anterior])
+        )
+        anterior = inicio + int(areas.argmax())
+        indices[i + 1] = anterior
+
+    return indices
+
+
+def diezmar(serie, n=ANCHO_PIXELES):
+    """
+    Reduce la serie a unos `n` puntos: primero se quedan el mínimo y el
+    máximo de cada cubeta (picos y valles no se pierden) y sobre ellos se
+    aplica LTTB. Series cortas se devuelven enteras.
+    """
+    if len(serie) <= n:
+        return serie
+
+    y = serie.to_numpy(dtype="float64")
+    candidatos = _preseleccion_minmax(y, 2 * n)
+
+    # Tiempo en segundos desde el primer punto: áreas sin pérdida de precisión
+    x = (serie.index.asi8[candidatos] - serie.index.asi8[0]) / 1e9
+    elegidos = candidatos[lttb(x, y[candidatos], n)]
+    return serie.iloc[elegidos]
+
+
+def puntos_a_dibujar(serie):
+    """
+    Serie a enviar: la ventana diezmada al ancho en píxeles si tiene más
+    puntos que ANCHO_PIXELES; si no (zoom en un tramo corto), entera a
+    resolución completa. Con como mucho un punto por píxel, SVG basta y
+    no hace falta WebGL.
+    """
+    return diezmar(serie)
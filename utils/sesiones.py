@@ -0,0 +1,264 @@
+# utils/sesiones.py
+# Gestor de sesiones: cada navegador recibe un ID de sesión (cookie) y se
+# anota qué datasets usa. Si la memoria de todas las cachés supera el
+# presupuesto, se sacan de memoria los datos de las sesiones inactivas,
+# empezando por la que lleva más tiempo sin usarse. No se pierde nada: el
+# ledger está en disco (Arrow) y cubos e índices siguen en la caché
+# compartida (utils/backends.py), así que al volver el usuario se recargan
+# sin recalcular.
+#
+# Además, cada dataset solo se sirve a las sesiones que lo han subido (o han
+# subido el mismo archivo): el ID que llega en Data no basta para leerlo.
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from flask import g, has_request_context, request
+
+from utils.cache import CACHES
+from utils.jobs import cache_jobs
+from utils.metricas import registrar_colector
+
+COOKIE_SESION = "sesion_dashboard"
+
+# Memoria total (todas las cachés con nombre) antes de desalojar sesiones
+PRESUPUESTO_BYTES = int(os.environ.get("MEMORIA_TOTAL_MB", 2048)) * 1024 ** 2
+
+# Sesiones sin actividad durante este tiempo se olvidan del todo
+TTL_SESION = int(os.environ.get("SESION_TTL", 24 * 3600))
+
+# Con SESIONES_TOKEN, GET /sesiones con "Authorization: Bearer <token>"
+# devuelve todas las sesiones; sin él, cada navegador solo ve la suya
+TOKEN_SESIONES = os.environ.get("SESIONES_TOKEN")
+
+
+def _de_dataset(clave, dataset_id):
+    """Las entradas de las cachés usan el ID del dataset como clave o como primer elemento."""
+    return clave == dataset_id or (isinstance(clave, tuple) and clave and clave[0] == dataset_id)
+
+
+class GestorSesiones:
+    """
+    Registro de sesiones -> datasets usados, en orden de último uso.
+    Solo gestiona la memoria de este proceso (cada worker tiene el suyo).
+    """
+
+    def __init__(self, presupuesto=PRESUPUESTO_BYTES, ttl=TTL_SESION):
+        self.presupuesto = presupuesto
+        self.ttl = ttl
+        self._sesiones = OrderedDict()   # id -> {"datasets": set, "ultimo": t, "en_memoria": bool}
+        self._lock = threading.Lock()
+        self.desalojos = 0
+
+    def usar(self, sesion_id, dataset_id):
+        """Anota que la sesión está usando el dataset (y la marca como la más reciente)."""
+        with self._lock:
+            sesion = self._sesiones.pop(sesion_id, None) or {"datasets": set()}
+            sesion["datasets"].add(dataset_id)
+            sesion["ultimo"] = time.time()
+            sesion["en_memoria"] = True
+            self._sesiones[sesion_id] = sesion
+
+    def memoria_total(self):
+        return sum(cache.bytes_usados for cache in CACHES.values())
+
+    def _claves_de(self, cache, datasets):
+        return [c for c in cache.claves() if any(_de_dataset(c, d) for d in datasets)]
+
+    def memoria_sesion(self, sesion_id):
+        with self._lock:
+            sesion = self._sesiones.get(sesion_id)
+            datasets = set(sesion["datasets"]) if sesion else set()
+        return sum(cache.bytes_de(self._claves_de(cache, datasets)) for cache in CACHES.values())
+
+    def aplicar_presupuesto(self, sesion_actual=None):
+        """
+        Olvida las sesiones caducadas y, mientras la memoria supere el
+        presupuesto, desaloja los datos de la sesión menos reciente (nunca
+        los de la sesión actual ni los que comparte con sesiones en uso).
+        Devuelve los bytes liberados.
+        """
+        ahora = time.time()
+        with self._lock:
+            for sid in [s for s, d in self._sesiones.items() if ahora - d["ultimo"] > self.ttl]:
+                del self._sesiones[sid]
+
+        liberados = 0
+        while self.memoria_total() > self.presupuesto:
+            with self._lock:
+                candidatas = [
+                    s for s, d in self._sesiones.items()
+                    if d["en_memoria"] and s != sesion_actual
+                ]
+                if not candidatas:
+                    break
+                victima = candidatas[0]   # la que lleva más tiempo sin usarse
+                self._sesiones[victima]["en_memoria"] = False
+                protegidos = set().union(*(
+                    d["datasets"] for s, d in self._sesiones.items() if d["en_memoria"]
+                ))
+                datasets = self._sesiones[victima]["datasets"] - protegidos
+
+            for cache in CACHES.values():
+                liberados += cache.desalojar(self._claves_de(cache, datasets))
+            self.desalojos += 1
+
+        return liberados
+
+    def informe(self, sesion_id=None):
+        """
+        Resumen por sesión: datasets, segundos inactiva, memoria y si sigue en
+        memoria. Con `sesion_id`, solo el de esa sesión.
+        """
+        ahora = time.time()
+        with self._lock:
+            sesiones = [
+                (s, dict(d)) for s, d in self._sesiones.items()
+                if sesion_id is None or s == sesion_id
+            ]
+        return {
+            "presupuesto_bytes": self.presupuesto,
+            "memoria_bytes": self.memoria_total(),
+            "caches": {nombre: cache.bytes_usados for nombre, cache in CACHES.items()},
+            "sesiones": [
+                {
+                    "sesion": sid[:8],
+                    "datasets": len(d["datasets"]),
+                    "inactiva_s": round(ahora - d["ultimo"]),
+                    "en_memoria": d["en_memoria"],
+                    "memoria_bytes": self.memoria_sesion(sid),
+                }
+                for sid, d in sesiones
+            ],
+        }
+
+
+gestor = GestorSesiones()
+
+
+# Sesión de la petición que lanzó este proceso, si es un trabajo en segundo
+# plano (allí no hay petición ni cookies: ver utils/jobs.py)
+_en_trabajo = False
+_sesion_trabajo = None
+
+
+def fijar_sesion_trabajo(sesion_id):
+    """Se llama al empezar un trabajo en segundo plano, en su proceso."""
+    global _en_trabajo, _sesion_trabajo
+    _en_trabajo = True
+    _sesion_trabajo = sesion_id
+
+
+def sesion_actual():
+    """ID de sesión de la petición (o del trabajo) en curso; None fuera de ellos."""
+    if not has_request_context():
+        return _sesion_trabajo
+    return g.get("sesion") or request.cookies.get(COOKIE_SESION)
+
+
+# === PROPIEDAD DE LOS DATASETS ===
+# El permiso (sesión, dataset) se guarda en la caché de los trabajos, que
+# comparten todos los workers y los procesos en segundo plano, y caduca con
+# la sesión. Cada proceso recuerda un rato los que ya comprobó.
+_verificados = {}
+_INTERVALO_VERIFICACION = 60
+_MAX_VERIFICADOS = 10_000
+
+
+def _clave_acceso(sesion_id, dataset_id):
+    return f"acceso-{sesion_id}-{dataset_id}"
+
+
+def autorizar(dataset_id):
+    """Da acceso al dataset a la sesión en curso (quien lo sube o lo crea)."""
+    sesion = sesion_actual()
+    if sesion is None or dataset_id is None:
+        return
+    cache_jobs.set(_clave_acceso(sesion, dataset_id), True, expire=TTL_SESION)
+    _verificados[(sesion, dataset_id)] = time.time()
+
+
+def tiene_acceso(dataset_id):
+    """
+    True si la sesión en curso puede usar el dataset. Fuera de una petición
+    y de un trabajo en segundo plano (scripts, benchmarks, pruebas) no hay
+    sesión que comprobar y se permite.
+    """
+    if not has_request_context() and not _en_trabajo:
+        return True
+    sesion = sesion_actual()
+    if sesion is None:
+        return False
+
+    clave = (sesion, dataset_id)
+    ahora = time.time()
+    if ahora - _verificados.get(clave, 0) < _INTERVALO_VERIFICACION:
+        return True
+    # touch renueva la caducidad y devuelve False si el permiso no existe
+    if not cache_jobs.touch(_clave_acceso(sesion, dataset_id), expire=TTL_SESION):
+        return False
+
+    if len(_verificados) >= _MAX_VERIFICADOS:
+        _verificados.clear()
+    _verificados[clave] = ahora
+    return True
+
+
+def registrar_uso(dataset_id):
+    """Anota el uso del dataset por la sesión de la petición en curso."""
+    sesion = sesion_actual()
+    if sesion is not None and dataset_id is not None:
+        gestor.usar(sesion, dataset_id)
+
+
+def _texto_prometheus():
+    informe = gestor.informe()
+    lineas = [
+        "# HELP dashboard_memoria_bytes Memoria usada por cada caché del servidor.",
+        "# TYPE dashboard_memoria_bytes gauge",
+    ]
+    lineas += [f'dashboard_memoria_bytes{{cache="{n}"}} {b}' for n, b in sorted(informe["caches"].items())]
+    lineas += [
+        "# HELP dashboard_memoria_presupuesto_bytes Presupuesto de memoria de las sesiones.",
+        "# TYPE dashboard_memoria_presupuesto_bytes gauge",
+        f"dashboard_memoria_presupuesto_bytes {informe['presupuesto_bytes']}",
+        "# HELP dashboard_sesiones Sesiones conocidas por estado.",
+        "# TYPE dashboard_sesiones gauge",
+        f'dashboard_sesiones{{estado="en_memoria"}} {sum(s["en_memoria"] for s in informe["sesiones"])}',
+        f'dashboard_sesiones{{estado="en_disco"}} {sum(not s["en_memoria"] for s in informe["sesiones"])}',
+        "# HELP dashboard_sesiones_desalojos_total Veces que se han sacado de memoria los datos de una sesión.",
+        "# TYPE dashboard_sesiones_desalojos_total counter",
+        f"dashboard_sesiones_desalojos_total {gestor.desalojos}",
+    ]
+    return "\n".join(lineas) + "\n"
+
+
+def registrar_sesiones(server):
+    """
+    Asigna una cookie de sesión a cada navegador, aplica el presupuesto de
+    memoria tras cada callback y expone GET /sesiones con el informe (el de
+    la propia sesión, o el de todas con SESIONES_TOKEN).
+    """
+
+    @server.before_request
+    def asignar_sesion():
+        g.sesion = request.cookies.get(COOKIE_SESION) or uuid.uuid4().hex
+
+    @server.after_request
+    def guardar_sesion(respuesta):
+        if request.cookies.get(COOKIE_SESION) != g.get("sesion"):
+            respuesta.set_cookie(COOKIE_SESION, g.sesion, httponly=True, samesite="Lax")
+        if request.path.endswith("_dash-update-component"):
+            gestor.aplicar_presupuesto(g.get("sesion"))
+        return respuesta
+
+    @server.route("/sesiones")
+    def informe_sesiones():
+        # Todas las sesiones solo con el token; si no, la del propio navegador
+        if TOKEN_SESIONES and request.headers.get("Authorization") == f"Bearer {TOKEN_SESIONES}":
+            return gestor.informe()
+        return gestor.informe(g.sesion)
+
+    registrar_colector(_texto_prometheus)
@@ -0,0 +1,125 @@
+# utils/subida.py
+# Ruta Flask para subir ficheros grandes sin pasar por dcc.Upload:
+# el navegador envía el fichero tal cual (sin base64) y el servidor lo
+# vuelca a disco por trozos y lo parsea por bloques, anotando las filas
+# leídas para que el navegador muestre el progreso del parseo.
+import hashlib
+import os
+import re
+import tempfile
+
+from flask import jsonify, request
+
+from utils.data_utils import dataset_ya_cargado, guardar_dataset, leer_archivo_por_bloques
+from utils.jobs import cache_jobs
+from utils.lotes import hojas_excel, leer_lote
+
+TAMANO_TROZO = 1024 * 1024   # 1 MB
+MAX_BYTES_SUBIDA = int(os.environ.get("SUBIDA_MAX_MB", 1024)) * 1024 ** 2
+EXTENSIONES = (".csv", ".xls", ".xlsx", ".zip")
+
+# Filas ya parseadas de cada subida en curso: las guarda el worker que
+# parsea y las consulta el navegador (puede atenderle otro worker)
+_ID_SUBIDA = re.compile(r"^[A-Za-z0-9]{1,40}$")
+_EXPIRACION_PROGRESO = 3600
+
+
+def mensaje_carga(df, filename):
+    """Mensaje de estado tras cargar un dataset (compartido con dcc.Upload)."""
+    filas = len(df)
+    columnas = list(df.columns)
+
+    rango_fechas = ""
+    if filas > 0:
+        rango_fechas = f" | Rango de fechas: {df['Date'].min().date()} – {df['Date'].max().date()}"
+
+    return f"Archivo '{filename}' cargado correctamente. Filas: {filas}. Columnas: {', '.join(columnas)}{rango_fechas}"
+
+
+def _volcar_a_disco(flujo, destino):
+    """
+    Copia el cuerpo de la petición a un fichero por trozos de 1 MB y
+    devuelve el hash de su contenido.
+    """
+    total = 0
+    h = hashlib.sha1()
+    while True:
+        trozo = flujo.read(TAMANO_TROZO)
+        if not trozo:
+            return h.hexdigest()[:20]
+        h.update(trozo)
+        total += len(trozo)
+        if total > MAX_BYTES_SUBIDA:
+            raise ValueError("El archivo supera el tamaño máximo permitido.")
+        destino.write(trozo)
+
+
+def _clave_progreso(id_subida):
+    return f"subida-progreso-{id_subida}"
+
+
+def _id_subida():
+    """ID de la subida que envía el navegador (?id=...), o None si no es válido."""
+    id_subida = request.args.get("id", "")
+    return id_subida if _ID_SUBIDA.match(id_subida) else None
+
+
+def registrar_ruta_subida(server):
+    """
+    Registra en el servidor Flask de la app:
+    - POST /subir?nombre=<fichero>&id=<subida>: sube y parsea el fichero.
+    - GET /subir/progreso?id=<subida>: filas parseadas hasta ahora.
+    """
+
+    @server.route("/subir/progreso")
+    def progreso_subida():
+        id_subida = _id_subida()
+        if id_subida is None:
+            return jsonify({"filas": None}), 400
+        return jsonify({"filas": cache_jobs.get(_clave_progreso(id_subida))})
+
+    @server.route("/subir", methods=["POST"])
+    def subir_archivo():
+        filename = os.path.basename(request.args.get("nombre", ""))
+        extension = os.path.splitext(filename)[1].lower()
+        if extension not in EXTENSIONES:
+            return jsonify({"mensaje": "Error al leer el archivo. Asegúrate de que es CSV, Excel o ZIP."}), 400
+
+        id_subida = _id_subida()
+        progreso = None
+        if id_subida is not None:
+            def progreso(filas):
+                cache_jobs.set(_clave_progreso(id_subida), filas, expire=_EXPIRACION_PROGRESO)
+
+        fd, ruta = tempfile.mkstemp(suffix=extension)
+        try:
+            with os.fdopen(fd, "wb") as destino:
+                origen = _volcar_a_disco(request.stream, destino)
+
+            # Archivo ya convertido antes: se reabre su copia columnar
+            dataset_id, df = dataset_ya_cargado(origen)
+            if df is not None:
+                return jsonify({"dataset": dataset_id, "nombre": filename, "mensaje": mensaje_carga(df, filename)})
+
+            if extension == ".zip" or (extension == ".xlsx" and len(hojas_excel(ruta, filename)) > 1):
+                # Lotes (zip o una hoja por cuenta): cada hoja en un proceso
+                df = leer_lote([(filename, ruta)], progreso=progreso)
+            else:
+                df = leer_archivo_por_bloques(ruta, filename, progreso=progreso)
+        except ValueError as e:
+            return jsonify({"mensaje": str(e)}), 413
+        finally:
+            os.remove(ruta)
+            if id_subida is not None:
+                cache_jobs.delete(_clave_progreso(id_subida))
+
+        if df is None:
+            return jsonify({
+                "mensaje": "Error al leer el archivo. Debe ser CSV, Excel o ZIP con al menos las columnas 'Date' y 'Amount'."
+            }), 400
+
+        return jsonify({
+            "dataset": guardar_dataset(df, origen=origen),
+            "nombre": filename,
+            "mensaje": mensaje_carga(df, filename),
+        })